@@ -0,0 +1,1661 @@
+"""
+bench_clawnbot.py - Offline benchmarks for clawnbot.
+
+Runs against a local fake Telegram Bot API, nothing leaves the machine.
+
+    python bench_clawnbot.py reminders --n 500
+    python bench_clawnbot.py term --duration 3
+    python bench_clawnbot.py parse --n 500
+    python bench_clawnbot.py liste --n 100000 --chats 1000
+    python bench_clawnbot.py context --n 100
+    python bench_clawnbot.py llm --workers 4
+    python bench_clawnbot.py history --n 200 --chats 1000
+    python bench_clawnbot.py webhook --n 500 --latency 0.05
+    python bench_clawnbot.py updates --chats 200 --concurrency 32
+    python bench_clawnbot.py bulk --n 500
+    python bench_clawnbot.py delivery --n 200
+    python bench_clawnbot.py catchup --n 5000
+    python bench_clawnbot.py metrics --n 200
+    python bench_clawnbot.py memory --n 365
+    python bench_clawnbot.py notion --n 300
+    python bench_clawnbot.py heartbeat --n 8 --duration 1
+    python bench_clawnbot.py logwatch --n 200
+    python bench_clawnbot.py jobsdb --n 100000
+    python bench_clawnbot.py load --chats 1000 --stored 100000
+    python bench_clawnbot.py burst --n 2000 --chats 1000
+    python bench_clawnbot.py suite --json results.json [--baseline old.json]
+
+load, burst and suite report throughput and latency percentiles; --json saves
+them and --baseline compares against a saved run, exiting 1 when a p99 or a
+throughput is worse by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import contextlib
+import urllib.parse
+from collections import deque
+from typing import Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+os.environ.setdefault("CLAWNBOT_TOKEN", "123456:BENCH")
+os.environ.pop("GOOGLE_API_KEY", None)
+
+# clawnbot keeps jobs.sqlite / CONTEXT.md relative to cwd; run in a scratch dir
+# so benchmarks never touch the real jobstore.
+sys.path.insert(0, HERE)
+os.chdir(tempfile.mkdtemp(prefix="clawnbot-bench-"))
+
+import clawnbot  # noqa: E402
+from telegram import Bot  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Swallows the bot's per-message prints while a scenario runs."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+class FakeTelegram:
+    """Minimal HTTP/1.1 Bot API stand-in with keep-alive and a simulated handshake cost."""
+
+    def __init__(self, latency: float = 0.005, handshake: float = 0.05,
+                 chat_limit: Optional[int] = None, global_limit: Optional[int] = None):
+        self.latency = latency
+        self.handshake = handshake  # paid once per new connection (TCP + TLS)
+        # sendMessage limits per rolling second; over them the call gets a 429 with retry_after
+        self.chat_limit = chat_limit
+        self.global_limit = global_limit
+        self.rejected = 0
+        self._sends = deque()
+        self.requests = 0
+        self.connections = 0
+        self.calls = {}
+        self._server = None
+        self._writers = set()
+        self._message_id = 0
+        self.updates = []  # served to getUpdates (polling mode)
+        self._update_id = 0
+        self._new_update = asyncio.Event()
+        self.on_call = None  # on_call(method, payload), e.g. to timestamp replies
+
+    @property
+    def base_url(self) -> str:
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self
+
+    async def stop(self):
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+
+    def over_limit(self, chat_id: int) -> bool:
+        if self.chat_limit is None and self.global_limit is None:
+            return False
+        now = time.monotonic()
+        while self._sends and now - self._sends[0][0] > 1.0:
+            self._sends.popleft()
+        if self.global_limit is not None and len(self._sends) >= self.global_limit:
+            return True
+        if self.chat_limit is not None and sum(1 for _, c in self._sends if c == chat_id) >= self.chat_limit:
+            return True
+        self._sends.append((now, chat_id))
+        return False
+
+    def push_update(self, update: dict):
+        self._update_id += 1
+        self.updates.append(dict(update, update_id=self._update_id))
+        self._new_update.set()
+
+    async def get_updates(self, payload: dict):
+        """Long poll: returns as soon as an update at or past `offset` is queued."""
+        offset = int(payload.get("offset") or 0)
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates:
+            self._new_update.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._new_update.wait(), min(float(payload.get("timeout") or 0), 1.0))
+        return self.updates[:100]
+
+    def result_for(self, method: str, payload: dict):
+        self._message_id += 1
+        if method in ("setWebhook", "deleteWebhook"):
+            return True
+        chat_id = int(payload.get("chat_id", 0) or 0)
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": payload.get("text", ""),
+        }
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        self._writers.add(writer)
+        await asyncio.sleep(self.handshake)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                method = request_line.split()[1].decode().rsplit("/", 1)[-1]
+                if body.startswith(b"{"):
+                    payload = json.loads(body)
+                elif headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+                    payload = {k: v[0] for k, v in urllib.parse.parse_qs(body.decode()).items()}
+                else:
+                    payload = {}
+
+                await asyncio.sleep(self.latency)
+                self.requests += 1
+                self.calls[method] = self.calls.get(method, 0) + 1
+                if method == "sendMessage" and self.over_limit(int(payload.get("chat_id", 0) or 0)):
+                    self.rejected += 1
+                    status = b"429 Too Many Requests"
+                    data = json.dumps({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                       "parameters": {"retry_after": 1}}).encode()
+                else:
+                    if self.on_call:
+                        self.on_call(method, payload)
+                    status = b"200 OK"
+                    result = await self.get_updates(payload) if method == "getUpdates" else self.result_for(method, payload)
+                    data = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(
+                    b"HTTP/1.1 " + status + b"\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(data)).encode() + b"\r\n\r\n" + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+class FakeNotion:
+    """Notion API stand-in: children appends, cursor-paginated search, a rolling
+    requests-per-second limit answered with 429 + Retry-After, and a handshake cost."""
+
+    def __init__(self, latency: float = 0.02, handshake: float = 0.05, limit: int = 5, pages: int = 0):
+        self.latency = latency
+        self.handshake = handshake
+        self.limit = limit  # requests per rolling second
+        self.pages = [{"object": "page", "id": f"page-{i}", "properties": {
+            "title": {"id": "title", "title": [{"plain_text": f"Sayfa {i}"}]}}} for i in range(pages)]
+        self.children = {}  # block id -> appended blocks
+        self.requests = 0
+        self.connections = 0
+        self.rejected = 0
+        self._times = deque()
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def handle(self, method: str, path: str, query: dict, body: dict):
+        parts = path.strip("/").split("/")[1:]  # drop "v1"
+        if parts[:1] == ["blocks"] and parts[2:] == ["children"]:
+            block_id = parts[1]
+            if method == "PATCH":
+                children = body.get("children", [])
+                if len(children) > 100:
+                    return 400, {"object": "error", "code": "validation_error",
+                                 "message": "body.children.length should be ≤ `100`"}
+                created = [dict(child, id=f"{block_id}-{len(self.children.get(block_id, [])) + i}")
+                           for i, child in enumerate(children)]
+                self.children.setdefault(block_id, []).extend(created)
+                return 200, {"object": "list", "results": created, "has_more": False, "next_cursor": None}
+            return 200, self.page_of(self.children.get(block_id, []), query.get("start_cursor"),
+                                     int(query.get("page_size", 100)))
+        if parts == ["search"] and method == "POST":
+            return 200, self.page_of(self.pages, body.get("start_cursor"), int(body.get("page_size", 100)))
+        return 404, {"object": "error", "code": "object_not_found", "message": path}
+
+    @staticmethod
+    def page_of(items, cursor, size):
+        start = int(cursor or 0)
+        end = start + min(size, 100)
+        more = end < len(items)
+        return {"object": "list", "results": items[start:end], "has_more": more,
+                "next_cursor": str(end) if more else None}
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        await asyncio.sleep(self.handshake)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                method, target = request_line.decode().split()[:2]
+                url = urllib.parse.urlsplit(target)
+                query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+                await asyncio.sleep(self.latency)
+                self.requests += 1
+                now = time.monotonic()
+                while self._times and now - self._times[0] > 1.0:
+                    self._times.popleft()
+                extra = b""
+                if len(self._times) >= self.limit:
+                    self.rejected += 1
+                    status, data = 429, {"object": "error", "code": "rate_limited", "message": "Rate limited"}
+                    extra = b"Retry-After: 1\r\n"
+                else:
+                    self._times.append(now)
+                    status, data = self.handle(method, url.path, query, json.loads(body) if body else {})
+                payload = json.dumps(data).encode()
+                writer.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n".encode() + extra
+                             + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+async def bench_reminders(args):
+    """Delivers N simultaneous reminders: per-job Bot (old) vs shared pooled bot (new)."""
+    fake = await FakeTelegram(latency=args.latency, handshake=args.handshake).start()
+
+    async def legacy_send(chat_id: int, message: str):
+        bot = Bot(token=clawnbot.TOKEN, base_url=fake.base_url)
+        await bot.send_message(chat_id=chat_id, text=f"⏰ HATIRLATMA: {message}")
+
+    async def run(label, send):
+        fake.requests = fake.connections = 0
+        t0 = time.perf_counter()
+        with quiet():
+            await asyncio.gather(*(send(1000 + i, f"bench {i}") for i in range(args.n)))
+        elapsed = time.perf_counter() - t0
+        print(f"{label:<8} n={args.n:<6} {elapsed:7.3f}s  {args.n / elapsed:9.1f} msg/s  "
+              f"connections={fake.connections}", flush=True)
+
+    await run("old", legacy_send)
+
+    clawnbot.reminder_bot = Bot(
+        token=clawnbot.TOKEN, base_url=fake.base_url, request=clawnbot.build_request(args.pool_size)
+    )
+    clawnbot.send_semaphore = asyncio.Semaphore(args.concurrency)
+    deliver = lambda chat_id, message: clawnbot.deliver_reminders(chat_id, [message])
+    await run("new", deliver)
+    await run("new/warm", deliver)
+    await fake.stop()
+
+
+async def bench_term(args):
+    """Reminder lag while a long /term command runs: blocking subprocess.run (old) vs CommandRunner (new)."""
+    import subprocess
+    from datetime import datetime, timedelta
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+    from command_runner import CommandRunner
+
+    fake = await FakeTelegram(latency=args.latency, handshake=0).start()
+    clawnbot.reminder_bot = Bot(token=clawnbot.TOKEN, base_url=fake.base_url, request=clawnbot.build_request())
+    command = f"sleep {args.duration}"
+
+    async def legacy(cmd):
+        subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30)
+
+    async def runner_based(cmd):
+        await CommandRunner().run(1, cmd)
+
+    async def run(label, execute):
+        lags = []
+        sched = AsyncIOScheduler(timezone="Europe/Istanbul")
+        sched.add_listener(
+            lambda ev: lags.append((datetime.now(ev.scheduled_run_time.tzinfo) - ev.scheduled_run_time).total_seconds()),
+            EVENT_JOB_EXECUTED | EVENT_JOB_ERROR,
+        )
+        sched.start()
+        now = datetime.now(sched.timezone)
+        for i in range(5):
+            run_at = now + timedelta(seconds=0.5 + i * args.duration / 5)
+            sched.add_job(clawnbot.send_reminder, "date", run_date=run_at, args=[1, f"r{i}"], misfire_grace_time=None)
+        await asyncio.sleep(0.1)
+        with quiet():
+            await execute(command)
+            await asyncio.sleep(1)
+        sched.shutdown(wait=False)
+        print(f"{label:<4} command={command!r}  reminders={len(lags)}  "
+              f"max lag={max(lags, default=0):.3f}s  mean lag={sum(lags) / max(len(lags), 1):.3f}s", flush=True)
+
+    await run("old", legacy)
+    await run("new", runner_based)
+    await fake.stop()
+
+
+# Real /hatirlat phrasings (time first, message after)
+REMINDER_CORPUS = [
+    "10 dakika sonra Fırını kapat",
+    "yarın 14:00 Toplantı var",
+    "1 saat sonra screener loglarına bak",
+    "30 dk sonra webhook restart kontrol",
+    "yarın saat 9'da hesap 5 PnL raporu",
+    "bugün 18:30 backtest sonuçlarını Sheets'e yaz",
+    "pazartesi 09:00 haftalık IP ban kontrolü",
+    "akşam 8 annemi ara",
+    "2 saat 15 dakika sonra mega batch bitti mi bak",
+    "14:00'te ZKP EMA filtresini gözden geçir",
+    "in 45 minutes deploy binance-monitor",
+    "tomorrow 10:00 call with the team",
+    "15 Kasım 2026 doğum günü hediyesi al",
+    "3 gün sonra fatura öde",
+    "cuma günü 17:00 haftalık özet",
+    "gece 2'de sunucu yedeğini kontrol et",
+    "gece 12'de günlük rapor",
+    "next friday 10am meeting",
+    "yarın 3 pm dişçi",
+    "yarın sabah müşteri toplantısı",
+    "2 gün sonra saat 10 kira öde",
+]
+
+
+def legacy_parse(words):
+    """The pre-time_parser /hatirlat path: 2n+1 dateparser calls per reminder.
+
+    The original passed settings={'To': ...}, which current dateparser rejects;
+    TO_TIMEZONE keeps the cost comparable.
+    """
+    import dateparser
+    from dateparser.search import search_dates
+    from datetime import datetime
+    for i in range(1, len(words) + 1):
+        dateparser.parse(" ".join(words[:i]), settings={'PREFER_DATES_FROM': 'future', 'TO_TIMEZONE': 'Europe/Istanbul'})
+    for i in range(len(words), 0, -1):
+        dt = dateparser.parse(" ".join(words[:i]), settings={'PREFER_DATES_FROM': 'future'})
+        if dt and dt > datetime.now():
+            break
+    return search_dates(" ".join(words), languages=['tr', 'en'], settings={'PREFER_DATES_FROM': 'future'})
+
+
+async def bench_parse(args):
+    """Micro-benchmark of /hatirlat time parsing over REMINDER_CORPUS."""
+    from time_parser import parse_reminder, parse_dateparser
+
+    # Warm both paths so language data loading isn't counted
+    legacy_parse(REMINDER_CORPUS[0].split())
+    parse_dateparser(REMINDER_CORPUS[0])
+
+    def run(label, fn, rounds):
+        timings = []
+        for _ in range(rounds):
+            for text in REMINDER_CORPUS:
+                t0 = time.perf_counter()
+                fn(text)
+                timings.append(time.perf_counter() - t0)
+        timings.sort()
+        print(f"{label:<8} phrases={len(timings):<6} mean={1000 * sum(timings) / len(timings):8.3f}ms  "
+              f"p50={1000 * percentile(timings, 50):8.3f}ms  p99={1000 * percentile(timings, 99):8.3f}ms", flush=True)
+
+    run("old", lambda text: legacy_parse(text.split()), max(1, args.n // 100))
+    run("new", parse_reminder, max(1, args.n // 10))
+    sources = {}
+    for text in REMINDER_CORPUS:
+        parsed = parse_reminder(text)
+        sources[parsed.source if parsed else None] = sources.get(parsed.source if parsed else None, 0) + 1
+    print(f"new path hits: {sources}", flush=True)
+
+
+def seed_jobstore(store, index, n_jobs: int, n_chats: int, start=None, spread: float = 30 * 86400):
+    """Bulk-writes n_jobs pickled reminder jobs (and their index rows) across n_chats,
+    due between `start` (default: tomorrow) and `spread` seconds later."""
+    import pickle
+    import random
+    from datetime import datetime, timedelta
+    from apscheduler.triggers.date import DateTrigger
+    from apscheduler.util import datetime_to_utc_timestamp
+
+    template = store._scheduler.add_job(
+        clawnbot.send_reminder, DateTrigger(run_date=datetime.now(clawnbot.TIMEZONE) + timedelta(days=1)),
+        args=[1, "template"], name="1", id="template",
+    )
+    state = store.lookup_job(template.id).__getstate__()
+    store.remove_job(template.id)
+
+    rng = random.Random(42)
+    base = start or datetime.now(clawnbot.TIMEZONE) + timedelta(days=1)
+    rows, index_rows = [], []
+    for i in range(n_jobs):
+        chat_id = 1000 + rng.randrange(n_chats)
+        run_at = base + timedelta(seconds=rng.randrange(int(spread)))
+        message = f"hatırlatma {i}: screener loglarını kontrol et"
+        job_state = dict(state, id=f"job{i:07d}", args=(chat_id, message), name=str(chat_id),
+                         trigger=DateTrigger(run_date=run_at), next_run_time=run_at)
+        rows.append({"id": job_state["id"], "next_run_time": datetime_to_utc_timestamp(run_at),
+                     "job_state": pickle.dumps(job_state, store.pickle_protocol)})
+        index_rows.append((job_state["id"], chat_id, run_at, message))
+    with store.engine.begin() as connection:
+        connection.execute(store.jobs_t.insert(), rows)
+    if index is not None:
+        index.add_many(index_rows)
+    return sorted({r[1] for r in index_rows})
+
+
+async def bench_liste(args):
+    """/liste lookup with N stored jobs: scheduler.get_jobs() scan (old) vs reminder index (new)."""
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    from reminder_index import ReminderIndex
+
+    scheduler = AsyncIOScheduler(timezone="Europe/Istanbul")
+    store = SQLAlchemyJobStore(url="sqlite:///bench_jobs.sqlite")
+    scheduler.add_jobstore(store, "default")
+    scheduler.start(paused=True)
+    index = ReminderIndex("bench_jobs.sqlite")
+
+    t0 = time.perf_counter()
+    chats = seed_jobstore(store, index, args.n, args.chats)
+    print(f"seeded {args.n} jobs over {len(chats)} chats in {time.perf_counter() - t0:.1f}s "
+          f"({os.path.getsize('bench_jobs.sqlite') / 1e6:.1f} MB)", flush=True)
+
+    probe = chats[:: max(1, len(chats) // 5)][:5]
+
+    def run(label, lookup, rounds):
+        timings = []
+        for _ in range(rounds):
+            for chat_id in probe:
+                t = time.perf_counter()
+                found = lookup(chat_id)
+                timings.append(time.perf_counter() - t)
+        timings.sort()
+        print(f"{label:<4} lookups={len(timings):<4} rows/chat≈{found:<5} mean={1000 * sum(timings) / len(timings):9.2f}ms  "
+              f"p99={1000 * percentile(timings, 99):9.2f}ms", flush=True)
+
+    run("old", lambda chat_id: len([j for j in scheduler.get_jobs() if j.name == str(chat_id)]), 1)
+    run("new", lambda chat_id: len(index.page(chat_id, 1, clawnbot.LIST_PAGE_SIZE)[0]), 50)
+    scheduler.shutdown(wait=False)
+
+
+async def bench_context(args):
+    """Prompt tokens per chat turn: CONTEXT.md inlined every turn (old) vs cached context (new)."""
+    import shutil
+    from llm import ContextCache, FakeBackend
+
+    shutil.copy(os.path.join(HERE, "CONTEXT.md"), "CONTEXT.md")
+    with open("CONTEXT.md") as f:
+        system_context = f.read()
+    questions = ["screener çalışıyor mu?", "webhook portu açık mı?", "son backtest ne durumda?"]
+
+    legacy = FakeBackend(cache=False)
+    handle = legacy.create_context("", 0)
+    for i in range(args.n):
+        user_msg = questions[i % len(questions)]
+        legacy.generate(handle, f"{system_context}\n\nUSER MESSAGE: {user_msg}\n\nRESPONSE (In Turkish, helpful, concise):")
+
+    backend = FakeBackend()
+    cache = ContextCache(backend, "CONTEXT.md", ttl=3600, check_interval=0)
+    for i in range(args.n):
+        user_msg = questions[i % len(questions)]
+        if i == args.n // 2:
+            with open("CONTEXT.md", "a") as f:
+                f.write("\n- Bench: CONTEXT.md edited mid-run\n")
+        cache.generate(f"USER MESSAGE: {user_msg}\n\nRESPONSE (In Turkish, helpful, concise):")
+
+    print(f"old  turns={args.n}  fresh prompt tokens={legacy.prompt_tokens:<8} per turn={legacy.prompt_tokens / args.n:.0f}", flush=True)
+    print(f"new  turns={args.n}  fresh prompt tokens={backend.prompt_tokens:<8} per turn={backend.prompt_tokens / args.n:.0f}  "
+          f"cached={backend.cached_tokens}  uploads={backend.uploads}  hits={cache.hits} misses={cache.misses}", flush=True)
+
+
+async def bench_llm(args):
+    """Message burst against a fake model: shared FIFO executor (old) vs LLMPool (new)."""
+    from concurrent.futures import ThreadPoolExecutor
+    from llm import FakeBackend, LLMPool, prompt_key
+
+    backend = FakeBackend(delay=args.latency_llm)
+    handle = backend.create_context("", 0)
+    # one chatty chat with 40 distinct questions, then 5 other chats, then 10 chats asking the same thing
+    burst = [(1, f"soru {i}") for i in range(40)]
+    burst += [(100 + i, f"başka kullanıcı {i}") for i in range(5)]
+    burst += [(200 + i, "screener çalışıyor mu?") for i in range(10)]
+
+    async def run(label, call):
+        backend.calls = 0
+        latencies = {}
+
+        async def one(chat_id, prompt):
+            t = time.perf_counter()
+            await call(chat_id, prompt)
+            latencies.setdefault("chatty" if chat_id == 1 else "others", []).append(time.perf_counter() - t)
+
+        await asyncio.gather(*(one(c, p) for c, p in burst))
+        others = sorted(latencies["others"])
+        print(f"{label:<4} model calls={backend.calls:<3} others p50={percentile(others, 50):.2f}s "
+              f"p99={percentile(others, 99):.2f}s  chatty max={max(latencies['chatty']):.2f}s", flush=True)
+
+    fifo = ThreadPoolExecutor(max_workers=args.workers)
+    loop = asyncio.get_running_loop()
+    await run("old", lambda chat_id, prompt: loop.run_in_executor(fifo, backend.generate, handle, prompt))
+
+    pool = LLMPool(workers=args.workers, max_queued=1000)
+    await run("new", lambda chat_id, prompt: pool.run(
+        chat_id, lambda: backend.generate(handle, prompt), key=prompt_key(prompt)))
+    print(f"pool stats: {pool.stats()}", flush=True)
+
+
+async def bench_history(args):
+    """Prompt size of a long chat (full transcript vs budgeted history) and store size with many chats."""
+    from conversation_store import ConversationStore
+
+    store = ConversationStore("bench_conversations.sqlite", budget_tokens=clawnbot.HISTORY_TOKENS,
+                              summary_tokens=clawnbot.SUMMARY_TOKENS, max_chats=args.chats // 2)
+    transcript = []
+    sizes = []
+    t0 = time.perf_counter()
+    for i in range(args.n):
+        user_msg = f"soru {i}: screener {i % 7} numaralı sembolde neden sinyal vermedi, loglara bakar mısın?"
+        reply = f"cevap {i}: " + "log satırlarına göre filtre eşiği aşılmadı, hacim düşük kaldı. " * 3
+        history = store.render(1)
+        sizes.append(len(f"{history}\n\nUSER MESSAGE: {user_msg}") // 4)
+        transcript += [user_msg, reply]
+        store.append(1, "user", user_msg)
+        store.append(1, "assistant", reply)
+        store.fold(1)  # extractive summary, no model needed
+    per_turn = (time.perf_counter() - t0) / args.n
+    full = sum(len(t) for t in transcript) // 4
+    print(f"old  turns={args.n}  prompt tokens at last turn={full} (full transcript, unbounded)", flush=True)
+    print(f"new  turns={args.n}  prompt tokens at last turn={sizes[-1]}  max={max(sizes)}  "
+          f"budget={clawnbot.HISTORY_TOKENS}  store+render per turn={per_turn * 1000:.2f}ms", flush=True)
+
+    for chat_id in range(2, args.chats + 2):
+        store.append(chat_id, "user", "merhaba")
+        store.append(chat_id, "assistant", "merhaba, nasıl yardımcı olabilirim?")
+    t = time.perf_counter()
+    removed = store.prune()
+    chats = store.conn.execute("SELECT COUNT(DISTINCT chat_id) FROM chat_turns").fetchone()[0]
+    print(f"prune chats={args.chats + 1} evicted={removed} kept={chats} cached={len(store._cache)} "
+          f"in {(time.perf_counter() - t) * 1000:.0f}ms", flush=True)
+
+
+def command_update(chat_id: int, text: str) -> dict:
+    """Synthetic Telegram update carrying a bot command."""
+    command = text.split()[0]
+    return {
+        "message": {
+            "message_id": chat_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        }
+    }
+
+
+async def bench_webhook(args):
+    """End-to-end /start latency (update sent -> reply received): polling vs webhook."""
+    import socket
+    import httpx
+
+    fake = await FakeTelegram(latency=args.latency, handshake=args.handshake).start()
+    sent_at, latencies = {}, []
+
+    def on_call(method, payload):
+        chat_id = int(payload.get("chat_id", 0) or 0)
+        if method == "sendMessage" and chat_id in sent_at:
+            latencies.append(time.perf_counter() - sent_at.pop(chat_id))
+
+    fake.on_call = on_call
+
+    async def run(label, start_updater, deliver):
+        latencies.clear()
+        app = clawnbot.build_application(base_url=fake.base_url)
+        app.post_init = None  # no scheduler/warm-up, /start needs neither
+        with quiet():
+            await app.initialize()
+            await start_updater(app)
+            await app.start()
+            t0 = time.perf_counter()
+            for i in range(args.n):
+                chat_id = 10_000 + i
+                sent_at[chat_id] = time.perf_counter()
+                await deliver(command_update(chat_id, "/start"))
+                await asyncio.sleep(args.interval)
+            while len(latencies) < args.n and time.perf_counter() - t0 < 60:
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - t0
+            await app.updater.stop()
+            await app.stop()
+            await app.shutdown()
+        values = sorted(latencies)
+        print(f"{label:<8} updates={len(values):<5} p50={percentile(values, 50) * 1000:7.1f}ms  "
+              f"p99={percentile(values, 99) * 1000:7.1f}ms  {len(values) / elapsed:7.1f} upd/s", flush=True)
+
+    async def start_polling(app):
+        await app.updater.start_polling(poll_interval=0, timeout=10)
+
+    async def push(update):
+        fake.push_update(update)
+
+    await run("polling", start_polling, push)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    secret = "bench-secret"
+    url = f"http://127.0.0.1:{port}/telegram"
+    client = httpx.AsyncClient(limits=httpx.Limits(max_connections=args.pool_size))
+    update_id = iter(range(1, 10 ** 9))
+
+    async def start_webhook(app):
+        await app.updater.start_webhook(listen="127.0.0.1", port=port, url_path="telegram", webhook_url=url,
+                                        secret_token=secret, max_connections=args.pool_size)
+
+    async def post(update):
+        # Telegram pushes each update with the secret header; fire and forget like its delivery queue
+        asyncio.ensure_future(client.post(url, json=dict(update, update_id=next(update_id)),
+                                          headers={"X-Telegram-Bot-Api-Secret-Token": secret}))
+
+    await run("webhook", start_webhook, post)
+
+    app = clawnbot.build_application(base_url=fake.base_url)
+    app.post_init = None
+    with quiet():
+        await app.initialize()
+        await start_webhook(app)
+        response = await client.post(url, json=dict(command_update(1, "/start"), update_id=1),
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+        await app.updater.stop()
+        await app.shutdown()
+    print(f"wrong secret token -> HTTP {response.status_code}", flush=True)
+    await client.aclose()
+    await fake.stop()
+
+
+def text_update(chat_id: int, text: str) -> dict:
+    """Synthetic Telegram update carrying a plain text message (AI chat)."""
+    update = command_update(chat_id, text)
+    del update["message"]["entities"]
+    return update
+
+
+def reply_kind(text: str) -> str:
+    if text.startswith("Merhaba!"):
+        return "start"
+    if text.startswith("✅ Hatırlatma"):
+        return "hatirlat"
+    if text.startswith(("📋", "📭")):
+        return "liste"
+    return "ai"
+
+
+async def bench_updates(args):
+    """Mixed load over many chats: handler latency and per-chat ordering for three update processors."""
+    import random
+    import shutil
+    from telegram.ext import SimpleUpdateProcessor
+    from llm import ContextCache, FakeBackend
+    from update_processor import ChatOrderedProcessor
+
+    fake = await FakeTelegram(latency=args.latency, handshake=args.handshake).start()
+    with quiet():
+        await asyncio.to_thread(__import__, "apscheduler.jobstores.sqlalchemy")
+        clawnbot.start_scheduler()
+    shutil.copy(os.path.join(HERE, "CONTEXT.md"), "CONTEXT.md")
+    clawnbot.llm = ContextCache(FakeBackend(delay=args.latency_llm), "CONTEXT.md")
+    clawnbot.llm_pool = clawnbot.LLMPool(workers=args.workers, max_queued=100_000)
+    clawnbot.STREAM_EDIT_INTERVAL = 0.5
+
+    # A quarter of the chats talk to the AI, the rest use quick commands; each chat's
+    # updates keep their order but are interleaved randomly with other chats'
+    rng = random.Random(7)
+    scripts = []
+    for chat_id in range(20_000, 20_000 + args.chats):
+        if chat_id % 4 == 0:
+            script = [("ai", "screener neden sinyal vermedi?"), ("liste", "/liste"), ("ai", "peki hacim?")]
+        else:
+            script = [("hatirlat", "/hatirlat 10 dakika sonra bench"), ("liste", "/liste"), ("start", "/start")]
+        scripts.append((chat_id, script))
+    stream = []
+    cursors = {chat_id: 0 for chat_id, _ in scripts}
+    pending_chats = [c for c, _ in scripts]
+    script_of = dict(scripts)
+    while pending_chats:
+        chat_id = rng.choice(pending_chats)
+        stream.append((chat_id,) + script_of[chat_id][cursors[chat_id]])
+        cursors[chat_id] += 1
+        if cursors[chat_id] == len(script_of[chat_id]):
+            pending_chats.remove(chat_id)
+
+    expected = {}  # chat_id -> [(kind, sent_at)] in send order
+    latencies = {}
+    disorder = [0]
+
+    def on_call(method, payload):
+        if method != "sendMessage":
+            return
+        chat_id = int(payload.get("chat_id", 0) or 0)
+        queue = expected.get(chat_id)
+        kind = reply_kind(payload.get("text", ""))
+        if not queue or payload.get("text", "").startswith("⏳"):
+            return
+        for i, (want, sent) in enumerate(queue):
+            if want == kind:
+                if i:
+                    disorder[0] += 1
+                latencies.setdefault("ai" if kind == "ai" else "commands", []).append(time.perf_counter() - sent)
+                del queue[i]
+                return
+
+    fake.on_call = on_call
+
+    async def run(label, concurrent_updates):
+        latencies.clear()
+        disorder[0] = 0
+        app = clawnbot.build_application(base_url=fake.base_url, concurrent_updates=concurrent_updates)
+        app.post_init = None
+        with quiet():
+            await app.initialize()
+            await app.updater.start_polling(poll_interval=0, timeout=10)
+            await app.start()
+            t0 = time.perf_counter()
+            for chat_id, kind, text in stream:
+                expected.setdefault(chat_id, []).append((kind, time.perf_counter()))
+                fake.push_update(text_update(chat_id, text) if kind == "ai" else command_update(chat_id, text))
+                await asyncio.sleep(args.interval)
+            while any(expected.values()) and time.perf_counter() - t0 < 120:
+                await asyncio.sleep(0.02)
+            await app.updater.stop()
+            await app.stop()
+            await app.shutdown()
+        expected.clear()
+        commands, ai = sorted(latencies.get("commands", [])), sorted(latencies.get("ai", []))
+        print(f"{label:<10} commands p50={percentile(commands, 50) * 1000:7.0f}ms p99={percentile(commands, 99) * 1000:7.0f}ms  "
+              f"ai p50={percentile(ai, 50) * 1000:6.0f}ms p99={percentile(ai, 99) * 1000:6.0f}ms  "
+              f"replies={len(commands) + len(ai)}/{len(stream)}  out-of-order={disorder[0]}", flush=True)
+
+    await run("sequential", False)
+    await run("simple", SimpleUpdateProcessor(args.concurrency))
+    await run("ordered", ChatOrderedProcessor(args.concurrency))
+    clawnbot.scheduler.shutdown(wait=False)
+    await fake.stop()
+
+
+async def bench_bulk(args):
+    """Importing N reminders: one add_job commit each (old) vs one batched transaction (new),
+    and N daily one-shots vs a single recurring job."""
+    from datetime import datetime, timedelta
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    from apscheduler.triggers.date import DateTrigger
+    from jobstore import BatchingJobStore
+    from time_parser import parse_reminder
+
+    base = datetime.now(clawnbot.TIMEZONE) + timedelta(days=1)
+
+    async def run(label, store, batch):
+        scheduler = AsyncIOScheduler(timezone="Europe/Istanbul")
+        scheduler.add_jobstore(store, "default")
+        scheduler.start()
+        t0 = time.perf_counter()
+        with batch(store):
+            for i in range(args.n):
+                scheduler.add_job(clawnbot.send_reminder, DateTrigger(run_date=base + timedelta(minutes=i)),
+                                  args=[1, f"toplu {i}"], name="1")
+        elapsed = time.perf_counter() - t0
+        print(f"{label:<4} n={args.n:<6} {elapsed * 1000:8.1f}ms  {args.n / elapsed:9.0f} jobs/s", flush=True)
+        scheduler.shutdown(wait=False)
+
+    await run("old", SQLAlchemyJobStore(url="sqlite:///bench_bulk_old.sqlite"), lambda store: contextlib.nullcontext())
+    await run("new", BatchingJobStore(url="sqlite:///bench_bulk_new.sqlite"), lambda store: store.batch())
+
+    # "every day for a month" as 30 one-shot rows vs one cron row
+    now = datetime.now(clawnbot.TIMEZONE)
+    daily = parse_reminder("her gün 09:00 screener kontrol", now)
+    trigger = daily.trigger()
+    fire_times, previous = [], None
+    for _ in range(30):
+        previous = trigger.get_next_fire_time(previous, previous or now)
+        fire_times.append(previous)
+    print(f"daily check for 30 days: {len(fire_times)} one-shot jobs (old) vs 1 {daily.recurrence[0]} job (new), "
+          f"first={fire_times[0]:%d.%m %H:%M} last={fire_times[-1]:%d.%m %H:%M}", flush=True)
+
+
+async def bench_delivery(args):
+    """A burst of reminders due in the same second against a rate-limited fake API:
+    direct send_message per job (old) vs the delivery queue (new), plus restart recovery."""
+    from delivery import DeliveryQueue
+    from telegram.error import NetworkError
+
+    fake = await FakeTelegram(latency=args.latency, handshake=0, chat_limit=1, global_limit=30).start()
+    clawnbot.reminder_bot = Bot(token=clawnbot.TOKEN, base_url=fake.base_url, request=clawnbot.build_request())
+    # args.n reminders: every 10th chat has 5 reminders due at once, the others 1
+    burst = []
+    chat_id = 30_000
+    while len(burst) < args.n:
+        for k in range(5 if chat_id % 10 == 0 else 1):
+            burst.append((chat_id, f"hatırlatma {len(burst)}"))
+        chat_id += 1
+    burst = burst[:args.n]
+
+    async def legacy_send(chat_id, message):
+        try:
+            await clawnbot.reminder_bot.send_message(chat_id=chat_id, text=f"⏰ HATIRLATMA: {message}")
+            return True
+        except Exception:
+            return False  # printed and dropped
+
+    fake.requests = fake.rejected = 0
+    t0 = time.perf_counter()
+    with quiet():
+        delivered = sum(await asyncio.gather(*(legacy_send(c, m) for c, m in burst)))
+    print(f"old  reminders={len(burst)} delivered={delivered} lost={len(burst) - delivered} "
+          f"429s={fake.rejected} messages={delivered} in {time.perf_counter() - t0:.2f}s", flush=True)
+
+    await asyncio.sleep(1.1)
+    fake.requests = fake.rejected = 0
+    queue = DeliveryQueue(clawnbot.deliver_reminders, "bench_deliveries.sqlite", global_rate=args.rate,
+                          chat_rate=1.0, concurrency=args.concurrency)
+    queue.start()
+    t0 = time.perf_counter()
+    with quiet():
+        for c, m in burst:
+            queue.enqueue(c, m)
+        while queue.pending or queue._in_flight:
+            await asyncio.sleep(0.01)
+    print(f"new  reminders={len(burst)} delivered={queue.sent_reminders} lost={queue.dropped} "
+          f"429s={fake.rejected} messages={queue.sent_messages} in {time.perf_counter() - t0:.2f}s", flush=True)
+    await queue.stop()
+
+    # Restart: reminders that fired while Telegram was unreachable survive in SQLite
+    async def unreachable(chat_id, messages):
+        raise NetworkError("bench: connection refused")
+
+    queue = DeliveryQueue(unreachable, "bench_restart.sqlite", max_attempts=100)
+    queue.start()
+    for c, m in burst[:50]:
+        queue.enqueue(c, m)
+    await asyncio.sleep(0.3)
+    await queue.stop()
+    restarted = DeliveryQueue(clawnbot.deliver_reminders, "bench_restart.sqlite")
+    restored = restarted.load()
+    restarted.start()
+    with quiet():
+        while restarted.pending or restarted._in_flight:
+            await asyncio.sleep(0.05)
+    await restarted.stop()
+    print(f"restart: 50 pending while offline, restored={restored} delivered={restarted.sent_reminders}", flush=True)
+    await fake.stop()
+
+
+async def bench_catchup(args):
+    """Restart after a 24h outage with N overdue one-shots and N/10 daily reminders:
+    APScheduler's default misfire handling (old) vs the paused-start catch-up (new)."""
+    from datetime import datetime, timedelta
+    from apscheduler.events import EVENT_JOB_MISSED
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.triggers.cron import CronTrigger
+    from catchup import catch_up
+    from jobstore import BatchingJobStore
+    from reminder_index import ReminderIndex
+
+    now = datetime.now(clawnbot.TIMEZONE)
+    down_since = now - timedelta(hours=24)
+    grace = 12 * 3600
+    n_daily = args.n // 10
+
+    def seed(path):
+        if os.path.exists(path):
+            os.remove(path)
+        scheduler = AsyncIOScheduler(timezone="Europe/Istanbul")
+        store = BatchingJobStore(url=f"sqlite:///{path}")
+        scheduler.add_jobstore(store, "default")
+        scheduler.start(paused=True)
+        index = ReminderIndex(path)
+        seed_jobstore(store, index, args.n, args.chats, start=down_since, spread=24 * 3600)
+        with store.batch():
+            for i in range(n_daily):
+                trigger = CronTrigger(hour=9, minute=i % 60, timezone=clawnbot.TIMEZONE)
+                scheduler.add_job(clawnbot.send_reminder, trigger, args=[5000 + i, f"günlük {i}"], name=str(5000 + i),
+                                  id=f"daily{i:05d}", next_run_time=trigger.get_next_fire_time(None, down_since))
+        return scheduler, store, index
+
+    # old: the scheduler starts straight away; jobs keep their pickled 1 s misfire grace
+    scheduler, store, index = seed("bench_catchup_old.sqlite")
+    scheduler.shutdown(wait=False)
+    sent = []
+    real_send = clawnbot.send_reminder
+    clawnbot.send_reminder = lambda chat_id, message: sent.append(chat_id)
+    missed = []
+    scheduler = AsyncIOScheduler(timezone="Europe/Istanbul")
+    scheduler.add_jobstore(BatchingJobStore(url="sqlite:///bench_catchup_old.sqlite"), "default")
+    scheduler.add_listener(lambda event: missed.append(event.job_id), EVENT_JOB_MISSED)
+    t0 = time.perf_counter()
+    with quiet():
+        scheduler.start()
+        while scheduler._jobstores["default"].get_due_jobs(datetime.now(clawnbot.TIMEZONE)):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - t0
+    scheduler.shutdown(wait=False)
+    clawnbot.send_reminder = real_send
+    print(f"old  overdue={args.n + n_daily:<6} delivered={len(sent):<6} silently skipped={len(missed):<6} "
+          f"in {elapsed * 1000:.0f}ms", flush=True)
+
+    # new: paused start, bulk catch-up into the delivery queue, then resume
+    scheduler, store, index = seed("bench_catchup_new.sqlite")
+    queued = []
+
+    def enqueue_many(items):
+        items = list(items)
+        queued.extend(items)
+        return len(items)
+
+    report = await catch_up(store, index, enqueue_many, now, grace, coalesce=True,
+                            is_reminder=lambda job: job.func_ref.endswith(":send_reminder"))
+    left = len(store.get_due_jobs(now))
+    print(f"new  overdue={report.overdue:<6} delivered={report.delivered:<6} skipped(>{grace // 3600}h)={report.skipped:<6} "
+          f"rescheduled={report.rescheduled} done={report.removed} still due={left} "
+          f"in {report.elapsed * 1000:.0f}ms", flush=True)
+    print(f"     chats notified={len({c for c, _, _ in queued})}  sample: {queued[0][1]}", flush=True)
+    scheduler.shutdown(wait=False)
+
+
+async def bench_metrics(args):
+    """Instrumentation cost per call, then real handlers driven through the fake API
+    with /metrics scraped over HTTP and the /stats reply printed."""
+    import shutil
+    import httpx
+    import metrics
+    from llm import ContextCache, FakeBackend
+
+    hist = metrics.Histogram("bench_seconds", "bench", ["handler"])
+    rounds = 200_000
+    t0 = time.perf_counter()
+    for i in range(rounds):
+        hist.observe(0.003, "hatirlat")
+    observe_ns = (time.perf_counter() - t0) / rounds * 1e9
+
+    async def handler(update, context):
+        return None
+
+    wrapped = clawnbot.instrumented("bench", handler)
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        await handler(None, None)
+    plain = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        await wrapped(None, None)
+    wrapper_ns = (time.perf_counter() - t0 - plain) / rounds * 1e9
+    clawnbot.HANDLER_SECONDS._series.pop(("bench",), None)
+    print(f"observe={observe_ns:.0f}ns/call  handler wrapper overhead={wrapper_ns:.0f}ns/update", flush=True)
+
+    fake = await FakeTelegram(latency=args.latency, handshake=0).start()
+    with quiet():
+        await asyncio.to_thread(__import__, "apscheduler.jobstores.sqlalchemy")
+        clawnbot.start_scheduler()
+    clawnbot.scheduler.resume()
+    shutil.copy(os.path.join(HERE, "CONTEXT.md"), "CONTEXT.md")
+    clawnbot.llm = ContextCache(FakeBackend(delay=args.latency_llm), "CONTEXT.md")
+    clawnbot.STREAM_EDIT_INTERVAL = 0.5
+    stats_reply = []
+    replies = [0]
+
+    def on_call(method, payload):
+        if method == "sendMessage":
+            replies[0] += 1
+            if payload.get("text", "").startswith("📊"):
+                stats_reply.append(payload["text"])
+
+    fake.on_call = on_call
+    app = clawnbot.build_application(base_url=fake.base_url)
+    app.post_init = None
+    with quiet():
+        await app.initialize()
+        await app.updater.start_polling(poll_interval=0, timeout=10)
+        await app.start()
+        server = await metrics.serve("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        scripts = ["/hatirlat 10 dakika sonra bench", "/hatirlat 1 Ocak 2099 12:00 uzak", "/liste", "/term echo ok"]
+        for i in range(args.n):
+            chat_id = 40_000 + i % args.chats
+            if i % 5 == 4:
+                fake.push_update(text_update(chat_id, "screener durumu?"))
+            else:
+                fake.push_update(command_update(chat_id, scripts[i % 4]))
+        clawnbot.scheduler.add_job(clawnbot.prune_conversations, "date", jobstore="memory")
+        t0 = time.perf_counter()
+        while replies[0] < args.n and time.perf_counter() - t0 < 60:
+            await asyncio.sleep(0.05)
+        fake.push_update(command_update(40_000, "/stats"))
+        while not stats_reply and time.perf_counter() - t0 < 70:
+            await asyncio.sleep(0.05)
+        async with httpx.AsyncClient() as client:
+            t0 = time.perf_counter()
+            response = await client.get(f"http://127.0.0.1:{port}/metrics")
+            scrape = time.perf_counter() - t0
+        server.close()
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+    series = [line for line in response.text.splitlines() if line and not line.startswith("#")]
+    print(f"/metrics: HTTP {response.status_code}, {len(series)} series, {len(response.content)} bytes "
+          f"in {scrape * 1000:.1f}ms", flush=True)
+    print(stats_reply[0] if stats_reply else "/stats: no reply", flush=True)
+    clawnbot.scheduler.shutdown(wait=False)
+    await fake.stop()
+
+
+async def bench_notion(args):
+    """N paragraphs to a page: one curl process per PATCH (old) vs the pooled client with batched
+    appends (new), then cursor-paginated search over 1000 pages."""
+    from notion_client import NotionClient, paragraph
+
+    fake = await FakeNotion(latency=args.latency, handshake=args.handshake, pages=1000).start()
+    paragraphs = [f"not {i}: screener hacim filtresi ve sinyal özeti" for i in range(args.n)]
+
+    t0 = time.perf_counter()
+    failed = 0
+    for text in paragraphs:
+        proc = await asyncio.create_subprocess_exec(
+            "curl", "-s", "-o", "/dev/null", "-w", "%{http_code}", "-X", "PATCH",
+            f"{fake.base_url}/blocks/old-page/children",
+            "-H", "Authorization: Bearer bench", "-H", "Notion-Version: 2025-09-03",
+            "-H", "Content-Type: application/json", "-d", json.dumps({"children": [paragraph(text)]}),
+            stdout=asyncio.subprocess.PIPE,
+        )
+        status, _ = await proc.communicate()
+        failed += status != b"200"
+    elapsed = time.perf_counter() - t0
+    print(f"old  paragraphs={args.n:<5} requests={fake.requests:<5} connections={fake.connections:<5} "
+          f"lost(429)={failed:<5} stored={len(fake.children.get('old-page', []))} in {elapsed:.2f}s", flush=True)
+
+    fake.requests = fake.connections = fake.rejected = 0
+    fake._times.clear()
+    t0 = time.perf_counter()
+    async with NotionClient("bench", base_url=fake.base_url) as notion:
+        created = await notion.append_paragraphs("new-page", paragraphs)
+        elapsed = time.perf_counter() - t0
+        order = [b["paragraph"]["rich_text"][0]["text"]["content"] for b in fake.children["new-page"]] == paragraphs
+        print(f"new  paragraphs={args.n:<5} requests={fake.requests:<5} connections={fake.connections:<5} "
+              f"429s={fake.rejected:<5} stored={len(created)} in_order={order} in {elapsed:.2f}s", flush=True)
+
+        fake.requests = 0
+        t0 = time.perf_counter()
+        found = [item async for item in notion.search()]
+        print(f"search: {len(found)} pages in {fake.requests} requests, {time.perf_counter() - t0:.2f}s "
+              f"(throttled to {notion.bucket.rate:.0f} req/s)", flush=True)
+    await fake.stop()
+
+
+async def bench_heartbeat(args):
+    """--n checks of --duration seconds each (one failing): one after another (old) vs
+    concurrently on the heartbeat runner (new); alerts per round and /status latency."""
+    import subprocess
+    from apscheduler.jobstores.memory import MemoryJobStore
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from heartbeat import Heartbeat, parse_heartbeat
+
+    lines = [f"- check {i}: `sleep {args.duration}` every 1m" for i in range(args.n - 1)]
+    lines.append(f"- broken: `sleep {args.duration}; exit 3` every 1m")
+    checks = parse_heartbeat("\n".join(lines))
+
+    t0 = time.perf_counter()
+    failing = sum(subprocess.run(c.command, shell=True).returncode != 0 for c in checks)
+    print(f"old  checks={len(checks):<3} failing={failing} one round in {time.perf_counter() - t0:.2f}s", flush=True)
+
+    alerts = []
+
+    async def alert(text):
+        alerts.append(text)
+
+    heartbeat = Heartbeat(alert, path=os.devnull, concurrency=max(4, args.n))
+    scheduler = AsyncIOScheduler(jobstores={"memory": MemoryJobStore()})
+    scheduler.start(paused=True)  # jobs are registered, rounds are driven by run_all()
+    heartbeat.schedule(scheduler, checks)
+    for round_ in range(3):
+        t0 = time.perf_counter()
+        results = await heartbeat.run_all()
+        failing = sum(not r.ok for r in results.values())
+        print(f"new  round {round_ + 1}: checks={len(results):<3} failing={failing} alerts={len(alerts)} "
+              f"in {time.perf_counter() - t0:.2f}s", flush=True)
+
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        heartbeat.status_text()
+    cached = (time.perf_counter() - t0) / 1000
+    t0 = time.perf_counter()
+    subprocess.run(checks[0].command, shell=True)
+    scheduler.shutdown(wait=False)
+    print(f"/status from cache {cached * 1e6:.0f}µs vs {time.perf_counter() - t0:.2f}s re-running one check",
+          flush=True)
+
+
+async def bench_logwatch(args):
+    """A screener log of --n thousand lines: whole-file read (old) vs the chunked follower (new),
+    then live appends with a rotation: `tail -n` per poll (old) vs offsets (new)."""
+    import re
+    import random
+    import subprocess
+    import tracemalloc
+    from log_watch import DEFAULT_PATTERNS, LogFollower, LogWatch
+
+    symbols = [f"COIN{i}USDT" for i in range(50)]
+
+    def log_line(i):
+        kind = random.choice(["PUMP", "DUMP"]) if i % 50 == 0 else "scan"
+        return f"2026-01-01 12:00:{i % 60:02d} INFO {kind} {random.choice(symbols)} %{random.uniform(1.5, 9):.2f}\n"
+
+    pump = [re.compile(rx) for rx in DEFAULT_PATTERNS.values()]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "binance-screener.log")
+        with open(path, "w") as f:
+            f.writelines(log_line(i) for i in range(args.n * 1000))
+        size = os.path.getsize(path)
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        with open(path, encoding="utf-8") as f:
+            hits = sum(any(rx.search(line) for rx in pump) for line in f.read().splitlines())
+        elapsed, peak = time.perf_counter() - t0, tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"old  whole file {size / 1e6:.1f} MB: {hits} matches in {elapsed:.2f}s, peak {peak / 1e6:.1f} MB",
+              flush=True)
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        follower = LogFollower(path, offset=0)
+        hits = sum(any(rx.search(line) for rx in pump) for line in follower.read_lines(max_bytes=size))
+        elapsed, peak = time.perf_counter() - t0, tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        follower.close()
+        print(f"new  follower   {size / 1e6:.1f} MB: {hits} matches in {elapsed:.2f}s, peak {peak / 1e6:.1f} MB",
+              flush=True)
+
+        # Live: 20 polls of 500 new lines, the log rotates after poll 10
+        os.remove(path)
+        open(path, "w").close()
+        sent = []
+
+        async def alert(text):
+            sent.append(text)
+
+        watch = LogWatch(alert, [path], path=os.path.join(tmp, "offsets.sqlite"), rate_per_minute=600, burst=20)
+        watch.poll()  # first run starts at the end of the file
+        written = old_alerts = old_spawn = 0
+        for poll in range(20):
+            if poll == 10:
+                os.rename(path, path + ".1")
+            with open(path, "a") as f:
+                f.writelines(log_line(written + i) for i in range(500))
+            written += 500
+            t0 = time.perf_counter()
+            out = subprocess.run(["tail", "-n", "200", path], capture_output=True, text=True).stdout
+            old_spawn += time.perf_counter() - t0
+            old_alerts += sum(any(rx.search(line) for rx in pump) for line in out.splitlines())
+            await watch.check()
+        expected = written // 50
+        stats = watch.stats()
+        print(f"old  tail -n 200 per poll: {old_alerts}/{expected} matches seen, "
+              f"{old_spawn / 20 * 1000:.1f} ms/poll", flush=True)
+        print(f"new  follower: {stats['matches']}/{expected} matches seen, {stats['duplicates']} deduplicated, "
+              f"{len(sent)} alert messages, rotations={stats['rotations']}", flush=True)
+        watch.close()
+
+
+async def bench_jobsdb(args):
+    """N stored reminders: pickled rows with the default journal (old) vs compact rows in
+    WAL mode (new, migrated by compact()); file size, full load, due-job scan and single adds."""
+    import shutil
+    from datetime import datetime, timedelta
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.util import obj_to_ref
+    from jobstore import BatchingJobStore
+
+    old_path, new_path = "bench_jobsdb_old.sqlite", "bench_jobsdb_new.sqlite"
+    for path in (old_path, new_path, new_path + "-wal", new_path + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def open_store(store):
+        scheduler = AsyncIOScheduler(timezone="Europe/Istanbul")
+        scheduler.add_jobstore(store, "default")
+        scheduler.start(paused=True)
+        return scheduler
+
+    def measure(label, scheduler, store, size):
+        t0 = time.perf_counter()
+        jobs = store.get_all_jobs()
+        load = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        due = store.get_due_jobs(datetime.now(clawnbot.TIMEZONE) + timedelta(days=2))
+        scan = time.perf_counter() - t0
+        run_at = datetime.now(clawnbot.TIMEZONE) + timedelta(days=60)
+        t0 = time.perf_counter()
+        for i in range(200):
+            scheduler.add_job(clawnbot.send_reminder, "date", run_date=run_at, args=[1, f"yeni {i}"],
+                              name="1", id=f"{label}-add{i}")
+        add = (time.perf_counter() - t0) / 200
+        print(f"{label:<4} jobs={len(jobs):<7} file={size / 1e6:6.1f} MB  load all {load:5.2f}s  "
+              f"due (2 days, {len(due)}) {scan * 1000:6.0f} ms  add_job {add * 1000:.2f} ms", flush=True)
+
+    store = SQLAlchemyJobStore(url=f"sqlite:///{old_path}")
+    scheduler = open_store(store)
+    t0 = time.perf_counter()
+    seed_jobstore(store, None, args.n, args.chats)
+    print(f"seeded {args.n} pickled reminders in {time.perf_counter() - t0:.1f}s", flush=True)
+    scheduler.shutdown(wait=False)
+    shutil.copyfile(old_path, new_path)
+
+    store = SQLAlchemyJobStore(url=f"sqlite:///{old_path}")
+    scheduler = open_store(store)
+    measure("old", scheduler, store, os.path.getsize(old_path))
+    scheduler.shutdown(wait=False)
+
+    store = BatchingJobStore(url=f"sqlite:///{new_path}", compact_func=obj_to_ref(clawnbot.send_reminder))
+    scheduler = open_store(store)
+    t0 = time.perf_counter()
+    report = store.compact()
+    print(f"compact(): {report['rewritten']} rows rewritten, {report['size_before'] / 1e6:.1f} MB -> "
+          f"{report['size_after'] / 1e6:.1f} MB in {time.perf_counter() - t0:.1f}s", flush=True)
+    measure("new", scheduler, store, store.file_size())
+    scheduler.shutdown(wait=False)
+
+
+async def bench_memory(args):
+    """MEMORY.md plus --n daily notes: prompt size with every note inlined (old) vs top-k
+    snippets (new); index build, incremental refresh and search latency."""
+    import random
+    import shutil
+    from llm import estimate_tokens
+    from memory_index import MemoryIndex
+
+    root = "memory_root"
+    os.makedirs(os.path.join(root, "memory"), exist_ok=True)
+    shutil.copy(os.path.join(HERE, "MEMORY.md"), os.path.join(root, "MEMORY.md"))
+    real_notes = sorted(os.listdir(os.path.join(HERE, "memory")))
+    topics = ["Binance IP ban", "screener sinyal", "DCA fill", "LaunchAgents", "Notion sayfası",
+              "testnet hesapları", "webhook gecikmesi", "log pump dump", "hacim filtresi", "stop loss"]
+    rng = random.Random(3)
+    for i in range(args.n):
+        if i < len(real_notes):
+            shutil.copy(os.path.join(HERE, "memory", real_notes[i]), os.path.join(root, "memory", real_notes[i]))
+            continue
+        topic = rng.choice(topics)
+        body = "\n\n".join(
+            f"## {rng.choice(topics).title()}\n- {topic} üzerinde çalışıldı, not {i}.{j}: "
+            + " ".join(rng.choice(topics) for _ in range(12))
+            for j in range(4)
+        )
+        with open(os.path.join(root, "memory", f"2025-{i:04d}.md"), "w") as f:
+            f.write(f"# Günlük {i}\n\n{body}\n")
+
+    inline = ""
+    for name in ["MEMORY.md"] + sorted(os.listdir(os.path.join(root, "memory"))):
+        with open(os.path.join(root, name if name == "MEMORY.md" else f"memory/{name}")) as f:
+            inline += f.read() + "\n"
+
+    index = MemoryIndex(root, "bench_memory.sqlite")
+    t0 = time.perf_counter()
+    updated, _ = index.refresh(force=True)
+    build = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    index.refresh(force=True)
+    unchanged = time.perf_counter() - t0
+    touched = os.path.join(root, "memory", sorted(os.listdir(os.path.join(root, "memory")))[-1])
+    with open(touched, "a") as f:
+        f.write("\n- yeni not: screener hacim filtresi güncellendi\n")
+    t0 = time.perf_counter()
+    changed, _ = index.refresh(force=True)
+    incremental = time.perf_counter() - t0
+    stats = index.stats()
+    print(f"index: {updated} files / {stats['chunks']} chunks built in {build * 1000:.0f}ms, "
+          f"refresh unchanged {unchanged * 1000:.1f}ms, {changed} touched {incremental * 1000:.1f}ms", flush=True)
+
+    queries = ["Binance hesabında IP ban neden oldu?", "screener sinyalleri neden gelmedi",
+               "LaunchAgents ayarları nerede", "DCA fill hatası ne olmuştu", "bugün hava nasıl"]
+    timings, sizes = [], []
+    t0 = time.perf_counter()
+    for i in range(args.n * 5):
+        t = time.perf_counter()
+        notes = index.context_for(queries[i % len(queries)])
+        timings.append(time.perf_counter() - t)
+        sizes.append(estimate_tokens(notes))
+    report("memory-search", timings, time.perf_counter() - t0)
+    print(f"prompt notes: old (all inlined) {estimate_tokens(inline)} tokens, "
+          f"new (top-3) mean {sum(sizes) / len(sizes):.0f} / max {max(sizes)} tokens", flush=True)
+
+
+class ReplyWaiter:
+    """Tracks sendMessage calls per chat so a caller can await a handler's reply.
+    Queue notices ("⏳ ... sıradasın") are progress, not replies, and aren't counted."""
+
+    def __init__(self):
+        self.texts = {}  # chat_id -> texts sent so far
+        self.sent_at = {}  # chat_id -> perf_counter() of each send
+        self._waiters = {}  # chat_id -> (count, future)
+
+    def on_call(self, method, payload):
+        if method != "sendMessage":
+            return
+        chat_id = int(payload.get("chat_id", 0) or 0)
+        if payload.get("text", "").startswith("⏳"):
+            return
+        self.texts.setdefault(chat_id, []).append(payload.get("text", ""))
+        self.sent_at.setdefault(chat_id, []).append(time.perf_counter())
+        waiter = self._waiters.get(chat_id)
+        if waiter and len(self.texts[chat_id]) >= waiter[0] and not waiter[1].done():
+            waiter[1].set_result(None)
+
+    def count(self, chat_id: int) -> int:
+        return len(self.texts.get(chat_id, ()))
+
+    async def wait(self, chat_id: int, count: int, timeout: float = 60):
+        """Until chat_id has received `count` messages in total."""
+        if self.count(chat_id) >= count:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = (count, future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        finally:
+            self._waiters.pop(chat_id, None)
+
+
+RESULTS = {}
+
+
+def report(name: str, latencies, elapsed: float, **extra):
+    """Prints one result line (count, throughput, percentiles) and keeps it for --json/--baseline."""
+    values = sorted(latencies)
+    result = {
+        "n": len(values),
+        "throughput": len(values) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000,
+    }
+    result.update(extra)
+    RESULTS[name] = result
+    more = "".join(f"  {k}={v}" for k, v in extra.items())
+    print(f"{name:<16} n={result['n']:<7} {result['throughput']:9.1f}/s  p50={result['p50_ms']:8.1f}ms  "
+          f"p95={result['p95_ms']:8.1f}ms  p99={result['p99_ms']:8.1f}ms  max={result['max_ms']:8.1f}ms{more}", flush=True)
+
+
+def compare(baseline: dict, results: dict, tolerance: float) -> list:
+    """Regressions of `results` against `baseline`: slower p99 or lower throughput beyond tolerance."""
+    regressions = []
+    for name, old in baseline.items():
+        new = results.get(name)
+        if new is None:
+            continue
+        # 1 ms floor: sub-millisecond percentiles are noise on a shared machine
+        if new["p99_ms"] > old["p99_ms"] * (1 + tolerance) and new["p99_ms"] - old["p99_ms"] > 1.0:
+            regressions.append(f"{name}: p99 {old['p99_ms']:.1f}ms -> {new['p99_ms']:.1f}ms")
+        if new["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {old['throughput']:.1f}/s -> {new['throughput']:.1f}/s")
+    return regressions
+
+
+async def start_bot(fake, label: str, stored: int = 0, chats: int = 1000, workers: int = 4):
+    """The real application wired to the fake API and fake model, scheduler and delivery queue
+    started the way warm_up() does it (with `stored` reminders already in jobs.sqlite)."""
+    import shutil
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from jobstore import BatchingJobStore
+    from llm import ContextCache, FakeBackend
+    from reminder_index import ReminderIndex
+
+    if stored:
+        scheduler = AsyncIOScheduler(timezone="Europe/Istanbul")
+        store = BatchingJobStore(url=clawnbot.DB_FILE)
+        scheduler.add_jobstore(store, "default")
+        scheduler.start(paused=True)
+        t0 = time.perf_counter()
+        seed_jobstore(store, ReminderIndex(clawnbot.DB_PATH), stored, chats)
+        scheduler.shutdown(wait=False)
+        print(f"seeded {stored} reminders over {chats} chats in {time.perf_counter() - t0:.1f}s "
+              f"({os.path.getsize(clawnbot.DB_PATH) / 1e6:.1f} MB)", flush=True)
+
+    shutil.copy(os.path.join(HERE, "CONTEXT.md"), "CONTEXT.md")
+    clawnbot.llm = ContextCache(FakeBackend(delay=0.05), "CONTEXT.md")
+    clawnbot.llm_pool = clawnbot.LLMPool(workers=workers, max_queued=100_000)
+    clawnbot.STREAM_EDIT_INTERVAL = 0.5
+    clawnbot.WARMUP = False
+    app = clawnbot.build_application(base_url=fake.base_url)
+    app.post_init = None
+    await app.initialize()
+    await app.start()  # no updater: updates are fed to process_update() directly
+    clawnbot.reminder_bot = app.bot
+    t0 = time.perf_counter()
+    with quiet():
+        await clawnbot.warm_up()
+    report(label, [time.perf_counter() - t0], 0.0, stored=stored)
+    return app
+
+
+_update_ids = iter(range(1, 1 << 62))
+
+
+def dispatch(app, update: dict):
+    """Runs the handlers for one synthetic update, the way the update processor would."""
+    from telegram import Update
+    return app.process_update(Update.de_json(dict(update, update_id=next(_update_ids)), app.bot))
+
+
+async def bench_load(args):
+    """--chats chats each run /hatirlat, /liste, /iptal, an AI message and /term through the real
+    handlers; latency is dispatch to the reply arriving at the fake API (for the AI: its first
+    streamed part, "ai-complete" is the whole handler including the paced edits)."""
+    fake = await FakeTelegram(latency=args.latency, handshake=0).start()
+    waiter = ReplyWaiter()
+    fake.on_call = waiter.on_call
+    app = await start_bot(fake, "startup", args.stored, args.chats, args.workers)
+    latencies = {}
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def step(kind: str, chat_id: int, update: dict, replies: int = 1):
+        expected = waiter.count(chat_id) + replies
+        t0 = time.perf_counter()
+        handled = asyncio.ensure_future(dispatch(app, update))
+        await waiter.wait(chat_id, expected)
+        latencies.setdefault(kind, []).append(time.perf_counter() - t0)
+        await handled  # the chat's next update waits for this one, as in ChatOrderedProcessor
+        if kind == "ai":
+            latencies.setdefault("ai-complete", []).append(time.perf_counter() - t0)
+        return waiter.texts[chat_id][-1]
+
+    async def session(chat_id: int):
+        async with slots:
+            reply = await step("/hatirlat", chat_id, command_update(chat_id, "/hatirlat yarın 14:00 bench toplantı"))
+            job_id = reply.rsplit("`", 2)[-2] if reply.count("`") >= 2 else "yok"
+            await step("/liste", chat_id, command_update(chat_id, "/liste"))
+            await step("/iptal", chat_id, command_update(chat_id, f"/iptal {job_id}"))
+            await step("ai", chat_id, text_update(chat_id, "screener neden sinyal vermedi?"))
+            if chat_id % 10 == 0:  # shell commands are the expensive part; one chat in ten
+                await step("/term", chat_id, command_update(chat_id, "/term echo ok"), replies=2)
+
+    chats = [1000 + i for i in range(args.chats)]  # the seeded reminders belong to these chats
+    t0 = time.perf_counter()
+    with quiet():
+        await asyncio.gather(*(session(chat_id) for chat_id in chats))
+        await asyncio.sleep(0.6)  # let the AI replies' final edits land
+    elapsed = time.perf_counter() - t0
+    for kind in ("/hatirlat", "/liste", "/iptal", "ai", "ai-complete", "/term"):
+        report(kind, latencies.get(kind, []), elapsed)
+    replies = [x for kind, values in latencies.items() if kind != "ai-complete" for x in values]
+    report("all", replies, elapsed, chats=args.chats)
+    with quiet():
+        await app.stop()
+        await app.shutdown()
+        await clawnbot.delivery_queue.stop()
+    clawnbot.scheduler.shutdown(wait=False)
+    await fake.stop()
+
+
+async def bench_burst(args):
+    """--n reminders across --chats chats all due in the same second, through the scheduler,
+    send_reminder, the delivery queue and a fake API enforcing Telegram's rate limits."""
+    from datetime import datetime, timedelta
+    from apscheduler.triggers.date import DateTrigger
+
+    fake = await FakeTelegram(latency=args.latency, handshake=0, chat_limit=1, global_limit=30).start()
+    waiter = ReplyWaiter()
+    fake.on_call = waiter.on_call
+    app = await start_bot(fake, "burst-startup")
+    due = datetime.now(clawnbot.TIMEZONE) + timedelta(seconds=2)
+    with clawnbot.job_store.batch():
+        for i in range(args.n):
+            chat_id = 60_000 + i % args.chats
+            clawnbot.scheduler.add_job(clawnbot.send_reminder, DateTrigger(run_date=due),
+                                       args=[chat_id, f"burst {i}"], name=str(chat_id))
+    due_at = time.perf_counter() + (due - datetime.now(clawnbot.TIMEZONE)).total_seconds()
+
+    def delivered() -> int:
+        total = 0
+        for texts in waiter.texts.values():
+            for text in texts:
+                total += text.count("\n•") if text.startswith("⏰ HATIRLATMA (") else 1
+        return total
+
+    with quiet():
+        while delivered() < args.n and time.perf_counter() - due_at < 120:
+            await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - due_at
+    lags = []
+    for chat_id, texts in waiter.texts.items():
+        for text, sent in zip(texts, waiter.sent_at[chat_id]):
+            merged = text.count("\n•") if text.startswith("⏰ HATIRLATMA (") else 1
+            lags += [sent - due_at] * merged
+    report("burst-delivery", lags, elapsed, messages=sum(len(t) for t in waiter.texts.values()),
+           rate_limited=fake.rejected)
+    lag = clawnbot.SCHEDULER_LAG_SECONDS
+    print(f"scheduler lag p50={format_ms(lag.quantile(0.5, 'default'))} p99={format_ms(lag.quantile(0.99, 'default'))} "
+          f"over {lag.count('default')} job(s)", flush=True)
+    with quiet():
+        await app.stop()
+        await app.shutdown()
+        await clawnbot.delivery_queue.stop()
+    clawnbot.scheduler.shutdown(wait=False)
+    await fake.stop()
+
+
+async def bench_suite(args):
+    """load (1k chats, 100k stored reminders) then burst, in fresh bot state each."""
+    import importlib
+    global clawnbot
+    stored, n = args.stored, args.n
+    args.stored = stored or 100_000
+    await bench_load(args)
+    clawnbot = importlib.reload(clawnbot)
+    os.remove(clawnbot.DB_PATH)
+    args.n = n if n != 200 else 2000
+    await bench_burst(args)
+    args.stored, args.n = stored, n
+
+
+def format_ms(value) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+SCENARIOS = {
+    "reminders": bench_reminders,
+    "term": bench_term,
+    "parse": bench_parse,
+    "liste": bench_liste,
+    "context": bench_context,
+    "llm": bench_llm,
+    "history": bench_history,
+    "webhook": bench_webhook,
+    "updates": bench_updates,
+    "bulk": bench_bulk,
+    "delivery": bench_delivery,
+    "catchup": bench_catchup,
+    "metrics": bench_metrics,
+    "memory": bench_memory,
+    "notion": bench_notion,
+    "heartbeat": bench_heartbeat,
+    "logwatch": bench_logwatch,
+    "jobsdb": bench_jobsdb,
+    "load": bench_load,
+    "burst": bench_burst,
+    "suite": bench_suite,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--n", type=int, default=200, help="number of operations")
+    parser.add_argument("--latency", type=float, default=0.005, help="fake API latency per request (s)")
+    parser.add_argument("--handshake", type=float, default=0.05, help="fake connection setup cost (s)")
+    parser.add_argument("--pool-size", type=int, default=clawnbot.TG_POOL_SIZE)
+    parser.add_argument("--concurrency", type=int, default=clawnbot.SEND_CONCURRENCY)
+    parser.add_argument("--workers", type=int, default=4, help="LLM worker threads")
+    parser.add_argument("--latency-llm", type=float, default=0.2, help="fake model latency per call (s)")
+    parser.add_argument("--chats", type=int, default=1000, help="number of distinct chats")
+    parser.add_argument("--rate", type=float, default=25.0, help="delivery queue global msg/s")
+    parser.add_argument("--interval", type=float, default=0.002, help="seconds between synthetic updates")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds a benchmark command runs")
+    parser.add_argument("--stored", type=int, default=0, help="reminders already in jobs.sqlite (load)")
+    parser.add_argument("--json", help="write load/burst/suite results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (0.2 = 20%%)")
+    args = parser.parse_args()
+    asyncio.run(SCENARIOS[args.scenario](args))
+
+    if args.json:
+        with open(os.path.join(os.environ.get("PWD", HERE), args.json), "w") as f:
+            json.dump(RESULTS, f, indent=2)
+    if args.baseline:
+        with open(os.path.join(os.environ.get("PWD", HERE), args.baseline)) as f:
+            regressions = compare(json.load(f), RESULTS, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", flush=True)
+        print(f"{len(regressions)} regression(s) against {args.baseline}", flush=True)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,39 @@
+import time
+BOOT_T0 = time.perf_counter()  # before any heavy import, for startup timing logs
+
 import os
+import html
 import logging
 import asyncio
-from datetime import datetime, timedelta
+import secrets
+import tempfile
+import threading
+import contextlib
+import functools
+from datetime import datetime
 from typing import Optional
 
-from telegram import Update
+import httpx
+from telegram import Bot, InputFile, Message, Update
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters, Application
+from telegram.request import HTTPXRequest
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
-from apscheduler.triggers.date import DateTrigger
-import dateparser
-import google.generativeai as genai
+from apscheduler.events import EVENT_JOB_REMOVED, EVENT_ALL_JOBS_REMOVED, EVENT_JOB_SUBMITTED
+# google.generativeai, dateparser and SQLAlchemy are imported lazily (see warm_up)
+
+import metrics
+from catchup import catch_up
+from command_runner import CommandRunner, CommandJob, CommandQueueFull, RingBuffer
+from conversation_store import ConversationStore, extractive_summary
+from delivery import DeliveryQueue
+from heartbeat import Heartbeat
+from log_watch import DEFAULT_PATTERNS, LogWatch, tail
+from live_message import MAX_MESSAGE_CHARS, LiveMessage
+from llm import ContextCache, FakeBackend, GeminiBackend, LLMPool, LLMQueueFull, prompt_key, stream_async
+from memory_index import MemoryIndex
+from reminder_index import ReminderIndex
+from time_parser import TIMEZONE, parse_reminder
+from update_processor import ChatOrderedProcessor
 
 # Logging configuration
 logging.basicConfig(
@@ -21,30 +44,389 @@ logger = logging.getLogger(__name__)
 
 # Constants
 TOKEN = os.environ.get("CLAWNBOT_TOKEN")
-DB_FILE = "sqlite:///jobs.sqlite"
+DB_PATH = "jobs.sqlite"
+DB_FILE = f"sqlite:///{DB_PATH}"
+LIST_PAGE_SIZE = 20
+BULK_LIMIT = 500  # reminders per /toplu
+
+# Telegram HTTP client tuning (shared by handlers and scheduled reminders)
+TG_POOL_SIZE = int(os.environ.get("CLAWNBOT_POOL_SIZE", "32"))
+TG_KEEPALIVE = float(os.environ.get("CLAWNBOT_KEEPALIVE", "60"))
+SEND_CONCURRENCY = int(os.environ.get("CLAWNBOT_SEND_CONCURRENCY", "16"))
+# Reminder delivery pacing, under Telegram's ~30 msg/s per bot and ~1 msg/s per chat
+DELIVERY_GLOBAL_RATE = float(os.environ.get("CLAWNBOT_DELIVERY_RATE", "25"))
+DELIVERY_CHAT_RATE = float(os.environ.get("CLAWNBOT_DELIVERY_CHAT_RATE", "1"))
+# Reminders missed while the bot was down: delivered late if at most this old, otherwise skipped
+MISFIRE_GRACE = int(os.environ.get("CLAWNBOT_MISFIRE_GRACE", str(12 * 3600)))
+# A recurring reminder missed several times is delivered once
+COALESCE = os.environ.get("CLAWNBOT_COALESCE", "1") == "1"
+CATCHUP_BATCH = 200
+
+# Shell command execution (/term and AI "CMD:")
+TERM_TIMEOUT = float(os.environ.get("CLAWNBOT_TERM_TIMEOUT", "30"))
+TERM_CONCURRENCY = int(os.environ.get("CLAWNBOT_TERM_CONCURRENCY", "4"))
+STREAM_TIMEOUT = float(os.environ.get("CLAWNBOT_STREAM_TIMEOUT", "300"))  # /term -f
+STREAM_EDIT_INTERVAL = float(os.environ.get("CLAWNBOT_EDIT_INTERVAL", "1.5"))
+STREAM_TAIL_CHARS = 3500  # shown in the live message, leaves room for the header
+STREAM_DOC_LIMIT = 45 * 1024 * 1024  # full output sent as a document, below the 50MB upload cap
+
+# Health checks declared in HEARTBEAT.md; alerts (state changes only) go to HEARTBEAT_CHAT
+HEARTBEAT_FILE = "HEARTBEAT.md"
+HEARTBEAT_CHAT = int(os.environ["CLAWNBOT_HEARTBEAT_CHAT"]) if os.environ.get("CLAWNBOT_HEARTBEAT_CHAT") else None
+HEARTBEAT_CONCURRENCY = int(os.environ.get("CLAWNBOT_HEARTBEAT_CONCURRENCY", "4"))
+HEARTBEAT_TIMEOUT = float(os.environ.get("CLAWNBOT_HEARTBEAT_TIMEOUT", "10"))
+
+# Followed logs (os.pathsep-separated): lines matching PUMP/DUMP or CLAWNBOT_LOG_PATTERN
+# are sent to LOG_WATCH_CHAT, deduplicated per symbol and rate limited; /tail shows the last lines
+LOG_WATCH_FILES = [p for p in os.environ.get(
+    "CLAWNBOT_WATCH_LOGS", "/Users/firat/Library/Logs/GeminiAgents/binance-screener.log").split(os.pathsep) if p]
+LOG_WATCH_CHAT = int(os.environ["CLAWNBOT_LOG_CHAT"]) if os.environ.get("CLAWNBOT_LOG_CHAT") else HEARTBEAT_CHAT
+LOG_WATCH_PATTERN = os.environ.get("CLAWNBOT_LOG_PATTERN")  # extra regex, alerted as "custom"
+LOG_WATCH_INTERVAL = float(os.environ.get("CLAWNBOT_LOG_INTERVAL", "2"))
+LOG_DEDUP_WINDOW = float(os.environ.get("CLAWNBOT_LOG_DEDUP", "300"))
+LOG_ALERTS_PER_MINUTE = float(os.environ.get("CLAWNBOT_LOG_ALERTS_PER_MINUTE", "6"))
+
+# Update delivery: webhook when CLAWNBOT_WEBHOOK_URL is set (needs python-telegram-bot[webhooks]),
+# long polling otherwise or if the webhook can't be started.
+WEBHOOK_URL = os.environ.get("CLAWNBOT_WEBHOOK_URL")  # public https URL Telegram posts to
+WEBHOOK_LISTEN = os.environ.get("CLAWNBOT_WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("CLAWNBOT_WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET = os.environ.get("CLAWNBOT_WEBHOOK_SECRET")  # random per start if unset
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("CLAWNBOT_WEBHOOK_MAX_CONNECTIONS", "40"))
+CONCURRENT_UPDATES = int(os.environ.get("CLAWNBOT_CONCURRENT_UPDATES", "32"))  # handlers in flight, all chats
+
+# Prometheus-style /metrics on a local port (0 = off); /stats shows the same numbers in chat
+METRICS_HOST = os.environ.get("CLAWNBOT_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("CLAWNBOT_METRICS_PORT", "9464"))
 
-# Configure Gemini
+# Startup: 1 = pre-warm dateparser/Gemini in the background after polling starts,
+# 0 = load them on first use only
+WARMUP = os.environ.get("CLAWNBOT_WARMUP", "1") == "1"
+
+# Configure Gemini (the SDK takes over a second to import, so it is loaded on first use).
+# CONTEXT.md is uploaded once as a cached system context and re-uploaded when it changes.
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    # Using a fast and capable model
-    model = genai.GenerativeModel('gemini-1.5-flash') 
-else:
-    model = None
-
-# Read Context
-try:
-    with open("CONTEXT.md", "r") as f:
-        SYSTEM_CONTEXT = f.read()
-except Exception as e:
-    SYSTEM_CONTEXT = "You are a helpful assistant."
-    print(f"⚠️ Warning: CONTEXT.md not found: {e}")
-
-# Scheduler Configuration
-jobstores = {
-    'default': SQLAlchemyJobStore(url=DB_FILE)
-}
-scheduler = AsyncIOScheduler(jobstores=jobstores, timezone="Europe/Istanbul")
+LLM_BACKEND = os.environ.get("CLAWNBOT_LLM_BACKEND", "gemini")  # "fake" runs offline
+GEMINI_MODEL = os.environ.get("CLAWNBOT_GEMINI_MODEL", "gemini-1.5-flash")
+CONTEXT_TTL = float(os.environ.get("CLAWNBOT_CONTEXT_TTL", "3600"))
+LLM_WORKERS = int(os.environ.get("CLAWNBOT_LLM_WORKERS", "4"))
+LLM_MAX_QUEUE = int(os.environ.get("CLAWNBOT_LLM_MAX_QUEUE", "50"))
+llm: Optional[ContextCache] = None
+_llm_lock = threading.Lock()
+
+# Per-chat conversation memory: recent turns up to a token budget, older turns
+# folded into a rolling summary; idle chats expire after HISTORY_TTL_DAYS.
+CONVERSATIONS_DB = "conversations.sqlite"
+HISTORY_TOKENS = int(os.environ.get("CLAWNBOT_HISTORY_TOKENS", "1500"))
+SUMMARY_TOKENS = int(os.environ.get("CLAWNBOT_SUMMARY_TOKENS", "300"))
+HISTORY_TTL_DAYS = float(os.environ.get("CLAWNBOT_HISTORY_TTL_DAYS", "7"))
+HISTORY_MAX_CHATS = int(os.environ.get("CLAWNBOT_HISTORY_MAX_CHATS", "500"))
+conversations: Optional[ConversationStore] = None
+
+# Long-term notes (MEMORY.md, memory/*.md) are searched per message, not inlined:
+# the MEMORY_TOP_K best snippets within MEMORY_TOKENS go into the prompt
+MEMORY_ROOT = os.environ.get("CLAWNBOT_MEMORY_ROOT", ".")
+MEMORY_INDEX_DB = "memory_index.sqlite"
+MEMORY_TOP_K = int(os.environ.get("CLAWNBOT_MEMORY_TOP_K", "3"))
+MEMORY_TOKENS = int(os.environ.get("CLAWNBOT_MEMORY_TOKENS", "400"))
+memory_index: Optional[MemoryIndex] = None
+
+# /notion appends to this page (token: NOTION_KEY or ~/.config/notion/api_key)
+NOTION_PAGE_ID = os.environ.get("CLAWNBOT_NOTION_PAGE")
+notion = None  # NotionClient, created on first use
+
+# Model calls get their own threads, shared fairly between chats (not the default executor)
+llm_pool = LLMPool(workers=LLM_WORKERS, max_queued=LLM_MAX_QUEUE)
+metrics.add_collector("clawnbot_llm_pool", llm_pool.stats)
+
+def get_llm() -> Optional[ContextCache]:
+    """Builds the model backend and context cache once; None without GOOGLE_API_KEY."""
+    global llm
+    if llm is None and (GOOGLE_API_KEY or LLM_BACKEND == "fake"):
+        with _llm_lock:
+            if llm is None:
+                t0 = time.perf_counter()
+                if LLM_BACKEND == "fake":
+                    backend = FakeBackend()
+                else:
+                    # Using a fast and capable model
+                    backend = GeminiBackend(GOOGLE_API_KEY, GEMINI_MODEL)
+                llm = ContextCache(backend, "CONTEXT.md", ttl=CONTEXT_TTL)
+                log_timing("Gemini client loaded", t0)
+    return llm
+
+def get_conversations() -> ConversationStore:
+    global conversations
+    if conversations is None:
+        conversations = ConversationStore(
+            CONVERSATIONS_DB,
+            budget_tokens=HISTORY_TOKENS,
+            summary_tokens=SUMMARY_TOKENS,
+            ttl=HISTORY_TTL_DAYS * 86400,
+            max_chats=HISTORY_MAX_CHATS,
+        )
+    return conversations
+
+def get_memory_index() -> MemoryIndex:
+    global memory_index
+    if memory_index is None:
+        memory_index = MemoryIndex(MEMORY_ROOT, MEMORY_INDEX_DB)
+        metrics.add_collector("clawnbot_memory_index", memory_index.stats)
+    return memory_index
+
+def recall_notes(query: str) -> str:
+    """Relevant long-term notes for the prompt; the index is brought up to date first (cheap when nothing changed)."""
+    if not MEMORY_TOP_K:
+        return ""
+    try:
+        return get_memory_index().context_for(query, MEMORY_TOP_K, MEMORY_TOKENS)
+    except Exception as e:
+        logger.warning(f"Memory search failed: {e}")
+        return ""
+
+def log_timing(label: str, started: float):
+    print(f"⏱️ {label}: {(time.perf_counter() - started) * 1000:.0f} ms "
+          f"(açılıştan +{time.perf_counter() - BOOT_T0:.2f}s)", flush=True)
+
+_first_requests = set()
+
+def log_first_request(kind: str, started: float):
+    """Logs how long the first request of each kind took after a restart."""
+    if kind not in _first_requests:
+        _first_requests.add(kind)
+        log_timing(f"First {kind} request", started)
+
+# Metrics (served on METRICS_PORT and summarized by /stats). LLM, command and
+# delivery metrics live in llm.py, command_runner.py and delivery.py.
+HANDLER_SECONDS = metrics.histogram("clawnbot_handler_seconds", "Update handler run time", ["handler"])
+HANDLER_ERRORS = metrics.counter("clawnbot_handler_errors", "Update handlers that raised", ["handler"])
+PARSE_SECONDS = metrics.histogram("clawnbot_parse_seconds", "Reminder time parsing", ["source"])
+SCHEDULER_LAG_SECONDS = metrics.histogram(
+    "clawnbot_scheduler_lag_seconds", "Job submission minus planned fire time", ["jobstore"]
+)
+TELEGRAM_SECONDS = metrics.histogram("clawnbot_telegram_seconds", "Bot API request time", ["method"])
+TELEGRAM_ERRORS = metrics.counter("clawnbot_telegram_errors", "Failed Bot API requests", ["method", "status"])
+metrics_server: Optional[asyncio.AbstractServer] = None
+
+def instrumented(name: str, callback):
+    """Wraps a handler callback to record its run time and failures."""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+    return wrapper
+
+def timed_parse(text: str, now: Optional[datetime] = None):
+    """parse_reminder() with its run time recorded per parser path (rule / dateparser)."""
+    started = time.perf_counter()
+    source = "error"
+    try:
+        parsed = parse_reminder(text, now)
+        source = parsed.source if parsed else "none"
+        return parsed
+    finally:
+        PARSE_SECONDS.observe(time.perf_counter() - started, source)
+
+# Scheduler Configuration. The SQLAlchemy jobstore is attached in start_scheduler(),
+# so its import cost is paid after polling has started, not at module load.
+scheduler = AsyncIOScheduler(
+    timezone="Europe/Istanbul",
+    job_defaults={"misfire_grace_time": MISFIRE_GRACE, "coalesce": COALESCE},
+)
+scheduler_ready = asyncio.Event()
+scheduler_error: Optional[BaseException] = None  # set (with scheduler_ready) if the scheduler can't start
+maintenance_lock = asyncio.Lock()  # one /bakim at a time
+MAINTENANCE_IDLE_WAIT = 30.0  # seconds /bakim waits for the delivery queue to drain
+
+# Per-chat lookup table for /liste and /iptal, lives in jobs.sqlite next to apscheduler_jobs
+reminder_index: Optional[ReminderIndex] = None
+job_store = None  # the 'default' BatchingJobStore, set in start_scheduler()
+heartbeat: Optional[Heartbeat] = None
+log_watch: Optional[LogWatch] = None
+
+def on_job_removed(event):
+    """Keeps the reminder index in sync when a job fires (one-shot) or is cancelled."""
+    if event.code == EVENT_ALL_JOBS_REMOVED:
+        reminder_index.clear()
+    else:
+        reminder_index.remove(event.job_id)
+
+def on_job_submitted(event):
+    """Records scheduler lag; a recurring reminder that ran gets its next run time refreshed in the index."""
+    lag = (datetime.now(TIMEZONE) - event.scheduled_run_times[-1]).total_seconds()
+    SCHEDULER_LAG_SECONDS.observe(lag, event.jobstore)
+    if event.jobstore == 'default':
+        reminder_index.sync_next_run_time(event.job_id)
+
+async def wait_for_scheduler(message: Message) -> bool:
+    """Waits until reminders can be used; replies and returns False if the scheduler failed to start."""
+    await scheduler_ready.wait()
+    if scheduler_error is not None:
+        await message.reply_text(f"❌ Hatırlatma sistemi başlatılamadı: {scheduler_error}")
+        return False
+    return True
+
+def start_scheduler():
+    """Attaches the persistent jobstore and starts the scheduler."""
+    global reminder_index, job_store
+    from apscheduler.jobstores.memory import MemoryJobStore
+    from apscheduler.util import obj_to_ref
+    from jobstore import BatchingJobStore
+    # Reminders are stored as typed columns plus a small trigger state, not pickled
+    store = job_store = BatchingJobStore(url=DB_FILE, compact_func=obj_to_ref(send_reminder))
+    scheduler.add_jobstore(store, 'default')
+    # Housekeeping jobs are re-created on every start and never persisted
+    scheduler.add_jobstore(MemoryJobStore(), 'memory')
+    reminder_index = ReminderIndex(DB_PATH)
+    scheduler.add_listener(on_job_removed, EVENT_JOB_REMOVED | EVENT_ALL_JOBS_REMOVED)
+    scheduler.add_listener(on_job_submitted, EVENT_JOB_SUBMITTED)
+    # Paused until warm_up() has caught up on reminders missed during downtime
+    scheduler.start(paused=True)
+    added, removed = reminder_index.reconcile(store)
+    if added or removed:
+        print(f"🗂️ Reminder index synced: +{added} / -{removed}", flush=True)
+    scheduler_ready.set()
+
+async def warm_up():
+    """Background startup: scheduler first, then pre-warm dateparser and Gemini."""
+    global scheduler_error
+    t0 = time.perf_counter()
+    try:
+        # Import in a worker thread so polling keeps running meanwhile
+        await asyncio.to_thread(__import__, "jobstore")
+        get_delivery_queue()  # leftovers from the last run go out before new reminders fire
+        start_scheduler()
+    except Exception as e:
+        # Wake handlers waiting on scheduler_ready, they answer with an error instead of hanging
+        logger.error(f"Scheduler failed to start: {e}")
+        scheduler_error = e
+        scheduler_ready.set()
+        raise
+    log_timing("Scheduler started", t0)
+    print("🚀 Scheduler started inside event loop.", flush=True)
+    t0 = time.perf_counter()
+    report = await catch_up(
+        job_store, reminder_index, get_delivery_queue().enqueue_many, datetime.now(TIMEZONE),
+        MISFIRE_GRACE, COALESCE, batch_size=CATCHUP_BATCH,
+        is_reminder=lambda job: job.func_ref.endswith(":send_reminder"),
+    )
+    scheduler.resume()
+    if report.overdue:
+        print(f"🕰️ Catch-up: {report.delivered} late reminder(s) queued, {report.skipped} skipped, "
+              f"{report.rescheduled} rescheduled, {report.removed} done", flush=True)
+    log_timing("Catch-up", t0)
+    scheduler.add_job(prune_conversations, 'interval', hours=1, id='prune-conversations',
+                      jobstore='memory', next_run_time=datetime.now(TIMEZONE))
+    start_heartbeat()
+    start_log_watch()
+
+    if not WARMUP:
+        return
+
+    async def warm_dateparser():
+        t = time.perf_counter()
+        await asyncio.to_thread(parse_reminder, "1 Ocak 2099 warm-up")  # forces the dateparser fallback
+        log_timing("dateparser warm", t)
+
+    async def warm_gemini():
+        cache = await asyncio.to_thread(get_llm)
+        if cache:
+            t = time.perf_counter()
+            await asyncio.to_thread(cache.current)  # uploads CONTEXT.md ahead of the first chat
+            log_timing("System context cached", t)
+
+    results = await asyncio.gather(warm_dateparser(), warm_gemini(), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"Warm-up failed: {result}")
+
+# Bot used by scheduled jobs. Set to the running Application's bot in post_init,
+# so reminders share its pooled keep-alive connections instead of opening new ones.
+reminder_bot: Optional[Bot] = None
+warm_up_task: Optional[asyncio.Task] = None
+send_semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+delivery_queue: Optional[DeliveryQueue] = None
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records each Bot API call's duration and failures by method."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, api_method)
+        if code >= 400:
+            TELEGRAM_ERRORS.inc(api_method, str(code))
+        return code, payload
+
+def start_heartbeat():
+    """Schedules the HEARTBEAT.md checks and re-reads the file every minute."""
+    global heartbeat
+    heartbeat = Heartbeat(alert_owner, HEARTBEAT_FILE, concurrency=HEARTBEAT_CONCURRENCY,
+                          default_timeout=HEARTBEAT_TIMEOUT)
+    checks = heartbeat.schedule(scheduler)
+    scheduler.add_job(heartbeat.reload_if_changed, 'interval', minutes=1, args=[scheduler],
+                      id='heartbeat-reload', jobstore='memory')
+    metrics.add_collector("clawnbot_heartbeat", heartbeat.stats)
+    if checks:
+        print(f"💓 Heartbeat: {len(checks)} check(s) scheduled", flush=True)
+
+def start_log_watch():
+    """Follows LOG_WATCH_FILES from their saved offsets, polled every LOG_WATCH_INTERVAL seconds."""
+    global log_watch
+    if not LOG_WATCH_FILES:
+        return
+    patterns = dict(DEFAULT_PATTERNS)
+    if LOG_WATCH_PATTERN:
+        patterns["custom"] = LOG_WATCH_PATTERN
+    log_watch = LogWatch(functools.partial(alert_owner, chat_id=LOG_WATCH_CHAT), LOG_WATCH_FILES, patterns,
+                         path=DB_PATH, dedup_window=LOG_DEDUP_WINDOW, rate_per_minute=LOG_ALERTS_PER_MINUTE)
+    log_watch.schedule(scheduler, LOG_WATCH_INTERVAL)
+    metrics.add_collector("clawnbot_log_watch", log_watch.stats)
+    print(f"📈 Log watch: {', '.join(LOG_WATCH_FILES)}", flush=True)
+
+async def alert_owner(text: str, chat_id: Optional[int] = HEARTBEAT_CHAT):
+    """Heartbeat and log alerts: to chat_id if set, the log otherwise."""
+    print(text, flush=True)
+    if chat_id is None:
+        return
+    async with send_semaphore:
+        await get_reminder_bot().send_message(chat_id=chat_id, text=text)
+
+def build_request(pool_size: int = TG_POOL_SIZE) -> HTTPXRequest:
+    """Pooled HTTP client with keep-alive for Bot API calls."""
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=TG_KEEPALIVE,
+    )
+    return InstrumentedRequest(
+        connection_pool_size=pool_size,
+        pool_timeout=10.0,
+        httpx_kwargs={"limits": limits},
+    )
+
+# Shared async command engine; commands never run on the event loop thread.
+command_runner = CommandRunner(max_concurrent=TERM_CONCURRENCY, default_timeout=TERM_TIMEOUT)
+metrics.add_collector("clawnbot_commands", command_runner.stats)
+
+def get_reminder_bot() -> Bot:
+    """Returns the shared bot for reminders, creating a standalone pooled one if the app isn't running."""
+    global reminder_bot
+    if reminder_bot is None:
+        reminder_bot = Bot(token=TOKEN, request=build_request())
+    return reminder_bot
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Greeting message."""
@@ -54,188 +436,190 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Komutlar:\n"
         "• /hatirlat <zaman> <mesaj> - Hatırlatma kurar\n"
         "  (Örn: /hatirlat 10 dakika sonra Fırını kapat)\n"
-        "• /liste - Aktif hatırlatmaları listeler\n"
-        "• /iptal <id> - Hatırlatmayı iptal eder"
+        "  Tekrarlı: /hatirlat her gün 09:00 Screener kontrol\n"
+        "• /toplu - Her satıra bir hatırlatma, hepsini birden kurar\n"
+        "• /liste [sayfa] - Aktif hatırlatmaları listeler\n"
+        "• /iptal <id> - Hatırlatmayı iptal eder\n"
+        "• /unut - Sohbet geçmişini siler\n"
+        "• /notion <metin> - Notion sayfasına not ekler\n"
+        "• /status - Sağlık kontrollerinin son durumu\n"
+        "• /tail [n] - İzlenen logun son satırları\n"
+        "• /bakim - jobs.sqlite'ı sıkıştırır\n"
+        "• /stats - Gecikme ve hata istatistikleri"
     )
 
 async def send_reminder(chat_id: int, message: str):
     """Callback function to send the reminder."""
-    # We need to create a new application instance or use the existing bot instance to send message
-    # Since this runs in a separate job, we use the bot token directly.
-    # Note: APScheduler runs this in the event loop.
-    from telegram import Bot
-    bot = Bot(token=TOKEN)
-    try:
-        await bot.send_message(chat_id=chat_id, text=f"⏰ HATIRLATMA: {message}")
-        print(f"✅ Reminder sent to {chat_id}: {message}", flush=True)
-    except Exception as e:
-        print(f"❌ Failed to send reminder: {e}", flush=True)
+    # APScheduler runs this in the event loop. It only hands the reminder to the
+    # delivery queue, which paces, merges, retries and persists it.
+    get_delivery_queue().enqueue(chat_id, message)
+
+async def deliver_reminders(chat_id: int, messages):
+    """Sends one or more reminders (merged by the delivery queue) as a single message.
+
+    Errors propagate: the queue retries 429s and network errors.
+    """
+    if len(messages) == 1:
+        text = f"⏰ HATIRLATMA: {messages[0]}"
+    else:
+        text = f"⏰ HATIRLATMA ({len(messages)}):\n" + "\n".join(f"• {m}" for m in messages)
+    # All reminders go through one shared bot; the semaphore keeps bursts within the pool
+    async with send_semaphore:
+        await get_reminder_bot().send_message(chat_id=chat_id, text=text)
+    print(f"✅ Reminder sent to {chat_id}: {' | '.join(messages)}", flush=True)
+
+def get_delivery_queue() -> DeliveryQueue:
+    """The reminder delivery queue, started (with reminders left from the last run) on first use."""
+    global delivery_queue
+    if delivery_queue is None:
+        delivery_queue = DeliveryQueue(
+            deliver_reminders, DB_PATH,
+            global_rate=DELIVERY_GLOBAL_RATE,
+            chat_rate=DELIVERY_CHAT_RATE,
+            concurrency=SEND_CONCURRENCY,
+        )
+        metrics.add_collector("clawnbot_delivery", delivery_queue.stats)
+        restored = delivery_queue.load()
+        if restored:
+            print(f"📬 {restored} undelivered reminder(s) restored", flush=True)
+        delivery_queue.start()
+    return delivery_queue
 
 async def schedule_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Parses time and schedules a message."""
+    started = time.perf_counter()
     if not context.args:
         await update.message.reply_text("Kullanım: /hatirlat <zaman> <mesaj>\nÖrn: /hatirlat yarın 14:00 Toplantı var")
         return
 
-    # Split args into time string and message
-    # Heuristic: We try to parse the beginning of the string as time.
-    # Since dateparser is smart, let's try to assume the message starts after the time.
-    # However, natural language is tricky. 
-    # Strategy: Combine all args, verify if it contains a time logic.
-    
-    # Better Strategy for this specific bot command structure:
-    # Let's try to split by common time prepositions or just rely on dateparser's search?
-    # Actually, simpler: join everything, assume the dateparser picks up the time info implicitly?
-    # No, dateparser.parse returns a datetime.
-    
-    # Improved Strategy:
-    # 1. Join all args.
-    # 2. Use dateparser with 'PREFER_DATES_FROM': 'future'
-    # 3. If we find a date, we schedule it. The "message" is trickier to extract if mixed.
-    # Let's ask the user to simplify: /hatirlat <zaman_ifadesi> | <mesaj> might be easier but less natural.
-    # Let's try to parse the first few words as time.
-    
     full_text = " ".join(context.args)
-    
-    # Try to split by common keyword if possible, or just parse the whole thing and see what dateparser returns.
-    # Issue: "5 dakika sonra" -> dateparser parses "5 dakika sonra" correctly.
-    # Problem: How to separate "5 dakika sonra" from "Fırını kapat"?
-    
-    # Let's iterate words to find the split point where dateparser returns a valid date
-    # This is a bit brute-force but works for "time first" commands.
-    
-    best_date = None
-    split_index = 0
-    
-    words = context.args
-    # Try increasing window of words
-    for i in range(1, len(words) + 1):
-        time_part = " ".join(words[:i])
-        dt = dateparser.parse(time_part, settings={'PREFER_DATES_FROM': 'future', 'To': 'Europe/Istanbul'})
-        if dt:
-             # Check if it's in the past (dateparser sometimes returns past dates)
-             if dt > datetime.now():
-                 best_date = dt
-                 split_index = i
-             # Keep going to see if adding more words refines it (e.g. "next Friday" vs "next")
-             # But usually shortest valid match that is in future is risky? 
-             # actually "next friday" is better than "next".
-             # let's assume greedy match: Keep matching as long as it returns a valid date?
-             # But "5 dakika sonra git" -> "5 dakika sonra" is date, "git" breaks it?
-             # dateparser might ignore "git" and still return the date.
-             pass
-    
-    # Let's rely on strict splitting for now to be safe or just take the best guess.
-    # Alternative: Use " " as separator implies single word time.
-    # Let's try: Parse the whole string. If dateparser extracts a date, we use it, 
-    # but we don't know WHICH part was the date.
-    
-    # Reverting to a simpler logic for robustness:
-    # Try to parse the first 1-3 words as time expression.
-    # Or, use a separator like " - " or "," or just guess.
-    
-    # Let's try the iterate-until-fail approach which is common.
-    # Check 1 word, 2 words, ... N words.
-    # If N words parse to a date, and N+1 words parse to SAME date or invalid, maybe N is the boundary?
-    # But dateparser is fuzzy.
-    
-    # Let's stick to a robust assumption: Time is at the start.
-    # We will try to parse increasing chunks. We pick the longest chunk that produces a valid future date.
-    
-    best_len = 0
-    final_dt = None
-    
-    for i in range(len(words), 0, -1):
-        test_str = " ".join(words[:i])
-        dt = dateparser.parse(test_str, settings={'PREFER_DATES_FROM': 'future'}) # settings={'TIMEZONE': 'Europe/Istanbul'}
-        if dt and dt > datetime.now():
-            # Found a candidate
-            final_dt = dt
-            best_len = i
-            break # Since we started from longest, this includes the most specific time info? 
-                  # WAIT: "5 dakika sonra fırını kapat" -> dateparser might parse the WHOLE thing and ignore "fırını kapat" if it's fuzzy.
-                  # If dateparser is too fuzzy, this is bad. 
-                  # "strict" parsing is not supported well in dateparser.
-    
-    # Fallback: Let's assume the user puts time first.
-    # Let's try to be smart: parsed_date = dateparser.parse(full_text)
-    # If valid, ask user to confirm? No, scheduling should be instant.
-    
-    # Let's use the `dateparser.search.search_dates` if available?
-    try:
-        from dateparser.search import search_dates
-        # languages=['tr'] helps
-        matches = search_dates(full_text, languages=['tr', 'en'], settings={'PREFER_DATES_FROM': 'future'})
-        
-        if not matches:
-            await update.message.reply_text("❌ Zaman ifadesi bulunamadı. Lütfen '10 dakika sonra', 'yarın 14:00' gibi ifadeler kullanın.")
-            return
 
-        # matches returns list of (substring, datetime_obj)
-        # We take the first one? Or the one that looks like a date?
-        # Usually checking the first match is enough for a command like this.
-        
-        found_text, found_date = matches[0]
-        
-        if found_date < datetime.now():
-            found_date += timedelta(days=1) # If user says "10:00" and it's 11:00, assume tomorrow? 
-            # dateparser usually handles this with PREFER_DATES_FROM future, but search_dates might be different.
-            if found_date < datetime.now():
-                 await update.message.reply_text(f"❌ Geçmiş zaman algılandı: {found_date}. Lütfen gelecek bir zaman belirtin.")
-                 return
-
-        # The message content is everything ELSE.
-        # We replace the found date text with empty string to get the message? 
-        # Be careful of overlaps.
-        
-        reminder_msg = full_text.replace(found_text, "").strip()
-        if not reminder_msg:
-            reminder_msg = "Hatırlatma" # Default message
-            
-        if reminder_msg.startswith("-") or reminder_msg.startswith(":"):
-             reminder_msg = reminder_msg[1:].strip()
-
-        # Update final_dt
-        final_dt = found_date
-        
+    # Time is expected first ("10 dakika sonra ...", "yarın 14:00 ...").
+    # time_parser tokenizes once, tries its rule-based fast path and only then
+    # falls back to a single dateparser search; run off-loop since that can be slow.
+    try:
+        parsed = await asyncio.to_thread(timed_parse, full_text)
     except Exception as e:
         logger.error(f"Date parsing error: {e}")
         await update.message.reply_text("❌ Tarih anlaşılamadı.")
         return
 
+    if not parsed:
+        await update.message.reply_text("❌ Zaman ifadesi bulunamadı. Lütfen '10 dakika sonra', 'yarın 14:00' gibi ifadeler kullanın.")
+        return
+
+    if parsed.when < datetime.now(TIMEZONE):
+        await update.message.reply_text(f"❌ Geçmiş zaman algılandı: {parsed.when}. Lütfen gelecek bir zaman belirtin.")
+        return
+
     # Schedule the job
+    if not await wait_for_scheduler(update.message):
+        return
     chat_id = update.effective_chat.id
-    job = scheduler.add_job(
-        send_reminder,
-        DateTrigger(run_date=final_dt),
-        args=[chat_id, reminder_msg],
-        name=str(chat_id) # Store chat_id in name for filtering later
-    )
+    job, row = add_reminder(chat_id, parsed)
+    reminder_index.add(*row)
 
-    formatted_time = final_dt.strftime("%d %B %H:%M:%S")
+    formatted_time = parsed.when.strftime("%d %B %H:%M:%S")
+    repeat = f"🔁 Tekrar: {parsed.matched}\n" if parsed.recurrence else ""
     await update.message.reply_text(
         f"✅ Hatırlatma kuruldu!\n\n"
         f"🕒 Zaman: {formatted_time}\n"
-        f"📝 Mesaj: {reminder_msg}\n"
+        f"{repeat}"
+        f"📝 Mesaj: {parsed.message}\n"
         f"🆔 Job ID: `{job.id}`"
     )
+    log_first_request("/hatirlat", started)
+
+def add_reminder(chat_id: int, parsed):
+    """Schedules a parsed reminder (one-shot or recurring); returns the job and its index row."""
+    job = scheduler.add_job(
+        send_reminder,
+        parsed.trigger(),
+        args=[chat_id, parsed.message],
+        name=str(chat_id) # Store chat_id in name for filtering later
+    )
+    return job, (job.id, chat_id, job.next_run_time, parsed.message, parsed.matched if parsed.recurrence else None)
+
+def parse_bulk(lines):
+    """Parses /toplu lines; returns ([(line_no, parsed)], [failed line_no])."""
+    now = datetime.now(TIMEZONE)
+    parsed, failed = [], []
+    for line_no, line in lines:
+        try:
+            result = timed_parse(line, now)
+        except Exception as e:
+            logger.warning(f"Bulk line {line_no} failed to parse: {e}")
+            result = None
+        if result and result.when > now:
+            parsed.append((line_no, result))
+        else:
+            failed.append(line_no)
+    return parsed, failed
+
+async def bulk_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/toplu: one reminder per line (message text or an attached .txt), stored in one transaction."""
+    message = update.message
+    if message.document:
+        data = await (await message.document.get_file()).download_as_bytearray()
+        text = data.decode("utf-8", errors="replace")
+    else:
+        text = message.text.split(None, 1)[1] if len(message.text.split(None, 1)) > 1 else ""
+    lines = [(n, line.strip()) for n, line in enumerate(text.splitlines(), 1) if line.strip()]
+    if not lines:
+        await message.reply_text(
+            "Kullanım: /toplu ve altında her satıra bir hatırlatma\n"
+            "Örn:\n/toplu\nyarın 09:00 Toplantı\nher gün 08:30 İlaç\n\n"
+            "Ya da satırları .txt dosyası olarak '/toplu' açıklamasıyla gönder."
+        )
+        return
+    if len(lines) > BULK_LIMIT:
+        await message.reply_text(f"❌ En fazla {BULK_LIMIT} satır gönderebilirsin ({len(lines)} geldi).")
+        return
+
+    parsed, failed = await asyncio.to_thread(parse_bulk, lines)
+    if not await wait_for_scheduler(message):
+        return
+    chat_id = update.effective_chat.id
+    # One jobstore transaction for every job, then one index transaction
+    with job_store.batch():
+        rows = [add_reminder(chat_id, reminder)[1] for _, reminder in parsed]
+    reminder_index.add_many(rows)
+
+    msg = f"✅ {len(rows)} hatırlatma kuruldu."
+    if failed:
+        shown = ", ".join(str(n) for n in failed[:20]) + (" ..." if len(failed) > 20 else "")
+        msg += f"\n❌ Anlaşılamayan satırlar ({len(failed)}): {shown}"
+    await message.reply_text(msg)
 
 async def list_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """List active jobs for this user."""
-    chat_id = str(update.effective_chat.id)
-    jobs = scheduler.get_jobs()
-    
-    user_jobs = [j for j in jobs if j.name == chat_id]
-    
-    if not user_jobs:
+    """List active jobs for this user, paginated: /liste [sayfa]."""
+    chat_id = update.effective_chat.id
+    page = int(context.args[0]) if context.args and context.args[0].isdigit() else 1
+    if not await wait_for_scheduler(update.message):
+        return
+
+    # Indexed on (chat_id, next_run_time): cost depends on this chat's reminders only
+    user_jobs, total = reminder_index.page(chat_id, page, LIST_PAGE_SIZE)
+
+    if not total:
         await update.message.reply_text("📭 Aktif hatırlatmanız yok.")
         return
 
-    msg = "📋 **Aktif Hatırlatmalar:**\n"
+    pages = (total + LIST_PAGE_SIZE - 1) // LIST_PAGE_SIZE
+    if not user_jobs:
+        await update.message.reply_text(f"❌ Sayfa {page} yok (toplam {pages} sayfa).")
+        return
+
+    msg = f"📋 **Aktif Hatırlatmalar** ({total}):\n"
     for j in user_jobs:
-        run_time = j.next_run_time.strftime("%Y-%m-%d %H:%M:%S")
-        msg += f"• `{j.id}`: {run_time} - {j.args[1]}\n"
-    
+        run_time = j.run_time.astimezone(TIMEZONE).strftime("%Y-%m-%d %H:%M:%S") if j.run_time else "-"
+        repeat = f" 🔁 {j.recurrence}" if j.recurrence else ""
+        msg += f"• `{j.job_id}`: {run_time} - {j.message}{repeat}\n"
+    if pages > 1:
+        msg += f"\nSayfa {page}/{pages}"
+        if page < pages:
+            msg += f" • Sonraki: /liste {page + 1}"
+
     await update.message.reply_text(msg, parse_mode='Markdown')
 
 async def cancel_job(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -245,14 +629,16 @@ async def cancel_job(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
         
     job_id = context.args[0]
-    chat_id = str(update.effective_chat.id)
-    
-    job = scheduler.get_job(job_id)
-    if not job:
+    chat_id = update.effective_chat.id
+
+    if not await wait_for_scheduler(update.message):
+        return
+    reminder = reminder_index.get(job_id)
+    if not reminder:
         await update.message.reply_text("❌ Bu ID ile bir hatırlatma bulunamadı.")
         return
         
-    if job.name != chat_id:
+    if reminder.chat_id != chat_id:
         await update.message.reply_text("❌ Bu hatırlatma size ait değil.")
         return
         
@@ -261,7 +647,10 @@ async def cancel_job(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle regular text messages using Gemini."""
-    if not model or not GOOGLE_API_KEY:
+    started = time.perf_counter()
+    # First use after a restart may still be importing the SDK; keep the loop free meanwhile
+    llm = await asyncio.to_thread(get_llm)
+    if not llm:
         # Silently ignore or reply? Users prefer feedback.
         await update.message.reply_text("🧠 Beynim (GOOGLE_API_KEY) henüz takılmadı. Sadece /komut la çalışıyorum.")
         return
@@ -269,88 +658,403 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_msg = update.message.text
     chat_id = update.effective_chat.id
     
-    # Indicate typing
-    await context.bot.send_chat_action(chat_id=chat_id, action="typing")
+    # Indicate typing, and keep it alive for long generations (Telegram drops it after ~5s)
+    typing = asyncio.create_task(keep_typing(context.bot, chat_id))
 
     try:
-        # Construct Prompt
-        full_prompt = f"{SYSTEM_CONTEXT}\n\nUSER MESSAGE: {user_msg}\n\nRESPONSE (In Turkish, helpful, concise):"
-        
-        # Async generation
-        loop = asyncio.get_running_loop()
-        response = await loop.run_in_executor(None, lambda: model.generate_content(full_prompt))
-        
-        reply = response.text.strip()
-        
-        # CHECK FOR COMMAND EXECUTION
-        if reply.startswith("CMD:"):
-            command = reply.replace("CMD:", "").strip()
-            await update.message.reply_text(f"💻 AI Komut Çalıştırıyor: `{command}`", parse_mode='Markdown')
-            
-            # Execute Command
-            import subprocess
-            try:
-                proc = subprocess.run(
-                    command, 
-                    shell=True, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    timeout=30
-                )
-                output = proc.stdout
-                error = proc.stderr
-                
-                final_response = ""
-                if output:
-                    final_response += f"📄 **Çıktı:**\n```\n{output[:3000]}\n```"
-                if error:
-                    final_response += f"\n⚠️ **Hata:**\n```\n{error[:1000]}\n```"
-                    
-                if not final_response:
-                    final_response = "✅ Komut çalıştı (Çıktı yok)."
-                    
-                await update.message.reply_text(final_response, parse_mode='Markdown')
-                
-            except Exception as cmd_err:
-                await update.message.reply_text(f"❌ Komut Hatası: {str(cmd_err)}")
-        else:
-            # Normal text response
+        # Construct Prompt. CONTEXT.md is not inlined: it is the cached system context.
+        # Notes relevant to this message come first, then the chat's summary and recent
+        # turns (bounded by MEMORY_TOKENS and HISTORY_TOKENS).
+        notes = await asyncio.to_thread(recall_notes, user_msg)
+        history = await asyncio.to_thread(get_conversations().render, chat_id)
+        full_prompt = f"USER MESSAGE: {user_msg}\n\nRESPONSE (In Turkish, helpful, concise):"
+        if history:
+            full_prompt = f"{history}\n\n{full_prompt}"
+        if notes:
+            full_prompt = f"{notes}\n\n{full_prompt}"
+
+        # Streamed generation: partial text goes into one message, edited as it grows
+        reply = ""
+        mode = None  # "cmd" or "text", decided on the first chunk(s)
+        live: Optional[LiveMessage] = None
+        command_started = False
+
+        async def on_queued(position: int):
+            await update.message.reply_text(f"⏳ Yoğunluk var, sıradasın: {position}. sıra")
+
+        # Runs on the LLM pool; an identical prompt already in flight is answered from that call
+        def run_on_pool(pump):
+            return llm_pool.run(chat_id, pump, key=prompt_key(full_prompt), on_queued=on_queued)
+
+        # aclosing: breaking out early (CMD: found) stops the worker thread right away
+        async with contextlib.aclosing(stream_async(lambda: llm.stream(full_prompt), run_on_pool)) as chunks:
+            async for chunk in chunks:
+                reply += chunk
+                head = reply.lstrip()
+                if mode is None:
+                    if len(head) < 4 and "CMD:".startswith(head):
+                        continue  # could still become "CMD:"
+                    mode = "cmd" if head.startswith("CMD:") else "text"
+                    typing.cancel()
+
+                # CHECK FOR COMMAND EXECUTION: start as soon as the command line is complete
+                if mode == "cmd":
+                    if "\n" in head:
+                        # Only the command line is kept: it is what ran, and what history records
+                        reply = head.split("\n", 1)[0]
+                        start_ai_command(update, context, reply)
+                        command_started = True
+                        break
+                elif live is None:
+                    live = LiveMessage(await update.message.reply_text(head[:MAX_MESSAGE_CHARS]),
+                                       min_interval=STREAM_EDIT_INTERVAL)
+                else:
+                    live.update(head)
+
+        reply = reply.strip()
+        if mode == "cmd" or (mode is None and reply.startswith("CMD:")):
+            if not command_started:
+                start_ai_command(update, context, reply)
+        elif live is not None:
+            # Final edit with Markdown now that the reply is complete
+            await live.close(reply[:MAX_MESSAGE_CHARS], parse_mode='Markdown')
+            for part in split_message(reply[MAX_MESSAGE_CHARS:]):
+                await update.message.reply_text(part)
+        elif reply:
             await update.message.reply_text(reply, parse_mode='Markdown')
-        
+        remember_turn(context, chat_id, user_msg, reply)
+        log_first_request("AI chat", started)
+
+    except LLMQueueFull:
+        await update.message.reply_text("🚦 Şu an çok yoğunum, birazdan tekrar yazar mısın?")
     except Exception as e:
         logger.error(f"Gemini Error: {e}")
         await update.message.reply_text(f"🤯 Hata oluştu: {str(e)}")
+    finally:
+        typing.cancel()
 
-def main():
-    if not TOKEN:
-        print("❌ HATA: CLAWNBOT_TOKEN environment variable bulunamadı!", flush=True)
+def remember_turn(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_msg: str, reply: str):
+    """Stores the exchange; folds old turns into the summary in the background when over budget."""
+    store = get_conversations()
+    store.append(chat_id, "user", user_msg)
+    if reply:
+        store.append(chat_id, "assistant", reply)
+    if store.needs_fold(chat_id):
+        context.application.create_task(fold_history(chat_id))
+
+def summarize_turns(previous: str, turns) -> str:
+    """Model-written rolling summary (runs on an LLM pool thread)."""
+    lines = "\n".join(f"{'USER' if role == 'user' else 'ASSISTANT'}: {text}" for role, text in turns)
+    prompt = (
+        f"PREVIOUS SUMMARY:\n{previous or '-'}\n\nNEW TURNS:\n{lines}\n\n"
+        f"Update the summary of this conversation in Turkish, at most {SUMMARY_TOKENS * 3} characters. "
+        "Keep facts, names, decisions and open tasks. Reply with the summary only."
+    )
+    return get_llm().generate(prompt).text.strip()
+
+async def fold_history(chat_id: int):
+    """Replaces a chat's oldest turns with an updated summary."""
+    store = get_conversations()
+    taken = store.take_for_fold(chat_id)
+    if not taken:
         return
+    previous, turns = taken
+    pairs = [(t.role, t.text) for t in turns]
+    try:
+        try:
+            summary = await llm_pool.run(chat_id, lambda: summarize_turns(previous, pairs))
+        except Exception as e:
+            # Over budget either way: keep going with a model-free summary
+            logger.warning(f"History summary failed, using extractive summary: {e}")
+            summary = extractive_summary(previous, pairs, SUMMARY_TOKENS)
+        store.apply_fold(chat_id, turns, summary or extractive_summary(previous, pairs, SUMMARY_TOKENS))
+    except BaseException:
+        store.cancel_fold(chat_id)  # let the next turn fold again
+        raise
 
-    # Create the application configuration
-    app = ApplicationBuilder().token(TOKEN).build()
-
-    # Add handlers
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("hatirlat", schedule_message))
-    app.add_handler(CommandHandler("liste", list_jobs))
-    app.add_handler(CommandHandler("iptal", cancel_job))
-    app.add_handler(CommandHandler("term", term_command))
+async def prune_conversations():
+    removed = await asyncio.to_thread(get_conversations().prune)
+    if removed:
+        print(f"🧹 Conversation memory pruned: {removed} chat(s)", flush=True)
+
+def get_notion():
+    """The shared Notion client (one connection pool for the bot's lifetime), or None without a token."""
+    global notion
+    if notion is None:
+        from notion_client import NotionClient, load_token
+        token = load_token()
+        if token:
+            notion = NotionClient(token)
+            metrics.add_collector("clawnbot_notion", notion.stats)
+    return notion
+
+async def notion_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/notion <metin>: appends each line as a paragraph to the configured page, in one request per 100 lines."""
+    from notion_client import NotionError
+    text = update.message.text.partition(" ")[2].strip()
+    if not text:
+        await update.message.reply_text("Kullanım: /notion <metin>\nHer satır sayfaya ayrı paragraf olarak eklenir.")
+        return
+    client = get_notion()
+    if client is None or not NOTION_PAGE_ID:
+        await update.message.reply_text("📓 Notion ayarlı değil (NOTION_KEY ve CLAWNBOT_NOTION_PAGE gerekli).")
+        return
+    lines = [line for line in text.splitlines() if line.strip()]
+    try:
+        await client.append_paragraphs(NOTION_PAGE_ID, lines)
+    except (NotionError, httpx.HTTPError) as e:
+        logger.error(f"Notion append failed: {e}")
+        await update.message.reply_text(f"❌ Notion hatası: {e}")
+        return
+    await update.message.reply_text(f"📓 Notion'a {len(lines)} paragraf eklendi.")
+
+async def maintenance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/bakim: rewrites old pickled reminders in the compact format and vacuums jobs.sqlite.
+
+    VACUUM locks the whole file for seconds, so the scheduler is paused, new
+    /hatirlat etc. wait on scheduler_ready and the delivery queue must be empty
+    first: no reminder is handed over while the file is locked.
+    """
+    if not await wait_for_scheduler(update.message):
+        return
+    if maintenance_lock.locked():
+        await update.message.reply_text("🧹 Bakım zaten sürüyor.")
+        return
+    async with maintenance_lock:
+        scheduler.pause()
+        scheduler_ready.clear()
+        try:
+            if not await get_delivery_queue().wait_idle(MAINTENANCE_IDLE_WAIT):
+                await update.message.reply_text("⏳ Gönderilmeyi bekleyen hatırlatmalar var, biraz sonra tekrar dene.")
+                return
+            await update.message.reply_text("🧹 jobs.sqlite sıkıştırılıyor...")
+            report = await asyncio.to_thread(job_store.compact)
+            removed = await asyncio.to_thread(reminder_index.reconcile, job_store)
+        finally:
+            scheduler_ready.set()
+            scheduler.resume()
+    mb = 1024 * 1024
+    await update.message.reply_text(
+        f"🧹 Bakım tamam: {report['rewritten']} hatırlatma yeni biçime çevrildi, "
+        f"{removed[1]} eski indeks satırı silindi.\n"
+        f"Dosya: {report['size_before'] / mb:.1f} MB → {report['size_after'] / mb:.1f} MB"
+    )
+
+async def forget_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Clears this chat's conversation memory."""
+    get_conversations().clear(update.effective_chat.id)
+    await update.message.reply_text("🧽 Sohbet geçmişi silindi.")
+
+def format_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    return f"{value * 1000:.0f} ms" if value < 1 else f"{value:.1f} s"
+
+def histogram_lines(hist: metrics.Histogram, prefix: str = "") -> list:
+    """One "• label: p50 / p95 (count)" line per label set of a histogram."""
+    lines = []
+    for labels in hist.label_sets():
+        name = prefix + "/".join(labels) if labels else prefix.rstrip()
+        lines.append(f"• {name}: {format_seconds(hist.quantile(0.5, *labels))} / "
+                     f"{format_seconds(hist.quantile(0.95, *labels))} ({hist.count(*labels)})")
+    return lines
+
+def format_stats() -> str:
+    """/stats text: the metrics registry, summarized (p50 / p95 (count) since start)."""
+    from command_runner import COMMAND_SECONDS
+    from delivery import DELIVERY_LAG_SECONDS, SEND_ERRORS
+    from llm import LLM_FIRST_CHUNK_SECONDS, LLM_SECONDS, LLM_TOKENS
+
+    uptime = time.perf_counter() - BOOT_T0
+    tokens = {kind: int(LLM_TOKENS.value(kind)) for kind in ("prompt", "cached", "output")}
+    token_lines = [f"• token: {tokens['prompt']} girdi, {tokens['cached']} önbellek, {tokens['output']} çıktı"] \
+        if any(tokens.values()) else []
+    sections = [
+        ("⚙️ İşleyiciler", histogram_lines(HANDLER_SECONDS, "/")),
+        ("📅 Tarih ayrıştırma", histogram_lines(PARSE_SECONDS)),
+        ("🧠 Model", histogram_lines(LLM_SECONDS) + histogram_lines(LLM_FIRST_CHUNK_SECONDS, "ilk parça")
+         + token_lines),
+        ("🖥️ Komutlar", histogram_lines(COMMAND_SECONDS)),
+        ("⏰ Zamanlayıcı gecikmesi", histogram_lines(SCHEDULER_LAG_SECONDS)
+         + histogram_lines(DELIVERY_LAG_SECONDS, "teslim")),
+        ("📡 Telegram", histogram_lines(TELEGRAM_SECONDS)),
+    ]
+    lines = [f"📊 İstatistikler (p50 / p95 (adet), açılıştan beri {uptime / 3600:.1f} sa)"]
+    for title, body in sections:
+        if body:
+            lines += ["", title] + body
+
+    errors = [f"{'/'.join(labels)}={int(value)}" for _, labels, value in
+              list(SEND_ERRORS.samples()) + list(TELEGRAM_ERRORS.samples()) + list(HANDLER_ERRORS.samples())]
+    if errors:
+        lines += ["", "❗ Hatalar", "• " + ", ".join(errors)]
+
+    pool = llm_pool.stats()
+    lines += ["", f"🧵 Model havuzu: {pool['active']}/{pool['workers']} aktif, {pool['queued']} sırada, "
+                  f"{pool['rejected']} reddedildi"]
+    if delivery_queue is not None:
+        queue = delivery_queue.stats()
+        lines.append(f"📬 Teslimat: {queue['pending']} bekliyor, {queue['sent_reminders']} gönderildi, "
+                     f"{queue['retried']} tekrar, {queue['dropped']} düştü")
+    return "\n".join(lines)
+
+async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Last heartbeat results, from the cache (no checks are run here)."""
+    if heartbeat is None:
+        await update.message.reply_text("💓 Heartbeat henüz başlamadı.")
+        return
+    await update.message.reply_text(heartbeat.status_text())
+
+async def tail_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/tail [n]: last n lines of the first watched log, read from the end of the file."""
+    n = int(context.args[0]) if context.args and context.args[0].isdigit() else 20
+    n = max(1, min(n, 100))
+    if not LOG_WATCH_FILES:
+        await update.message.reply_text("📈 İzlenen log yok (CLAWNBOT_WATCH_LOGS).")
+        return
+    path = LOG_WATCH_FILES[0]
+    try:
+        lines = await asyncio.to_thread(tail, path, n)
+    except OSError as e:
+        await update.message.reply_text(f"❌ Log okunamadı: {e}")
+        return
+    text = "\n".join(lines)[-STREAM_TAIL_CHARS:] or "(boş)"
+    await update.message.reply_text(f"📈 {os.path.basename(path)} (son {n} satır):\n{text}")
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Latency percentiles, error counts and queue sizes since start."""
+    await update.message.reply_text(format_stats())
+
+async def keep_typing(bot: Bot, chat_id: int, interval: float = 4.0):
+    """Re-sends the typing action until cancelled."""
+    while True:
+        try:
+            await bot.send_chat_action(chat_id=chat_id, action="typing")
+        except Exception as e:
+            logger.warning(f"Typing action failed: {e}")
+        await asyncio.sleep(interval)
+
+def start_ai_command(update: Update, context: ContextTypes.DEFAULT_TYPE, line: str):
+    """Runs the command from an AI "CMD: ..." reply in the background."""
+    command = line.replace("CMD:", "", 1).strip().strip("`").strip()
+    # Runs in the background so this chat's next update isn't held up by the command
+    context.application.create_task(
+        run_command_and_reply(update, command, "💻 AI Komut Çalıştırıyor:"), update=update
+    )
+
+def split_message(text: str, limit: int = MAX_MESSAGE_CHARS):
+    """Splits text into Telegram-sized parts, preferring line breaks."""
+    while text:
+        if len(text) <= limit:
+            yield text
+            return
+        cut = text.rfind("\n", 0, limit)
+        cut = cut if cut > limit // 2 else limit
+        yield text[:cut]
+        text = text[cut:].lstrip("\n")
+
+def build_application(base_url: Optional[str] = None, concurrent_updates=None) -> Application:
+    """The bot application with all handlers.
+
+    base_url points it at another Bot API server; concurrent_updates overrides the
+    update processor (anything ApplicationBuilder.concurrent_updates() accepts).
+    """
+    builder = ApplicationBuilder().token(TOKEN).request(build_request())
+    if base_url:
+        builder = builder.base_url(base_url)
+    if concurrent_updates is None:
+        # Chats are handled in parallel, each chat's updates strictly in order
+        concurrent_updates = ChatOrderedProcessor(CONCURRENT_UPDATES)
+    app = builder.concurrent_updates(concurrent_updates).build()
+
+    # Add handlers (each one timed under its name in clawnbot_handler_seconds)
+    app.add_handler(CommandHandler("start", instrumented("start", start)))
+    app.add_handler(CommandHandler("hatirlat", instrumented("hatirlat", schedule_message)))
+    app.add_handler(CommandHandler("liste", instrumented("liste", list_jobs)))
+    app.add_handler(CommandHandler("iptal", instrumented("iptal", cancel_job)))
+    app.add_handler(CommandHandler("toplu", instrumented("toplu", bulk_schedule)))
+    app.add_handler(MessageHandler(filters.Document.TXT & filters.CaptionRegex(r"^/toplu\b"),
+                                   instrumented("toplu", bulk_schedule)))
+    app.add_handler(CommandHandler("term", instrumented("term", term_command)))
+    app.add_handler(CommandHandler("unut", instrumented("unut", forget_command)))
+    app.add_handler(CommandHandler("stats", instrumented("stats", stats_command)))
+    app.add_handler(CommandHandler("status", instrumented("status", status_command)))
+    app.add_handler(CommandHandler("tail", instrumented("tail", tail_command)))
+    app.add_handler(CommandHandler("bakim", instrumented("bakim", maintenance_command)))
+    app.add_handler(CommandHandler("notion", instrumented("notion", notion_command)))
     
     # NEW: Handle text messages
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, instrumented("ai", handle_message)))
+
+    if hasattr(app.update_processor, "stats"):
+        metrics.add_collector("clawnbot_updates", app.update_processor.stats)
 
     # Post-init hook to start scheduler
     async def post_init(application: Application):
-        scheduler.start()
-        print("🚀 Scheduler started inside event loop.", flush=True)
-        if GOOGLE_API_KEY:
+        global reminder_bot, warm_up_task
+        reminder_bot = application.bot
+        # Scheduler and heavy imports come up in the background so updates flow right away.
+        # Only once: post_init runs again if the webhook fails and we fall back to polling.
+        if warm_up_task is None:
+            warm_up_task = application.create_task(warm_up())
+            await start_metrics_server()
+        log_timing("Bot ready, receiving updates", BOOT_T0)
+        if GOOGLE_API_KEY or LLM_BACKEND == "fake":
             print("🧠 Gemini AI connected.", flush=True)
         else:
             print("⚠️ Gemini AI NOT connected (Missing GOOGLE_API_KEY).", flush=True)
 
-    # Run the bot
     app.post_init = post_init
+    return app
+
+async def start_metrics_server():
+    global metrics_server
+    if not METRICS_PORT or metrics_server is not None:
+        return
+    try:
+        metrics_server = await metrics.serve(METRICS_HOST, METRICS_PORT)
+        print(f"📈 Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics", flush=True)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint unavailable: {e}")
+
+def webhook_settings() -> dict:
+    """run_webhook()/start_webhook() arguments derived from CLAWNBOT_WEBHOOK_*."""
+    from urllib.parse import urlparse
+    return {
+        "listen": WEBHOOK_LISTEN,
+        "port": WEBHOOK_PORT,
+        "url_path": urlparse(WEBHOOK_URL).path.strip("/") or "telegram",
+        "webhook_url": WEBHOOK_URL,
+        # Telegram echoes it in X-Telegram-Bot-Api-Secret-Token; other requests get 403
+        "secret_token": WEBHOOK_SECRET or secrets.token_urlsafe(32),
+        "max_connections": WEBHOOK_MAX_CONNECTIONS,
+    }
+
+def main():
+    if not TOKEN:
+        print("❌ HATA: CLAWNBOT_TOKEN environment variable bulunamadı!", flush=True)
+        return
+    log_timing("Module loaded", BOOT_T0)
+
+    # Create the application configuration
+    app = build_application()
+
+    # Run the bot
+    if WEBHOOK_URL:
+        try:
+            import tornado  # noqa: F401  PTB's webhook server
+        except ImportError:
+            print("⚠️ Webhook needs python-telegram-bot[webhooks] (tornado); falling back to polling.", flush=True)
+        else:
+            try:
+                print(f"🌐 Webhook mode: {WEBHOOK_URL}", flush=True)
+                # Keep the loop open so polling can take over if setWebhook/bind fails
+                app.run_webhook(close_loop=False, **webhook_settings())
+                return
+            except Exception as e:
+                logger.error(f"Webhook failed to start: {e}")
+                print("⚠️ Webhook unavailable, falling back to polling.", flush=True)
+    # run_polling() removes any webhook left registered with Telegram
     app.run_polling()
 
 async def term_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -361,48 +1065,151 @@ async def term_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Ideally: allowed_id = int(os.environ.get("ALLOWED_TELEGRAM_ID"))
     
     if not context.args:
-        await update.message.reply_text("Kullanım: /term <komut>\nÖrn: /term ls -la")
+        await update.message.reply_text(
+            "Kullanım: /term <komut>\nÖrn: /term ls -la\n"
+            "• /term -f <komut> - Çıktıyı canlı gösterir (tail -f vb.)\n"
+            "• /term jobs - Komutları listeler\n"
+            "• /term kill <id> - Komutu durdurur"
+        )
+        return
+
+    chat_id = update.effective_chat.id
+
+    # /term jobs - list this chat's commands, /term kill <id> - cancel one
+    if context.args == ["jobs"]:
+        jobs = command_runner.jobs_for(chat_id)
+        if not jobs:
+            await update.message.reply_text("📭 Komut yok.")
+            return
+        msg = "🖥️ Komutlar:\n"
+        for j in jobs[-10:]:
+            msg += f"• #{j.id} [{j.state}, {j.duration:.1f}s] {j.command[:60]}\n"
+        await update.message.reply_text(msg)
+        return
+
+    if len(context.args) == 2 and context.args[0] == "kill" and context.args[1].lstrip("#").isdigit():
+        job_id = int(context.args[1].lstrip("#"))
+        if command_runner.kill(job_id, chat_id=chat_id):
+            await update.message.reply_text(f"🛑 Komut #{job_id} durduruldu.")
+        else:
+            await update.message.reply_text(f"❌ Çalışan komut bulunamadı: #{job_id}")
+        return
+
+    # /term -f <komut> streams output into one message that is edited as it arrives
+    if context.args[0] == "-f" and len(context.args) > 1:
+        command = " ".join(context.args[1:])
+        context.application.create_task(
+            stream_command_and_reply(update, command, "📡 Canlı:"), update=update
+        )
         return
 
     command = " ".join(context.args)
-    
-    await update.message.reply_text(f"💻 Çalıştırılıyor: `{command}`", parse_mode='Markdown')
-    
+
+    # Using shell=True is dangerous but requested for "terminal usage".
+    # The command runs in the background; /term kill can reach it meanwhile.
+    context.application.create_task(
+        run_command_and_reply(update, command, "💻 Çalıştırılıyor:"), update=update
+    )
+
+def format_command_result(job: CommandJob) -> str:
+    """Builds the Telegram reply for a finished command."""
+    # The ring buffers keep the tail of the output, which is the useful part for logs
+    output = job.stdout.getvalue()
+    error = job.stderr.getvalue()
+
+    response = ""
+    if job.cancelled:
+        response += f"🛑 Komut #{job.id} iptal edildi.\n"
+    elif job.timed_out:
+        response += f"❌ Zaman aşımı ({int(job.timeout)}s).\n"
+    if output:
+        response += f"📄 **Çıktı:**\n```\n{output[-3000:]}\n```" # Truncate for Telegram limit
+    if error:
+        response += f"\n⚠️ **Hata:**\n```\n{error[-1000:]}\n```"
+
+    if not response:
+        response = "✅ Komut çalıştı (Çıktı yok)."
+    return response
+
+async def run_command_and_reply(update: Update, command: str, header: str):
+    """Runs a shell command on the shared runner and replies with its output."""
+    chat_id = update.effective_chat.id
+
+    async def announce(job: CommandJob):
+        # Plain text: backticks, _ or * in the command would break Markdown parsing
+        await update.message.reply_text(f"{header} {command} (#{job.id})")
+
     try:
-        # Run command
-        # Capture output
-        import subprocess
-        
-        # Enforce CWD as workspace root if needed, or rely on script loc
-        # Using shell=True is dangerous but requested for "terminal usage"
-        
-        proc = subprocess.run(
-            command, 
-            shell=True, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=30 # 30s timeout
+        job = await command_runner.run(chat_id, command, on_start=announce)
+        await update.message.reply_text(format_command_result(job), parse_mode='Markdown')
+    except CommandQueueFull:
+        await update.message.reply_text("⏳ Çok fazla bekleyen komut var, biraz sonra tekrar dene.")
+    except Exception as e:
+        await update.message.reply_text(f"❌ Komut Hatası: {str(e)}")
+
+
+def render_stream(header: str, job: CommandJob, tail: RingBuffer, done: bool = False) -> str:
+    """HTML body of a streaming command message: status line plus the latest output."""
+    if not done:
+        status = f"⏳ {job.duration:.0f}s"
+    elif job.cancelled or job.timed_out:
+        status = f"🛑 {job.state}"
+    else:
+        status = f"✅ çıkış kodu {job.returncode}"
+    head = f"{header} <code>{html.escape(job.command[:200])}</code> (#{job.id}) {status}\n"
+    body = tail.getvalue()[-STREAM_TAIL_CHARS:] or "(çıktı yok)"
+    truncated = tail.truncated
+    # Escaping can grow the output several times (< is &lt;): drop the oldest output
+    # until the escaped body fits, so the message is never cut inside an entity or </pre>
+    room = MAX_MESSAGE_CHARS - len(head) - len("<pre>…\n</pre>")
+    escaped = html.escape(body)
+    if len(escaped) > room:
+        size, start = 0, len(body)
+        while start > 0 and size + len(html.escape(body[start - 1])) <= room:
+            start -= 1
+            size += len(html.escape(body[start]))
+        escaped = html.escape(body[start:])
+        truncated = True
+    prefix = "…\n" if truncated else ""
+    return f"{head}<pre>{prefix}{escaped}</pre>"
+
+async def stream_command_and_reply(update: Update, command: str, header: str):
+    """Runs a command and streams its output into a single, periodically edited message."""
+    chat_id = update.effective_chat.id
+    # Only the tail is kept in memory for display; the full output spills to disk
+    tail = RingBuffer(STREAM_TAIL_CHARS)
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    live: Optional[LiveMessage] = None
+
+    async def on_start(job: CommandJob):
+        nonlocal live
+        msg = await update.message.reply_text(render_stream(header, job, tail), parse_mode='HTML')
+        live = LiveMessage(msg, min_interval=STREAM_EDIT_INTERVAL, parse_mode='HTML')
+
+    async def on_output(job: CommandJob, stream: str, data: bytes):
+        tail.write(data)
+        if spool.tell() < STREAM_DOC_LIMIT:
+            spool.write(data)
+        live.update(render_stream(header, job, tail))
+
+    try:
+        job = await command_runner.run(
+            chat_id, command, timeout=STREAM_TIMEOUT, on_output=on_output, on_start=on_start
         )
-        
-        output = proc.stdout
-        error = proc.stderr
-        
-        response = ""
-        if output:
-            response += f"📄 **Çıktı:**\n```\n{output[:3000]}\n```" # Truncate for Telegram limit
-        if error:
-            response += f"\n⚠️ **Hata:**\n```\n{error[:1000]}\n```"
-            
-        if not response:
-            response = "✅ Komut çalıştı (Çıktı yok)."
-            
-        await update.message.reply_text(response, parse_mode='Markdown')
-        
-    except subprocess.TimeoutExpired:
-        await update.message.reply_text("❌ Zaman aşımı (30s).")
+        await live.close(render_stream(header, job, tail, done=True))
+
+        if tail.truncated:
+            spool.seek(0)
+            await update.message.reply_document(
+                document=InputFile(spool.read(), filename=f"term-{job.id}.txt"),
+                caption=f"📄 Tam çıktı (#{job.id}, {tail.total} bayt)",
+            )
+    except CommandQueueFull:
+        await update.message.reply_text("⏳ Çok fazla bekleyen komut var, biraz sonra tekrar dene.")
     except Exception as e:
-        await update.message.reply_text(f"❌ Hata: {str(e)}")
+        await update.message.reply_text(f"❌ Komut Hatası: {str(e)}")
+    finally:
+        spool.close()
 
 
 if __name__ == "__main__":
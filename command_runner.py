@@ -0,0 +1,237 @@
+"""
+command_runner.py - Shared async shell command engine.
+
+Used by /term and the AI "CMD:" branch of clawnbot so a slow command never
+blocks the event loop (polling, other chats and scheduled reminders keep going).
+
+- Global concurrency limit across all chats
+- Per-chat FIFO queue: a chat's commands run one after another
+- Cancellation by job id (/term kill <id>), kills the whole process group
+- Output is captured into bounded ring buffers, never held in full
+"""
+import os
+import signal
+import asyncio
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import metrics
+
+READ_CHUNK = 4096
+
+COMMAND_SECONDS = metrics.histogram("clawnbot_command_seconds", "Shell command run time", ["outcome"])
+
+
+class CommandQueueFull(Exception):
+    """Raised when a chat already has too many commands waiting."""
+
+
+class RingBuffer:
+    """Keeps only the last `limit` bytes written to it."""
+
+    def __init__(self, limit: int = 64 * 1024):
+        self.limit = limit
+        self.total = 0  # bytes ever written
+        self._chunks: deque = deque()
+        self._size = 0
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.total += len(data)
+        if len(data) >= self.limit:
+            self._chunks.clear()
+            self._chunks.append(data[-self.limit:])
+            self._size = self.limit
+            return
+        self._chunks.append(data)
+        self._size += len(data)
+        while self._size > self.limit:
+            head = self._chunks[0]
+            overflow = self._size - self.limit
+            if len(head) <= overflow:
+                self._chunks.popleft()
+                self._size -= len(head)
+            else:
+                self._chunks[0] = head[overflow:]
+                self._size -= overflow
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > self._size
+
+    def getvalue(self) -> str:
+        return b"".join(self._chunks).decode("utf-8", errors="replace")
+
+    def __len__(self) -> int:
+        return self._size
+
+
+# on_output(job, stream_name, data) is awaited for every chunk read
+OutputCallback = Callable[["CommandJob", str, bytes], Awaitable[None]]
+
+
+@dataclass
+class CommandJob:
+    id: int
+    chat_id: int
+    command: str
+    timeout: float
+    stdout: RingBuffer
+    stderr: RingBuffer
+    queued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    returncode: Optional[int] = None
+    timed_out: bool = False
+    cancelled: bool = False
+    _proc: Optional[asyncio.subprocess.Process] = field(default=None, repr=False)
+
+    @property
+    def state(self) -> str:
+        if self.cancelled:
+            return "iptal"
+        if self.timed_out:
+            return "zaman aşımı"
+        if self.finished_at is not None:
+            return "bitti"
+        if self.started_at is not None:
+            return "çalışıyor"
+        return "sırada"
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class CommandRunner:
+    """Runs shell commands with a global limit and per-chat ordering."""
+
+    def __init__(self, max_concurrent: int = 4, max_queued_per_chat: int = 5,
+                 buffer_limit: int = 64 * 1024, default_timeout: float = 30,
+                 keep_finished: int = 50):
+        self.max_queued_per_chat = max_queued_per_chat
+        self.buffer_limit = buffer_limit
+        self.default_timeout = default_timeout
+        self.jobs: Dict[int, CommandJob] = {}
+        self._ids = itertools.count(1)
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._finished: deque = deque(maxlen=keep_finished)
+
+    def jobs_for(self, chat_id: int) -> List[CommandJob]:
+        return [j for j in self.jobs.values() if j.chat_id == chat_id]
+
+    def pending_for(self, chat_id: int) -> int:
+        return sum(1 for j in self.jobs_for(chat_id) if j.finished_at is None)
+
+    def stats(self) -> Dict[str, float]:
+        running = sum(1 for j in self.jobs.values() if j.started_at is not None and j.finished_at is None)
+        waiting = sum(1 for j in self.jobs.values() if j.started_at is None and j.finished_at is None)
+        return {"running": running, "queued": waiting}
+
+    async def run(self, chat_id: int, command: str, timeout: Optional[float] = None,
+                  on_output: Optional[OutputCallback] = None,
+                  on_start: Optional[Callable[[CommandJob], Awaitable[None]]] = None) -> CommandJob:
+        """Queues `command` for `chat_id` and waits until it has finished."""
+        if self.pending_for(chat_id) >= self.max_queued_per_chat:
+            raise CommandQueueFull(f"{chat_id} için kuyrukta {self.max_queued_per_chat} komut var")
+
+        job = CommandJob(
+            id=next(self._ids),
+            chat_id=chat_id,
+            command=command,
+            timeout=timeout or self.default_timeout,
+            stdout=RingBuffer(self.buffer_limit),
+            stderr=RingBuffer(self.buffer_limit),
+        )
+        self.jobs[job.id] = job
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        try:
+            # Inside the try: a failing on_start (e.g. the announce reply) still retires the job
+            if on_start:
+                await on_start(job)
+            async with lock, self._semaphore:
+                if not job.cancelled:
+                    await self._execute(job, on_output)
+        finally:
+            job.finished_at = job.finished_at or time.monotonic()
+            self._retire(job)
+            if not lock.locked() and not self.pending_for(chat_id):
+                self._chat_locks.pop(chat_id, None)
+        return job
+
+    async def _execute(self, job: CommandJob, on_output: Optional[OutputCallback]):
+        job.started_at = time.monotonic()
+        proc = await asyncio.create_subprocess_shell(
+            job.command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,  # own process group, so kill reaches children of the shell
+        )
+        job._proc = proc
+
+        async def pump(stream, buffer: RingBuffer, name: str):
+            while True:
+                data = await stream.read(READ_CHUNK)
+                if not data:
+                    break
+                buffer.write(data)
+                if on_output:
+                    await on_output(job, name, data)
+
+        async def drain() -> int:
+            await asyncio.gather(
+                pump(proc.stdout, job.stdout, "stdout"),
+                pump(proc.stderr, job.stderr, "stderr"),
+            )
+            return await proc.wait()
+
+        task = asyncio.ensure_future(drain())
+        try:
+            job.returncode = await asyncio.wait_for(asyncio.shield(task), timeout=job.timeout)
+        except asyncio.TimeoutError:
+            job.timed_out = True
+            self._kill(proc)
+            job.returncode = await task
+        except asyncio.CancelledError:
+            self._kill(proc)
+            raise
+        finally:
+            job.finished_at = time.monotonic()
+            job._proc = None
+            outcome = ("cancelled" if job.cancelled else "timeout" if job.timed_out
+                       else "ok" if job.returncode == 0 else "error")
+            COMMAND_SECONDS.observe(job.duration, outcome)
+
+    def kill(self, job_id: int, chat_id: Optional[int] = None) -> bool:
+        """Cancels a queued or running job. Returns False if it doesn't exist or isn't owned by chat_id."""
+        job = self.jobs.get(job_id)
+        if not job or job.finished_at is not None:
+            return False
+        if chat_id is not None and job.chat_id != chat_id:
+            return False
+        job.cancelled = True
+        if job._proc:
+            self._kill(job._proc)
+        return True
+
+    @staticmethod
+    def _kill(proc: asyncio.subprocess.Process):
+        if proc.returncode is not None:
+            return
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _retire(self, job: CommandJob):
+        # Finished jobs stay visible in `jobs` for a while (for /term jobs), bounded by keep_finished.
+        if len(self._finished) == self._finished.maxlen:
+            self.jobs.pop(self._finished[0].id, None)
+        self._finished.append(job)
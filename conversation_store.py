@@ -0,0 +1,218 @@
+"""
+conversation_store.py - Per-chat conversation memory for the AI chat.
+
+Turns are kept in SQLite (conversations.sqlite, next to jobs.sqlite) under a
+per-chat token budget. When a chat goes over budget its oldest turns are
+folded into a rolling summary, so the prompt stays bounded no matter how long
+the conversation runs. Hot chats are cached in a small in-memory LRU; chats
+idle longer than the TTL, or beyond max_chats, are evicted from disk.
+
+prune() runs in a worker thread; every method that touches the connection or
+the cache takes the store's lock, so it never interleaves with the event loop.
+"""
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from llm import estimate_tokens
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at FLOAT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_chat_turns_chat_id ON chat_turns (chat_id, id);
+CREATE TABLE IF NOT EXISTS chat_summaries (
+    chat_id INTEGER PRIMARY KEY,
+    summary TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    updated_at FLOAT NOT NULL
+);
+"""
+
+# summarizer(previous_summary, [(role, text), ...]) -> new summary
+Summarizer = Callable[[str, List[Tuple[str, str]]], str]
+
+
+@dataclass
+class Turn:
+    id: int
+    role: str  # "user" or "assistant"
+    text: str
+    tokens: int
+
+
+@dataclass
+class ChatState:
+    summary: str = ""
+    summary_tokens: int = 0
+    turns: List[Turn] = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        return self.summary_tokens + sum(t.tokens for t in self.turns)
+
+
+def extractive_summary(previous: str, turns: List[Tuple[str, str]], max_tokens: int = 300) -> str:
+    """Model-free fallback: first line of each folded turn, trimmed to max_tokens."""
+    lines = [previous] if previous else []
+    for role, text in turns:
+        first = text.strip().splitlines()[0] if text.strip() else ""
+        lines.append(f"{'Kullanıcı' if role == 'user' else 'Asistan'}: {first[:160]}")
+    summary = "\n".join(lines)
+    limit = max_tokens * 4
+    return summary[-limit:] if len(summary) > limit else summary
+
+
+class ConversationStore:
+    """Token-budgeted chat history with rolling summaries."""
+
+    def __init__(self, path: str = "conversations.sqlite", budget_tokens: int = 1500,
+                 summary_tokens: int = 300, ttl: float = 7 * 86400, max_chats: int = 500,
+                 cache_size: int = 64):
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.cache_size = cache_size
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._cache: "OrderedDict[int, ChatState]" = OrderedDict()
+        self._folding = set()
+        self._lock = threading.RLock()
+
+    def _state(self, chat_id: int) -> ChatState:
+        state = self._cache.get(chat_id)
+        if state is not None:
+            self._cache.move_to_end(chat_id)
+            return state
+        state = ChatState()
+        row = self.conn.execute(
+            "SELECT summary, tokens FROM chat_summaries WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row:
+            state.summary, state.summary_tokens = row
+        state.turns = [Turn(*r) for r in self.conn.execute(
+            "SELECT id, role, text, tokens FROM chat_turns WHERE chat_id = ? ORDER BY id", (chat_id,)
+        )]
+        self._cache[chat_id] = state
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return state
+
+    def append(self, chat_id: int, role: str, text: str):
+        with self._lock:
+            tokens = estimate_tokens(text)
+            cursor = self.conn.execute(
+                "INSERT INTO chat_turns (chat_id, role, text, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, role, text, tokens, time.time()),
+            )
+            self._state(chat_id).turns.append(Turn(cursor.lastrowid, role, text, tokens))
+
+    def render(self, chat_id: int) -> str:
+        """Summary and recent turns as a prompt prefix ('' for a new chat)."""
+        with self._lock:
+            state = self._state(chat_id)
+            parts = []
+            if state.summary:
+                parts.append(f"CONVERSATION SUMMARY:\n{state.summary}")
+            if state.turns:
+                lines = [f"{'USER' if t.role == 'user' else 'ASSISTANT'}: {t.text}" for t in state.turns]
+                parts.append("RECENT TURNS:\n" + "\n".join(lines))
+            return "\n\n".join(parts)
+
+    def needs_fold(self, chat_id: int) -> bool:
+        with self._lock:
+            return chat_id not in self._folding and self._state(chat_id).tokens > self.budget_tokens
+
+    def take_for_fold(self, chat_id: int) -> Optional[Tuple[str, List[Turn]]]:
+        """Marks the chat as folding and returns (summary, oldest turns to fold)."""
+        with self._lock:
+            if not self.needs_fold(chat_id):
+                return None
+            state = self._state(chat_id)
+            # Fold until the recent turns use at most half the budget
+            keep_tokens = self.budget_tokens // 2
+            kept, folded = 0, len(state.turns)
+            for i in range(len(state.turns) - 1, -1, -1):
+                kept += state.turns[i].tokens
+                if kept > keep_tokens:
+                    break
+                folded = i
+            folded = max(folded, 1)  # always make progress
+            self._folding.add(chat_id)
+            return state.summary, state.turns[:folded]
+
+    def apply_fold(self, chat_id: int, folded: List[Turn], summary: str):
+        """Replaces the folded turns with the new summary."""
+        with self._lock:
+            state = self._state(chat_id)
+            limit = self.summary_tokens * 4
+            summary = summary[-limit:] if len(summary) > limit else summary
+            last_id = folded[-1].id
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.execute("DELETE FROM chat_turns WHERE chat_id = ? AND id <= ?", (chat_id, last_id))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO chat_summaries (chat_id, summary, tokens, updated_at) VALUES (?, ?, ?, ?)",
+                    (chat_id, summary, estimate_tokens(summary), time.time()),
+                )
+            state.summary, state.summary_tokens = summary, estimate_tokens(summary)
+            state.turns = [t for t in state.turns if t.id > last_id]
+            self._folding.discard(chat_id)
+
+    def cancel_fold(self, chat_id: int):
+        with self._lock:
+            self._folding.discard(chat_id)
+
+    def fold(self, chat_id: int, summarizer: Optional[Summarizer] = None) -> bool:
+        """Synchronous fold (summarizer called inline); returns True if anything was folded."""
+        taken = self.take_for_fold(chat_id)
+        if not taken:
+            return False
+        previous, turns = taken
+        pairs = [(t.role, t.text) for t in turns]
+        try:
+            try:
+                summary = summarizer(previous, pairs) if summarizer else extractive_summary(previous, pairs, self.summary_tokens)
+            except Exception:
+                summary = extractive_summary(previous, pairs, self.summary_tokens)
+            self.apply_fold(chat_id, turns, summary)
+        except BaseException:
+            self.cancel_fold(chat_id)
+            raise
+        return True
+
+    def clear(self, chat_id: int):
+        with self._lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.execute("DELETE FROM chat_turns WHERE chat_id = ?", (chat_id,))
+                self.conn.execute("DELETE FROM chat_summaries WHERE chat_id = ?", (chat_id,))
+            self._cache.pop(chat_id, None)
+
+    def prune(self) -> int:
+        """Evicts chats idle longer than ttl, and the least recently active beyond max_chats."""
+        with self._lock:
+            cutoff = time.time() - self.ttl
+            activity = self.conn.execute(
+                "SELECT chat_id, MAX(ts) FROM ("
+                "  SELECT chat_id, created_at AS ts FROM chat_turns"
+                "  UNION ALL SELECT chat_id, updated_at AS ts FROM chat_summaries"
+                ") GROUP BY chat_id ORDER BY MAX(ts) DESC"
+            ).fetchall()
+            evict = [(chat_id,) for i, (chat_id, ts) in enumerate(activity) if ts < cutoff or i >= self.max_chats]
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("DELETE FROM chat_turns WHERE chat_id = ?", evict)
+                self.conn.executemany("DELETE FROM chat_summaries WHERE chat_id = ?", evict)
+            for (chat_id,) in evict:
+                self._cache.pop(chat_id, None)
+            return len(evict)
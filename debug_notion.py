@@ -1,12 +1,13 @@
 import os
-import requests
-import json
+import asyncio
 from dotenv import load_dotenv
 
+from notion_client import NotionClient, NotionError, title_of
+
 # Load env
 load_dotenv()
 
-def verify_notion():
+async def verify_notion():
     print("📘 Checking Notion Access...")
     
     token = os.getenv("NOTION_API_KEY")
@@ -14,53 +15,24 @@ def verify_notion():
         print("❌ Error: NOTION_API_KEY not found in .env")
         return
 
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Notion-Version": "2022-06-28",
-        "Content-Type": "application/json"
-    }
-    
     try:
-        # Search endpoint matches all pages bot has access to
-        url = "https://api.notion.com/v1/search"
-        payload = {"page_size": 5}
-        
-        response = requests.post(url, headers=headers, json=payload)
+        # Search endpoint matches all pages bot has access to; follows next_cursor across pages
+        async with NotionClient(token) as notion:
+            results = [item async for item in notion.search(page_size=100)]
+        print(f"✅ Connection Successful!")
+        print(f"📄 Accessible Objects: {len(results)}")
         
-        if response.status_code == 200:
-            data = response.json()
-            results = data.get("results", [])
-            print(f"✅ Connection Successful!")
-            print(f"📄 Accessible Objects: {len(results)}")
-            
-            if not results:
-                print("\n⚠️  No pages found! (You need to 'Add Connection' > 'Ece' in Notion pages)")
-            else:
-                for item in results:
-                    obj_type = item.get("object")
-                    title = "Untitled"
-                    if obj_type == "page":
-                        props = item.get("properties", {})
-                        # Try to find title in various property types
-                        for key, val in props.items():
-                            if val.get("id") == "title":
-                                title_list = val.get("title", [])
-                                if title_list:
-                                    title = title_list[0].get("plain_text", "Untitled")
-                                break
-                    elif obj_type == "database":
-                         title_list = item.get("title", [])
-                         if title_list:
-                             title = title_list[0].get("plain_text", "Untitled")
-                    
-                    print(f"   - [{obj_type.upper()}] {title}")
-                    
+        if not results:
+            print("\n⚠️  No pages found! (You need to 'Add Connection' > 'Ece' in Notion pages)")
         else:
-            print(f"❌ Connection Failed: {response.status_code}")
-            print(response.text)
-            
+            for item in results:
+                print(f"   - [{item.get('object', '').upper()}] {title_of(item)}")
+                
+    except NotionError as e:
+        print(f"❌ Connection Failed: {e.status}")
+        print(e)
     except Exception as e:
         print(f"❌ Error: {e}")
 
 if __name__ == "__main__":
-    verify_notion()
+    asyncio.run(verify_notion())
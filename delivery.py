@@ -0,0 +1,320 @@
+"""
+delivery.py - Rate-limit-aware delivery queue for scheduled reminders.
+
+Scheduled jobs don't talk to Telegram directly; they enqueue here. The queue:
+
+- paces sends with token buckets: one global (Telegram allows ~30 msg/s per
+  bot) and one per chat (~1 msg/s sustained),
+- merges reminders for the same chat that are due within the same second
+  into one message, so a 09:00 batch for one user is one message, not ten,
+- retries 429s after the `retry_after` Telegram asks for, and network errors
+  with exponential backoff; permanent errors (blocked bot, chat not found)
+  are dropped,
+- persists every pending delivery in SQLite (jobs.sqlite) until it is sent,
+  so reminders that fired right before a restart are still delivered.
+"""
+import time
+import asyncio
+import logging
+import sqlite3
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+import metrics
+from live_message import retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_LAG_SECONDS = metrics.histogram("clawnbot_delivery_lag_seconds", "Reminder due time to Telegram acceptance")
+SEND_ERRORS = metrics.counter("clawnbot_send_errors", "Failed reminder sends", ["reason"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    due_at FLOAT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before FLOAT NOT NULL DEFAULT 0
+);
+"""
+
+# send(chat_id, messages) delivers one or more merged reminders as a single Telegram message
+Sender = Callable[[int, List[str]], Awaitable[None]]
+
+
+@dataclass
+class Delivery:
+    id: int
+    chat_id: int
+    message: str
+    due_at: float  # wall-clock time the reminder was due
+    attempts: int = 0
+    not_before: float = 0.0  # wall-clock time before which it must not be retried
+
+
+class TokenBucket:
+    """Classic token bucket on the monotonic clock."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # set by a 429
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Seconds until one token is available (0 if now)."""
+        now = now or time.monotonic()
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self, now: Optional[float] = None):
+        self._refill(now or time.monotonic())
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0)
+
+    @property
+    def idle(self) -> bool:
+        return self.delay() == 0 and self.tokens >= self.capacity
+
+
+class DeliveryQueue:
+    """Persistent per-chat queues drained round-robin within global and per-chat limits."""
+
+    def __init__(self, send: Sender, path: str = "jobs.sqlite", global_rate: float = 25.0,
+                 global_burst: float = 5.0, chat_rate: float = 1.0, chat_burst: float = 1.0, concurrency: int = 16,
+                 merge_window: float = 1.0, linger: float = 0.05, max_attempts: int = 5,
+                 max_merged_chars: int = 3500):
+        self.send = send
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.merge_window = merge_window
+        self.linger = linger  # lets reminders fired in the same scheduler pass land before merging
+        self.max_attempts = max_attempts
+        self.max_merged_chars = max_merged_chars
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        # Small bursts: a full bucket plus its refill must stay under the per-second limits
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._queues: "OrderedDict[int, Deque[Delivery]]" = OrderedDict()
+        self._in_flight: Set[int] = set()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # metrics
+        self.enqueued = 0
+        self.sent_messages = 0
+        self.sent_reminders = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    @property
+    def idle(self) -> bool:
+        """Nothing queued and nothing being sent (so no writes to the deliveries table)."""
+        return not self._queues and not self._in_flight
+
+    async def wait_idle(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.idle:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    def load(self) -> int:
+        """Queues deliveries left over from the previous run. Call before start()."""
+        rows = self.conn.execute(
+            "SELECT id, chat_id, message, due_at, attempts, not_before FROM deliveries ORDER BY id"
+        ).fetchall()
+        for row in rows:
+            self._queues.setdefault(row[1], deque()).append(Delivery(*row))
+        return len(rows)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def enqueue(self, chat_id: int, message: str, due_at: Optional[float] = None) -> Delivery:
+        due_at = due_at or time.time()
+        cursor = self.conn.execute(
+            "INSERT INTO deliveries (chat_id, message, due_at) VALUES (?, ?, ?)", (chat_id, message, due_at)
+        )
+        delivery = Delivery(cursor.lastrowid, chat_id, message, due_at)
+        self._queues.setdefault(chat_id, deque()).append(delivery)
+        self.enqueued += 1
+        self._wakeup.set()
+        return delivery
+
+    def enqueue_many(self, items: Iterable[Tuple[int, str, float]]) -> int:
+        """Queues (chat_id, message, due_at) items with one transaction."""
+        added = 0
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for chat_id, message, due_at in items:
+                cursor = self.conn.execute(
+                    "INSERT INTO deliveries (chat_id, message, due_at) VALUES (?, ?, ?)", (chat_id, message, due_at)
+                )
+                self._queues.setdefault(chat_id, deque()).append(Delivery(cursor.lastrowid, chat_id, message, due_at))
+                added += 1
+        self.enqueued += added
+        self._wakeup.set()
+        return added
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _pick(self) -> Tuple[Optional[int], Optional[float]]:
+        """Next chat that may send now (round-robin), or the seconds until one can."""
+        now_wall, now = time.time(), time.monotonic()
+        soonest = None
+        for chat_id, queue in self._queues.items():
+            if chat_id in self._in_flight:
+                continue
+            head = queue[0]
+            wait = max(head.not_before - now_wall, head.due_at + self.linger - now_wall, self._bucket(chat_id).delay(now))
+            if wait <= 0:
+                self._queues.move_to_end(chat_id)  # back of the rotation
+                return chat_id, 0.0
+            soonest = wait if soonest is None else min(soonest, wait)
+        return None, soonest
+
+    def _take_batch(self, chat_id: int) -> List[Delivery]:
+        """Head of the chat's queue plus the reminders due within merge_window of it."""
+        queue = self._queues[chat_id]
+        batch = [queue.popleft()]
+        size = len(batch[0].message)
+        while queue and queue[0].due_at - batch[0].due_at < self.merge_window \
+                and size + len(queue[0].message) < self.max_merged_chars:
+            size += len(queue[0].message)
+            batch.append(queue.popleft())
+        if not queue:
+            del self._queues[chat_id]
+        return batch
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            while True:
+                chat_id, wait = self._pick()
+                if chat_id is not None:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            global_wait = self.global_bucket.delay()
+            if global_wait > 0:
+                self._slots.release()
+                await asyncio.sleep(global_wait)
+                continue
+            self.global_bucket.take()
+            self._bucket(chat_id).take()
+            self._in_flight.add(chat_id)
+            asyncio.create_task(self._deliver(chat_id, self._take_batch(chat_id)))
+
+    async def _deliver(self, chat_id: int, batch: List[Delivery]):
+        try:
+            await self.send(chat_id, [d.message for d in batch])
+        except RetryAfter as e:
+            SEND_ERRORS.inc("rate_limited")
+            self.rate_limited += 1
+            self._bucket(chat_id).block(retry_after_seconds(e))
+            self._requeue(chat_id, batch, delay=retry_after_seconds(e), count_attempt=False)
+        except (Forbidden, BadRequest) as e:
+            # Blocked bot / chat not found: retrying won't help
+            SEND_ERRORS.inc("forbidden" if isinstance(e, Forbidden) else "bad_request")
+            logger.warning(f"Reminder to {chat_id} dropped: {e}")
+            self._done(batch)
+            self.dropped += len(batch)
+        except NetworkError as e:
+            SEND_ERRORS.inc("network")
+            self._requeue(chat_id, batch, delay=min(60.0, 2 ** batch[0].attempts), count_attempt=True, error=e)
+        except Exception as e:
+            SEND_ERRORS.inc("other")
+            logger.error(f"Reminder to {chat_id} failed: {e}")
+            self._requeue(chat_id, batch, delay=min(60.0, 2 ** batch[0].attempts), count_attempt=True, error=e)
+        else:
+            sent_at = time.time()
+            for d in batch:
+                DELIVERY_LAG_SECONDS.observe(sent_at - d.due_at)
+            self._done(batch)
+            self.sent_messages += 1
+            self.sent_reminders += len(batch)
+        finally:
+            self._in_flight.discard(chat_id)
+            bucket = self._chat_buckets.get(chat_id)
+            if chat_id not in self._queues and bucket is not None and bucket.idle:
+                del self._chat_buckets[chat_id]  # idle chats cost nothing
+            self._slots.release()
+            self._wakeup.set()
+
+    def _done(self, batch: List[Delivery]):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM deliveries WHERE id = ?", ((d.id,) for d in batch))
+
+    def _requeue(self, chat_id: int, batch: List[Delivery], delay: float, count_attempt: bool,
+                 error: Optional[Exception] = None):
+        not_before = time.time() + delay
+        keep, give_up = [], []
+        for d in batch:
+            d.attempts += 1 if count_attempt else 0
+            d.not_before = not_before
+            (give_up if d.attempts >= self.max_attempts else keep).append(d)
+        if give_up:
+            logger.error(f"Reminder to {chat_id} dropped after {self.max_attempts} attempts: {error}")
+            self._done(give_up)
+            self.dropped += len(give_up)
+        if keep:
+            self.retried += len(keep)
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany(
+                    "UPDATE deliveries SET attempts = ?, not_before = ? WHERE id = ?",
+                    ((d.attempts, d.not_before, d.id) for d in keep),
+                )
+            # Back to the front: keeps this chat's reminders in order
+            self._queues.setdefault(chat_id, deque()).extendleft(reversed(keep))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pending": self.pending,
+            "pending_chats": len(self._queues),
+            "enqueued": self.enqueued,
+            "sent_messages": self.sent_messages,
+            "sent_reminders": self.sent_reminders,
+            "retried": self.retried,
+            "rate_limited": self.rate_limited,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,216 @@
+"""
+heartbeat.py - Periodic health checks declared in HEARTBEAT.md.
+
+Each check is a list item naming a shell command and how often to run it:
+
+    - screener: `pgrep -f app_cloud_run` her 5 dakika
+    - port 5001: `lsof -i :5001` every 2m timeout 5s
+
+A check passes when its command exits 0. Every check is an interval job on
+the bot's scheduler (memory jobstore), so checks with different intervals run
+independently and concurrently, each under its own timeout, on a dedicated
+CommandRunner. An alert is sent only when a check's state changes (or it
+fails the first time); /status answers from the cached last results without
+spawning anything. HEARTBEAT.md is re-read when it changes on disk.
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from command_runner import CommandRunner
+
+logger = logging.getLogger(__name__)
+
+JOB_PREFIX = "heartbeat:"
+UNITS = {
+    "s": 1, "sn": 1, "sec": 1, "saniye": 1,
+    "m": 60, "min": 60, "dk": 60, "dakika": 60,
+    "h": 3600, "sa": 3600, "saat": 3600, "hour": 3600,
+}
+DURATION = r"(\d+)\s*(saniye|dakika|saat|hour|sec|min|sn|dk|sa|s|m|h)\b"
+CHECK_LINE = re.compile(r"^[-*]\s+(?P<name>[^:`]+?)\s*:\s*`(?P<command>[^`]+)`(?P<rest>.*)$")
+EVERY = re.compile(r"(?:every|her)\s+" + DURATION, re.IGNORECASE)
+TIMEOUT = re.compile(r"timeout\s+" + DURATION, re.IGNORECASE)
+
+
+@dataclass
+class Check:
+    name: str
+    command: str
+    interval: float  # seconds
+    timeout: float
+
+
+@dataclass
+class CheckResult:
+    ok: bool
+    output: str  # tail of stdout/stderr
+    returncode: Optional[int]
+    duration: float
+    checked_at: float  # wall clock
+    since: float  # wall clock of the last state change
+    timed_out: bool = False
+
+
+def _seconds(match) -> float:
+    return int(match.group(1)) * UNITS[match.group(2).lower()]
+
+
+def parse_heartbeat(text: str, default_interval: float = 300, default_timeout: float = 10) -> List[Check]:
+    """Checks declared as list items; headings, comments and other lines are ignored."""
+    checks, seen = [], set()
+    for line in text.splitlines():
+        match = CHECK_LINE.match(line.strip())
+        if not match:
+            continue
+        name = match.group("name").strip()
+        if name in seen:
+            logger.warning(f"HEARTBEAT.md: duplicate check {name!r} ignored")
+            continue
+        seen.add(name)
+        rest = match.group("rest")
+        every, timeout = EVERY.search(rest), TIMEOUT.search(rest)
+        interval = max(10.0, _seconds(every)) if every else default_interval
+        checks.append(Check(
+            name=name,
+            command=match.group("command").strip(),
+            interval=interval,
+            timeout=min(_seconds(timeout) if timeout else default_timeout, interval),
+        ))
+    return checks
+
+
+class Heartbeat:
+    """Runs HEARTBEAT.md checks on a scheduler and keeps their last results."""
+
+    def __init__(self, alert: Callable[[str], Awaitable[None]], path: str = "HEARTBEAT.md",
+                 concurrency: int = 4, default_interval: float = 300, default_timeout: float = 10,
+                 jobstore: str = "memory"):
+        self.alert = alert
+        self.path = path
+        self.default_interval = default_interval
+        self.default_timeout = default_timeout
+        self.jobstore = jobstore
+        # Own runner: checks never queue behind (or in front of) /term commands
+        self.runner = CommandRunner(max_concurrent=concurrency, default_timeout=default_timeout)
+        self.checks: Dict[str, Check] = {}
+        self.results: Dict[str, CheckResult] = {}
+        self._stat = None
+        self._keys: Dict[str, int] = {}
+
+    def load(self) -> List[Check]:
+        try:
+            st = os.stat(self.path)
+            self._stat = (st.st_mtime_ns, st.st_size)
+            with open(self.path, encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            self._stat = None
+            text = ""
+        return parse_heartbeat(text, self.default_interval, self.default_timeout)
+
+    def schedule(self, scheduler, checks: Optional[List[Check]] = None):
+        """(Re)creates one interval job per check; jobs of removed checks are dropped."""
+        checks = self.load() if checks is None else checks
+        wanted = {check.name: check for check in checks}
+        for name in list(self.checks):
+            if name not in wanted:
+                scheduler.remove_job(JOB_PREFIX + name, jobstore=self.jobstore)
+                self.results.pop(name, None)
+        self.checks = wanted
+        # Per-check runner key: the runner runs one command per key at a time, so
+        # distinct keys let different checks run in parallel
+        self._keys = {name: -(i + 1) for i, name in enumerate(wanted)}
+        for check in checks:
+            scheduler.add_job(
+                self.run_check, "interval", seconds=check.interval, args=[check.name],
+                id=JOB_PREFIX + check.name, name=f"heartbeat {check.name}",
+                jobstore=self.jobstore, replace_existing=True,
+                next_run_time=datetime.now(scheduler.timezone),  # first run right away
+            )
+        return checks
+
+    def reload_if_changed(self, scheduler) -> bool:
+        """Reschedules when HEARTBEAT.md changed on disk (cheap stat otherwise)."""
+        try:
+            st = os.stat(self.path)
+            stat = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat = None
+        if stat == self._stat:
+            return False
+        checks = self.schedule(scheduler)
+        logger.info(f"HEARTBEAT.md changed: {len(checks)} check(s) scheduled")
+        return True
+
+    async def run_check(self, name: str) -> Optional[CheckResult]:
+        check = self.checks.get(name)
+        if check is None:
+            return None
+        job = await self.runner.run(self._keys.get(name, 0), check.command, timeout=check.timeout)
+        output = (job.stdout.getvalue() + job.stderr.getvalue()).strip()
+        now = time.time()
+        previous = self.results.get(name)
+        ok = job.returncode == 0 and not job.timed_out
+        result = CheckResult(
+            ok=ok, output=output[-500:], returncode=job.returncode, duration=job.duration,
+            checked_at=now, since=previous.since if previous and previous.ok == ok else now,
+            timed_out=job.timed_out,
+        )
+        self.results[name] = result
+        # Alert on a state change, and on a first result that is already failing
+        if (previous is None and not ok) or (previous is not None and previous.ok != ok):
+            try:
+                await self.alert(self.format_alert(check, result))
+            except Exception as e:
+                logger.error(f"Heartbeat alert for {name} failed: {e}")
+        return result
+
+    async def run_all(self) -> Dict[str, CheckResult]:
+        """Runs every check now, concurrently."""
+        await asyncio.gather(*(self.run_check(name) for name in self.checks))
+        return dict(self.results)
+
+    @staticmethod
+    def format_alert(check: Check, result: CheckResult) -> str:
+        if result.ok:
+            return f"✅ Düzeldi: {check.name}"
+        reason = f"zaman aşımı ({check.timeout:.0f}s)" if result.timed_out else f"çıkış kodu {result.returncode}"
+        text = f"🚨 Sorun: {check.name} - {reason}\n`{check.command}`"
+        if result.output:
+            text += f"\n{result.output[-300:]}"
+        return text
+
+    def status_text(self) -> str:
+        """Last known state of every check (no commands are run)."""
+        if not self.checks:
+            return "💓 HEARTBEAT.md'de kontrol yok."
+        now = time.time()
+        lines = ["💓 Durum:"]
+        for name, check in self.checks.items():
+            result = self.results.get(name)
+            if result is None:
+                lines.append(f"⏳ {name}: henüz çalışmadı")
+                continue
+            icon = "✅" if result.ok else "🚨"
+            lines.append(f"{icon} {name}: {_ago(now - result.since)} boyunca "
+                         f"{'sağlıklı' if result.ok else 'hatalı'} "
+                         f"(son kontrol {_ago(now - result.checked_at)} önce, {result.duration:.1f}s)")
+        return "\n".join(lines)
+
+    def stats(self) -> Dict[str, float]:
+        failing = sum(1 for r in self.results.values() if not r.ok)
+        return {"checks": len(self.checks), "failing": failing, "running": self.runner.stats()["running"]}
+
+
+def _ago(seconds: float) -> str:
+    if seconds < 90:
+        return f"{seconds:.0f} sn"
+    if seconds < 5400:
+        return f"{seconds / 60:.0f} dk"
+    return f"{seconds / 3600:.1f} sa"
@@ -0,0 +1,382 @@
+"""
+jobstore.py - SQLAlchemy jobstore with batched inserts and compact reminder rows.
+
+SQLAlchemyJobStore.add_job() commits one transaction per job, so importing a
+few hundred reminders means a few hundred fsyncs. Inside `with store.batch():`
+add_job() only queues the row and all queued rows are inserted in a single
+transaction when the block exits. update_jobs()/remove_jobs() do the same for
+bulk changes (startup catch-up).
+
+Reminder jobs (compact_func called with (chat_id, message)) are not pickled:
+chat_id and message go into typed columns of apscheduler_jobs and job_state
+holds a few bytes of JSON with the trigger and the misfire settings. The
+callable, args, name and executor are implied, so a row is a fraction of the
+pickle and loading it skips unpickling the whole Job. Any other job, and rows
+written before this format, stay pickled; compact() rewrites the old rows and
+vacuums the file.
+
+The engine runs SQLite in WAL mode with synchronous=NORMAL, which every other
+connection to jobs.sqlite (reminder index, delivery queue) benefits from too.
+
+Don't await inside a batch: jobs are invisible to the scheduler (and to
+/liste, /iptal) until the block exits.
+"""
+import os
+import json
+import pickle
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from apscheduler.job import Job
+from apscheduler.jobstores.base import ConflictingIdError, JobLookupError
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.util import astimezone, datetime_to_utc_timestamp, ref_to_obj
+from sqlalchemy import (BigInteger, Column, Float, LargeBinary, MetaData, Table, Unicode, UnicodeText,
+                        and_, bindparam, event, select)
+from sqlalchemy.exc import IntegrityError
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",  # durable across crashes of the bot; fsync only at checkpoints
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",  # 16 MB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=67108864",
+)
+COMPACT_BATCH = 500
+_zones: Dict[str, Any] = {}
+
+
+def _zone(name: str):
+    zone = _zones.get(name)
+    if zone is None:
+        zone = _zones[name] = astimezone(name)
+    return zone
+
+
+def _datetime(value: Optional[float], zone) -> Optional[datetime]:
+    return datetime.fromtimestamp(value, zone) if value is not None else None
+
+
+def encode_trigger(trigger, next_run_time: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """Minimal JSON-able state of a date/interval/cron trigger (None for other triggers).
+
+    A date trigger's run date is left out when it equals next_run_time (a pending
+    one-shot), which is stored in its own column anyway: every pending one-shot
+    in a time zone then has the same few-byte state.
+    """
+    kind = type(trigger)
+    if kind not in (DateTrigger, IntervalTrigger, CronTrigger):
+        return None
+    zone = str(trigger.run_date.tzinfo if kind is DateTrigger else trigger.timezone)
+    try:
+        _zone(zone)
+    except Exception:
+        return None  # fixed offset or unnamed zone: keep it pickled
+    if kind is DateTrigger:
+        return {"z": zone} if trigger.run_date == next_run_time else {"d": trigger.run_date.timestamp(), "z": zone}
+    state = {"z": zone}
+    if kind is IntervalTrigger:
+        state["i"] = trigger.interval.total_seconds()
+    else:
+        state["c"] = {field.name: str(field) for field in trigger.fields if not field.is_default}
+    if trigger.start_date is not None:
+        state["s"] = trigger.start_date.timestamp()
+    if trigger.end_date is not None:
+        state["e"] = trigger.end_date.timestamp()
+    if trigger.jitter:
+        state["j"] = trigger.jitter
+    return state
+
+
+def decode_trigger(state: Dict[str, Any], next_run_time: Optional[datetime] = None):
+    zone = _zone(state["z"])
+    if "i" not in state and "c" not in state:
+        trigger = DateTrigger.__new__(DateTrigger)
+        trigger.__setstate__({"version": 1, "run_date": _datetime(state["d"], zone) if "d" in state else next_run_time})
+        return trigger
+    if "i" in state:
+        trigger = IntervalTrigger.__new__(IntervalTrigger)
+        trigger.__setstate__({
+            "version": 2, "timezone": zone, "interval": timedelta(seconds=state["i"]),
+            "start_date": _datetime(state.get("s"), zone), "end_date": _datetime(state.get("e"), zone),
+            "jitter": state.get("j"),
+        })
+        return trigger
+    return CronTrigger(timezone=zone, start_date=_datetime(state.get("s"), zone),
+                       end_date=_datetime(state.get("e"), zone), jitter=state.get("j"), **state["c"])
+
+
+class BatchingJobStore(SQLAlchemyJobStore):
+    """SQLAlchemyJobStore whose add_job() can be grouped into one transaction.
+
+    compact_func is the textual reference ("module:function") of the reminder
+    callback; its jobs are stored in the compact format. None pickles everything.
+    """
+
+    def __init__(self, *args, compact_func: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compact_func = compact_func
+        self._local = threading.local()
+        self._states: Dict[bytes, tuple] = {}
+        # Same table plus the typed reminder columns (NULL for pickled rows)
+        self.jobs_t = Table(
+            self.jobs_t.name,
+            MetaData(),
+            Column("id", Unicode(191), primary_key=True),
+            Column("next_run_time", Float(25), index=True),
+            Column("job_state", LargeBinary, nullable=False),
+            Column("chat_id", BigInteger),
+            Column("message", UnicodeText),
+            schema=self.jobs_t.schema,
+        )
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", self._set_pragmas)
+
+    @staticmethod
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        if self.engine.dialect.name != "sqlite":
+            return
+        with self.engine.begin() as connection:
+            columns = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({self.jobs_t.name})")}
+            # Tables created by the plain SQLAlchemyJobStore
+            if "chat_id" not in columns:
+                connection.exec_driver_sql(f"ALTER TABLE {self.jobs_t.name} ADD COLUMN chat_id BIGINT")
+            if "message" not in columns:
+                connection.exec_driver_sql(f"ALTER TABLE {self.jobs_t.name} ADD COLUMN message TEXT")
+
+    # --- Serialization -------------------------------------------------------
+
+    def _row(self, job) -> Dict[str, Any]:
+        """Column values for a job: compact for reminders, a pickled state otherwise."""
+        row = {
+            "id": job.id,
+            "next_run_time": datetime_to_utc_timestamp(job.next_run_time),
+            "chat_id": None,
+            "message": None,
+        }
+        args = job.args
+        trigger = None
+        if (self.compact_func is not None and job.func_ref == self.compact_func and not job.kwargs
+                and job.executor == "default" and len(args) == 2 and type(args[0]) is int
+                and type(args[1]) is str and job.name == str(args[0])):
+            trigger = encode_trigger(job.trigger, job.next_run_time)
+        if trigger is None:
+            row["job_state"] = pickle.dumps(job.__getstate__(), self.pickle_protocol)
+            return row
+        state = {"t": trigger, "g": job.misfire_grace_time, "c": int(job.coalesce), "m": job.max_instances}
+        row.update(
+            chat_id=args[0],
+            message=args[1],
+            job_state=json.dumps(state, separators=(",", ":")).encode(),
+        )
+        return row
+
+    def _restore(self, row) -> Job:
+        job = Job.__new__(Job)
+        if row.chat_id is None:
+            job_state = pickle.loads(row.job_state)
+            job_state["jobstore"] = self
+            job.__setstate__(job_state)
+        else:
+            # The fields Job.__setstate__() would set, without resolving the callable per row
+            compact, zone, trigger = self._decode_state(row.job_state)
+            next_run_time = _datetime(row.next_run_time, zone)
+            job.id = row.id
+            job.func_ref = self.compact_func
+            job.func = self._compact_callable()
+            job.trigger = trigger or decode_trigger(compact["t"], next_run_time)
+            job.executor = "default"
+            job.args = (row.chat_id, row.message)
+            job.kwargs = {}
+            job.name = str(row.chat_id)
+            job.misfire_grace_time = compact["g"]
+            job.coalesce = bool(compact["c"])
+            job.max_instances = compact["m"]
+            job.next_run_time = next_run_time
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _decode_state(self, job_state: bytes):
+        """(state, zone, shared trigger or None) for a compact job_state, cached by its bytes.
+
+        Rows with the same bytes (all pending one-shots of a zone, or the same
+        recurrence) are decoded once. Cron and interval triggers are immutable
+        once built, so jobs with identical state share one; date triggers depend
+        on the row's next_run_time and are built per row.
+        """
+        entry = self._states.get(job_state)
+        if entry is None:
+            state = json.loads(job_state)
+            trigger = state["t"]
+            shared = decode_trigger(trigger) if "i" in trigger or "c" in trigger else None
+            if len(self._states) >= 4096:
+                self._states.clear()
+            entry = self._states[job_state] = (state, _zone(trigger["z"]), shared)
+        return entry
+
+    def _compact_callable(self):
+        func = getattr(self, "_compact_func_obj", None)
+        if func is None:
+            func = self._compact_func_obj = ref_to_obj(self.compact_func)
+        return func
+
+    def _columns(self):
+        t = self.jobs_t.c
+        return t.id, t.next_run_time, t.job_state, t.chat_id, t.message
+
+    def lookup_job(self, job_id):
+        selectable = select(*self._columns()).where(self.jobs_t.c.id == job_id)
+        with self.engine.begin() as connection:
+            row = connection.execute(selectable).first()
+            return self._restore(row) if row else None
+
+    def _get_jobs(self, *conditions):
+        jobs = []
+        selectable = select(*self._columns()).order_by(self.jobs_t.c.next_run_time)
+        selectable = selectable.where(and_(*conditions)) if conditions else selectable
+        failed_job_ids = set()
+        with self.engine.begin() as connection:
+            for row in connection.execute(selectable):
+                try:
+                    jobs.append(self._restore(row))
+                except BaseException:
+                    self._logger.exception('Unable to restore job "%s" -- removing it', row.id)
+                    failed_job_ids.add(row.id)
+            if failed_job_ids:
+                connection.execute(self.jobs_t.delete().where(self.jobs_t.c.id.in_(failed_job_ids)))
+        return jobs
+
+    # --- Writes ----------------------------------------------------------------
+
+    @property
+    def _pending(self) -> Optional[List[Dict]]:
+        return getattr(self._local, "pending", None)
+
+    @contextmanager
+    def batch(self):
+        """Collects add_job() calls and inserts them together on exit (nothing on error)."""
+        if self._pending is not None:
+            yield self  # nested: the outer batch commits
+            return
+        self._local.pending = []
+        try:
+            yield self
+            rows = self._pending
+        finally:
+            self._local.pending = None
+        if rows:
+            with self.engine.begin() as connection:
+                try:
+                    connection.execute(self.jobs_t.insert(), rows)
+                except IntegrityError:
+                    raise ConflictingIdError(", ".join(row["id"] for row in rows))
+
+    def add_job(self, job):
+        row = self._row(job)
+        if self._pending is not None:
+            self._pending.append(row)
+            return
+        with self.engine.begin() as connection:
+            try:
+                connection.execute(self.jobs_t.insert().values(**row))
+            except IntegrityError:
+                raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        row = self._row(job)
+        del row["id"]
+        update = self.jobs_t.update().values(**row).where(self.jobs_t.c.id == job.id)
+        with self.engine.begin() as connection:
+            if connection.execute(update).rowcount == 0:
+                raise JobLookupError(job.id)
+
+    def update_jobs(self, jobs: Iterable):
+        """Writes modified jobs (next_run_time and state) in one transaction."""
+        rows = []
+        for job in jobs:
+            row = self._row(job)
+            row["job_id"] = row.pop("id")
+            rows.append(row)
+        if not rows:
+            return
+        update = self.jobs_t.update().where(self.jobs_t.c.id == bindparam("job_id")).values(
+            next_run_time=bindparam("next_run_time"), job_state=bindparam("job_state"),
+            chat_id=bindparam("chat_id"), message=bindparam("message"),
+        )
+        with self.engine.begin() as connection:
+            connection.execute(update, rows)
+
+    def remove_jobs(self, job_ids: Iterable[str]):
+        """Deletes jobs in one transaction (no scheduler events are fired)."""
+        job_ids = list(job_ids)
+        with self.engine.begin() as connection:
+            for i in range(0, len(job_ids), 500):  # stay under SQLite's bound-variable limit
+                connection.execute(self.jobs_t.delete().where(self.jobs_t.c.id.in_(job_ids[i:i + 500])))
+
+    # --- Maintenance -------------------------------------------------------------
+
+    def file_size(self) -> int:
+        """Bytes on disk: the database plus its WAL."""
+        path = self.engine.url.database
+        if self.engine.dialect.name != "sqlite" or not path or path == ":memory:":
+            return 0
+        return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+    def compact(self) -> Dict[str, int]:
+        """Rewrites pickled reminder rows in the compact format, then checkpoints and vacuums.
+
+        Runs in batches of COMPACT_BATCH rows; returns the rows rewritten and the
+        file size before and after.
+        """
+        before = self.file_size()
+        rewritten = 0
+        last_id = ""
+        t = self.jobs_t.c
+        while True:
+            with self.engine.begin() as connection:
+                rows = connection.execute(
+                    select(*self._columns()).where(and_(t.chat_id.is_(None), t.id > last_id))
+                    .order_by(t.id).limit(COMPACT_BATCH)
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                updates = []
+                for row in rows:
+                    try:
+                        new = self._row(self._restore(row))
+                    except Exception:
+                        self._logger.exception('Unable to restore job "%s" -- left as is', row.id)
+                        continue
+                    if new["chat_id"] is not None:
+                        new["job_id"] = new.pop("id")
+                        updates.append(new)
+                if updates:
+                    connection.execute(
+                        self.jobs_t.update().where(t.id == bindparam("job_id")).values(
+                            job_state=bindparam("job_state"), chat_id=bindparam("chat_id"),
+                            message=bindparam("message"),
+                        ),
+                        updates,
+                    )
+                    rewritten += len(updates)
+        if self.engine.dialect.name == "sqlite":
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+                connection.exec_driver_sql("VACUUM")
+                connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"rewritten": rewritten, "size_before": before, "size_after": self.file_size()}
@@ -0,0 +1,91 @@
+"""
+live_message.py - A Telegram message that is edited in place as new text arrives.
+
+Edits are coalesced: callers can call update() for every chunk, only the latest
+text is sent and at most one edit goes out per `min_interval` seconds, which
+keeps long streams under Telegram's edit limits. 429s are honoured via retry_after.
+"""
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_CHARS = 4096
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """RetryAfter.retry_after is an int or a timedelta depending on the PTB version."""
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class LiveMessage:
+    """Throttled, coalescing editor for a single sent message."""
+
+    def __init__(self, message: Message, min_interval: float = 1.5, parse_mode: Optional[str] = None):
+        self.message = message
+        self.min_interval = min_interval
+        self.parse_mode = parse_mode
+        self.edits = 0
+        self._pending: Optional[str] = None
+        self._last_text: Optional[str] = message.text
+        self._last_edit = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, text: str):
+        """Sets the latest text; it is sent on the next allowed edit slot."""
+        self._pending = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    async def close(self, text: Optional[str] = None, parse_mode: Optional[str] = None):
+        """Waits for pending edits and makes sure the final text is shown.
+
+        `parse_mode` applies to the final edit only, e.g. Markdown once a streamed
+        reply is complete (partial Markdown often doesn't parse).
+        """
+        if self._task and not self._task.done():
+            await self._task
+        if parse_mode is not None:
+            self.parse_mode = parse_mode
+            self._last_text = None  # same text, new formatting: force the edit
+        if text is not None:
+            self._pending = text
+        await self._flush_later()
+
+    async def _flush_later(self):
+        while self._pending is not None:
+            delay = self._last_edit + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._flush()
+
+    async def _flush(self):
+        text, self._pending = self._pending, None
+        if text is None or text == self._last_text:
+            return
+        try:
+            await self.message.edit_text(text[:MAX_MESSAGE_CHARS], parse_mode=self.parse_mode)
+            self.edits += 1
+            self._last_text = text
+        except RetryAfter as e:
+            # Keep the newest text and push the next slot past Telegram's cool-down
+            if self._pending is None:
+                self._pending = text
+            self._last_edit = time.monotonic() + retry_after_seconds(e)
+            return
+        except BadRequest as e:
+            if "parse" in str(e).lower() and self.parse_mode:
+                # Unbalanced Markdown/HTML: show the text as-is rather than nothing
+                self.parse_mode = None
+                self._pending = self._pending or text
+            elif "not modified" not in str(e).lower():
+                logger.warning(f"Live message edit failed: {e}")
+        except Exception as e:
+            logger.warning(f"Live message edit failed: {e}")
+        self._last_edit = time.monotonic()
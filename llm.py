@@ -0,0 +1,447 @@
+"""
+llm.py - Model access for clawnbot's AI chat.
+
+- ContextCache: uploads the system context (CONTEXT.md) once and reuses the
+  cached prefix for a TTL. It is invalidated when the file changes on disk
+  (mtime/size checked cheaply, content hash decides).
+- GeminiBackend: google.generativeai, using server-side context caching when
+  the model accepts it and a system_instruction-bound model otherwise.
+- FakeBackend: offline stand-in with the same surface that counts tokens, so
+  cache behaviour and token savings can be checked without an API key.
+- LLMPool: dedicated, bounded worker pool for model calls with per-chat fair
+  (round-robin) queuing, queue-position feedback and single-flight coalescing
+  of identical in-flight prompts.
+- stream_async: runs a backend's streaming generator in a worker thread and
+  yields its chunks to the event loop.
+
+Backends are called from worker threads, never on the event loop.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, NamedTuple, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_SECONDS = metrics.histogram("clawnbot_llm_seconds", "Model call duration", ["call"])
+LLM_FIRST_CHUNK_SECONDS = metrics.histogram("clawnbot_llm_first_chunk_seconds", "Time to the first streamed chunk")
+LLM_TOKENS = metrics.counter("clawnbot_llm_tokens", "Model tokens (streams: estimated)", ["kind"])
+LLM_ERRORS = metrics.counter("clawnbot_llm_errors", "Failed model calls", ["call"])
+
+
+class LLMReply(NamedTuple):
+    text: str
+    prompt_tokens: int = 0  # tokens billed as fresh input
+    cached_tokens: int = 0  # tokens served from the cached prefix
+    output_tokens: int = 0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars per token), good enough for budgets and fakes."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class GeminiBackend:
+    """google.generativeai with explicit context caching where available."""
+
+    def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash"):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.model_name = model_name
+        self._cache_supported = True
+
+    def create_context(self, text: str, ttl: float) -> Any:
+        """Returns a handle bound to `text` as the system context."""
+        if self._cache_supported:
+            try:
+                cached = self.genai.caching.CachedContent.create(
+                    model=f"models/{self.model_name}",
+                    system_instruction=text,
+                    ttl=timedelta(seconds=ttl),
+                )
+                return self.genai.GenerativeModel.from_cached_content(cached), cached
+            except Exception as e:
+                # Server-side caching needs a versioned model and a minimum context size;
+                # fall back to a model with the context as its system instruction.
+                logger.info(f"Context caching unavailable, using system_instruction: {e}")
+                self._cache_supported = False
+        return self.genai.GenerativeModel(self.model_name, system_instruction=text), None
+
+    def release(self, handle: Any):
+        _, cached = handle
+        if cached is not None:
+            try:
+                cached.delete()
+            except Exception as e:
+                logger.warning(f"Cached context delete failed: {e}")
+
+    def generate(self, handle: Any, prompt: str) -> LLMReply:
+        model, _ = handle
+        response = model.generate_content(prompt)
+        return self._reply(response.text, getattr(response, "usage_metadata", None))
+
+    def stream(self, handle: Any, prompt: str) -> Iterator[str]:
+        model, _ = handle
+        response = model.generate_content(prompt, stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError as e:
+                # .text raises for a safety-blocked or empty-candidate chunk; skip it, keep the rest
+                logger.info(f"Skipping stream chunk without text: {e}")
+                continue
+            if text:
+                yield text
+
+    @staticmethod
+    def _reply(text: str, usage) -> LLMReply:
+        if usage is None:
+            return LLMReply(text)
+        cached = getattr(usage, "cached_content_token_count", 0) or 0
+        return LLMReply(
+            text,
+            prompt_tokens=(getattr(usage, "prompt_token_count", 0) or 0) - cached,
+            cached_tokens=cached,
+            output_tokens=getattr(usage, "candidates_token_count", 0) or 0,
+        )
+
+
+class FakeBackend:
+    """Offline model: echoes the prompt (or a scripted reply) and counts tokens."""
+
+    def __init__(self, reply: Optional[str] = None, delay: float = 0.0, cache: bool = True):
+        self.reply = reply
+        self.delay = delay
+        self.cache = cache  # False simulates a backend that re-sends the context every call
+        self.uploads = 0
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._lock = threading.Lock()
+
+    def create_context(self, text: str, ttl: float) -> Any:
+        with self._lock:
+            self.uploads += 1
+        return {"context": text, "tokens": estimate_tokens(text)}
+
+    def release(self, handle: Any):
+        pass
+
+    def generate(self, handle: Any, prompt: str, streaming: bool = False) -> LLMReply:
+        if self.delay and not streaming:
+            time.sleep(self.delay)
+        text = self.reply if self.reply is not None else f"(fake) {prompt[-200:]}"
+        fresh = estimate_tokens(prompt)
+        cached = handle["tokens"]
+        if not self.cache:
+            fresh, cached = fresh + cached, 0
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += fresh
+            self.cached_tokens += cached
+        return LLMReply(text, prompt_tokens=fresh, cached_tokens=cached, output_tokens=estimate_tokens(text))
+
+    def stream(self, handle: Any, prompt: str, chunk_words: int = 3) -> Iterator[str]:
+        """Same reply as generate(), delivered a few words at a time over `delay` seconds."""
+        words = self.generate(handle, prompt, streaming=True).text.split(" ")
+        chunks = [" ".join(words[i:i + chunk_words]) for i in range(0, len(words), chunk_words)]
+        for i, chunk in enumerate(chunks):
+            if self.delay:
+                time.sleep(self.delay / max(len(chunks), 1))
+            yield chunk if i == 0 else " " + chunk
+
+
+class ContextCache:
+    """Keeps one backend handle for the current system context, refreshed on TTL or file change."""
+
+    def __init__(self, backend, path: str = "CONTEXT.md", ttl: float = 3600,
+                 default_text: str = "You are a helpful assistant.", check_interval: float = 5.0):
+        self.backend = backend
+        self.path = path
+        self.ttl = ttl
+        self.default_text = default_text
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self._handle = None
+        self._digest: Optional[str] = None  # digest of the context behind _handle
+        self._text_digest: Optional[str] = None
+        self._expires_at = 0.0
+        self._stat = None
+        self._checked_at = 0.0
+        self._text: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _read(self) -> str:
+        try:
+            with open(self.path, "r") as f:
+                return f.read()
+        except Exception as e:
+            logger.warning(f"{self.path} not readable: {e}")
+            return self.default_text
+
+    def _refresh_text(self):
+        """Cheap check: stat at most every check_interval, re-read only if mtime/size moved."""
+        now = time.monotonic()
+        if self._text is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            st = os.stat(self.path)
+            stat = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat = None
+        if self._text is not None and stat == self._stat:
+            return
+        self._stat = stat
+        self._text = self._read()
+        self._text_digest = hashlib.sha256(self._text.encode()).hexdigest()
+
+    @property
+    def text(self) -> str:
+        with self._lock:
+            self._refresh_text()
+            return self._text
+
+    def current(self) -> Any:
+        """The handle for the current context, uploading it if stale or missing."""
+        old = None
+        with self._lock:
+            self._refresh_text()
+            # A touched file with identical content keeps the handle (digest unchanged)
+            if self._handle is not None and self._digest == self._text_digest and time.monotonic() < self._expires_at:
+                self.hits += 1
+                return self._handle
+            self.misses += 1
+            old = self._handle
+            self._handle = self.backend.create_context(self._text, self.ttl)
+            self._digest = self._text_digest
+            # Refresh a bit early so a request never lands on an expired server-side cache
+            self._expires_at = time.monotonic() + self.ttl * 0.9
+            handle = self._handle
+        if old is not None:
+            self.backend.release(old)
+        return handle
+
+    def generate(self, prompt: str) -> LLMReply:
+        started = time.perf_counter()
+        try:
+            reply = self.backend.generate(self.current(), prompt)
+        except Exception:
+            LLM_ERRORS.inc("generate")
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - started, "generate")
+        LLM_TOKENS.inc("prompt", amount=reply.prompt_tokens)
+        LLM_TOKENS.inc("cached", amount=reply.cached_tokens)
+        LLM_TOKENS.inc("output", amount=reply.output_tokens)
+        return reply
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        # Streams carry no usage metadata per chunk: tokens are estimated from the text
+        started = time.perf_counter()
+        output = []
+        try:
+            for i, chunk in enumerate(self.backend.stream(self.current(), prompt)):
+                if i == 0:
+                    LLM_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - started)
+                output.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            raise  # closed early by the consumer (CMD: found), not an error
+        except Exception:
+            LLM_ERRORS.inc("stream")
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - started, "stream")
+            LLM_TOKENS.inc("prompt", amount=estimate_tokens(prompt))
+            LLM_TOKENS.inc("output", amount=estimate_tokens("".join(output)))
+
+
+class LLMQueueFull(Exception):
+    """Raised when the LLM pool already has max_queued calls waiting."""
+
+
+class StreamAborted(Exception):
+    """A stream's reader left before the end: its text is partial and isn't shared."""
+
+
+class LLMPool:
+    """Bounded worker pool for blocking model calls.
+
+    Waiting calls are queued per chat and dispatched round-robin across chats,
+    so one chatty user can't take every worker. Calls submitted with the same
+    `key` while one is in flight share its result instead of running again.
+    """
+
+    def __init__(self, workers: int = 4, max_queued: int = 50):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+        self._queues: "OrderedDict[int, Deque[tuple]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._active = 0
+        # metrics
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_times: Deque[float] = deque(maxlen=1000)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def position(self, chat_id: int) -> int:
+        """1-based dispatch position a new call from chat_id would get under round-robin."""
+        own = len(self._queues.get(chat_id, ()))
+        ahead = sum(min(len(q), own + 1) for c, q in self._queues.items() if c != chat_id)
+        return ahead + own + 1
+
+    async def run(self, chat_id: int, fn: Callable[[], Any], key: Optional[str] = None,
+                  on_queued: Optional[Callable[[int], Awaitable[None]]] = None) -> Any:
+        """Runs fn() on a pool thread once it's this chat's turn; returns its result."""
+        if key is not None and key in self._inflight:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(self._inflight[key])
+            except StreamAborted:
+                pass  # the leader's reader stopped early: make our own call
+
+        if self._active >= self.workers and self.queued >= self.max_queued:
+            self.rejected += 1
+            raise LLMQueueFull(f"{self.queued} çağrı bekliyor")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if key is not None:
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        self.submitted += 1
+
+        position = self.position(chat_id) if self._active >= self.workers else 0
+        self._queues.setdefault(chat_id, deque()).append((fn, future, time.monotonic()))
+        self._dispatch()
+        if position and on_queued and not future.done():
+            await on_queued(position)
+        return await asyncio.shield(future)
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self._active < self.workers and self._queues:
+            chat_id, queue = self._queues.popitem(last=False)
+            fn, future, queued_at = queue.popleft()
+            if queue:
+                self._queues[chat_id] = queue  # back of the rotation
+            self.wait_times.append(time.monotonic() - queued_at)
+            self._active += 1
+            loop.run_in_executor(self.executor, fn).add_done_callback(
+                lambda done, future=future: self._finish(done, future)
+            )
+
+    def _finish(self, done: asyncio.Future, future: asyncio.Future):
+        self._active -= 1
+        self.completed += 1
+        if not future.done():
+            if done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(done.result())
+        self._dispatch()
+
+    def stats(self) -> Dict[str, float]:
+        waits = sorted(self.wait_times)
+        pick = lambda pct: waits[min(len(waits) - 1, int(pct / 100 * len(waits)))] if waits else 0.0
+        return {
+            "workers": self.workers,
+            "active": self._active,
+            "queued": self.queued,
+            "queued_chats": len(self._queues),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_p50": pick(50),
+            "wait_p95": pick(95),
+            "wait_max": waits[-1] if waits else 0.0,
+        }
+
+
+def prompt_key(prompt: str) -> str:
+    """Single-flight key: identical prompts (modulo case/whitespace) share one call.
+
+    The key covers the whole prompt, history and notes included: a reply depends
+    on them, so only chats with the same (usually empty) context share a call.
+    """
+    return hashlib.sha1(" ".join(prompt.casefold().split()).encode()).hexdigest()
+
+
+async def stream_async(produce, run: Optional[Callable[[Callable[[], str]], Awaitable[str]]] = None) -> AsyncIterator[str]:
+    """Iterates the blocking iterator returned by produce() in a worker thread.
+
+    Chunks are handed to the loop as they arrive. `run` executes the blocking
+    pump, e.g. through an LLMPool (default: the loop's default executor); if it
+    returns a result without our pump having run (a coalesced call), that full
+    text is yielded as a single chunk. Leaving the `async for` early stops the
+    worker after its current chunk and the pump raises StreamAborted, so calls
+    coalesced onto it run again instead of getting the partial text.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    done, job_done = object(), object()
+
+    def pump() -> str:
+        parts = []
+        try:
+            for chunk in produce():
+                parts.append(chunk)
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                if stop.is_set():
+                    raise StreamAborted()
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except StreamAborted:
+            raise
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+            raise  # fails the shared call too: coalesced callers get the error, not partial text
+        return "".join(parts)
+
+    def finished(job):
+        if not job.cancelled():
+            job.exception()  # retrieved: an aborted pump is expected, not an error to log
+        queue.put_nowait(job_done)
+
+    if run is None:
+        job = loop.run_in_executor(None, pump)
+    else:
+        job = asyncio.ensure_future(run(pump))
+    job.add_done_callback(finished)
+
+    produced = False
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if item is job_done:
+                if job.exception() is not None:
+                    raise job.exception()
+                if not produced and job.result():
+                    yield job.result()
+                break
+            if isinstance(item, BaseException):
+                raise item
+            produced = True
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,271 @@
+"""
+log_watch.py - Follows log files and alerts on matching lines.
+
+Replaces polling `/term tail -f` (one process per call, cut off by the term
+timeout) with an in-process follower:
+
+- each file is read from a saved offset (log_offsets table in jobs.sqlite),
+  so a restart resumes where it stopped instead of re-alerting old lines,
+- reads are bounded chunks (CHUNK_SIZE, at most max_bytes per poll), only
+  the current chunk and one partial line are held in memory,
+- rotation is detected by inode: the rest of the old file is drained, then
+  the new one is read from the start; a file that shrank (truncated) is
+  re-read from the start too,
+- lines are matched against named regexes (PUMP/DUMP by default), repeats
+  of the same symbol and pattern are dropped within a dedup window, and
+  what is left goes out as one message per poll under a token bucket.
+
+tail() reads the last lines of a file by seeking backwards from the end.
+"""
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from delivery import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+MAX_LINE = 8 * 1024  # longer lines are cut, so a newline-less file can't grow the buffer
+MAX_PENDING = 50  # matches kept while rate limited; older ones are counted, not kept
+MAX_ALERT_LINES = 10
+
+DEFAULT_PATTERNS = {
+    "pump": r"\bPUMP\b",
+    "dump": r"\bDUMP\b",
+}
+SYMBOL = re.compile(r"\b[A-Z0-9]{2,15}(?:USDT|BUSD|USDC|TRY|BTC)\b")
+NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_offsets (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+"""
+
+
+@dataclass
+class LogMatch:
+    pattern: str
+    path: str
+    line: str
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        """Dedup key: the pattern and the symbol the line is about (or the line without numbers)."""
+        symbol = SYMBOL.search(self.line)
+        return self.pattern, symbol.group(0) if symbol else NUMBER.sub("#", self.line)
+
+
+class LogFollower:
+    """Incremental reader of one file, across rotation and truncation."""
+
+    def __init__(self, path: str, inode: Optional[int] = None, offset: Optional[int] = None,
+                 chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.inode = inode
+        self.offset = offset  # byte after the last complete line; None = start at the end
+        self.chunk_size = chunk_size
+        self.file = None
+        self._partial = b""
+        self.rotations = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self._partial = b""
+
+    def _open(self, st: os.stat_result):
+        self.close()
+        self.file = open(self.path, "rb")
+        if self.offset is None:
+            self.offset = st.st_size  # first run: only lines written from now on
+        elif self.inode != st.st_ino or self.offset > st.st_size:
+            self.offset = 0  # another file (rotated while we were down) or truncated
+        self.inode = st.st_ino
+        self.file.seek(self.offset)
+
+    def _drain(self, max_bytes: int) -> Iterator[str]:
+        read = 0
+        while read < max_bytes:
+            chunk = self.file.read(min(self.chunk_size, max_bytes - read))
+            if not chunk:
+                return
+            read += len(chunk)
+            lines = (self._partial + chunk).split(b"\n")
+            self._partial = lines.pop()
+            if len(self._partial) > MAX_LINE:
+                lines.append(self._partial[:MAX_LINE])
+                self._partial = b""
+            consumed = len(chunk)
+            self.offset = self.file.tell() - len(self._partial)
+            for line in lines:
+                if line.strip():
+                    yield line.decode("utf-8", errors="replace").rstrip("\r")
+            if consumed < self.chunk_size:
+                return
+
+    def read_lines(self, max_bytes: int = 4 * 1024 * 1024) -> Iterator[str]:
+        """New complete lines since the last call, at most max_bytes of them."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if self.file is not None and (st is None or st.st_ino != self.inode):
+            # Rotated (or removed): finish what was written to the old file first
+            yield from self._drain(max_bytes)
+            self.close()
+            if st is None:
+                return
+            self.rotations += 1
+            self.offset = 0
+        if st is None:
+            return
+        if self.file is None:
+            self._open(st)
+        elif st.st_size < self.offset:
+            self.file.seek(0)  # truncated in place (copytruncate)
+            self.offset, self._partial = 0, b""
+        yield from self._drain(max_bytes)
+
+
+def tail(path: str, n: int = 20, block_size: int = 8192, max_bytes: int = 1024 * 1024) -> List[str]:
+    """Last n lines of a file, read backwards in blocks (never the whole file)."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        position, data = end, b""
+        while position > 0 and data.count(b"\n") <= n and end - position < max_bytes:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    return lines[-n:]
+
+
+class LogWatch:
+    """Follows `paths`, matches lines against `patterns` and sends throttled, deduplicated alerts."""
+
+    def __init__(self, alert: Callable[[str], Awaitable[None]], paths: Sequence[str],
+                 patterns: Optional[Dict[str, str]] = None, path: str = "jobs.sqlite",
+                 dedup_window: float = 300.0, rate_per_minute: float = 6.0, burst: float = 3.0,
+                 max_bytes: int = 4 * 1024 * 1024):
+        self.alert = alert
+        self.patterns = {name: re.compile(rx) for name, rx in (patterns or DEFAULT_PATTERNS).items()}
+        self.dedup_window = dedup_window
+        self.max_bytes = max_bytes
+        self.bucket = TokenBucket(rate_per_minute / 60, burst)
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        saved = {p: (inode, offset) for p, inode, offset in
+                 self.conn.execute("SELECT path, inode, offset FROM log_offsets")}
+        self.followers = [LogFollower(p, *saved.get(p, (None, None))) for p in paths]
+        self._lock = threading.Lock()
+        self._sent: Dict[Tuple[str, str], float] = {}
+        self.pending: List[LogMatch] = []
+        # metrics
+        self.lines = 0
+        self.matches = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.alerts = 0
+
+    def poll(self) -> List[LogMatch]:
+        """Reads what was appended to every file and returns the matching lines (blocking I/O)."""
+        found = []
+        with self._lock:
+            for follower in self.followers:
+                for line in follower.read_lines(self.max_bytes):
+                    self.lines += 1
+                    for name, regex in self.patterns.items():
+                        if regex.search(line):
+                            found.append(LogMatch(name, follower.path, line.strip()))
+                            break
+                self._save(follower)
+        self.matches += len(found)
+        return found
+
+    def _save(self, follower: LogFollower):
+        if follower.inode is None or follower.offset is None:
+            return
+        self.conn.execute(
+            "INSERT INTO log_offsets (path, inode, offset) VALUES (?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET inode = excluded.inode, offset = excluded.offset",
+            (follower.path, follower.inode, follower.offset),
+        )
+
+    def _fresh(self, found: List[LogMatch]) -> List[LogMatch]:
+        now = time.monotonic()
+        if len(self._sent) > 1000:
+            self._sent = {k: t for k, t in self._sent.items() if now - t < self.dedup_window}
+        fresh = []
+        for match in found:
+            key = match.key
+            if now - self._sent.get(key, float("-inf")) < self.dedup_window:
+                self.duplicates += 1
+                continue
+            self._sent[key] = now
+            fresh.append(match)
+        return fresh
+
+    async def check(self) -> int:
+        """One poll: reads in a worker thread, sends at most one alert; returns matches sent."""
+        found = await asyncio.to_thread(self.poll)
+        self.pending += self._fresh(found)
+        if len(self.pending) > MAX_PENDING:
+            self.dropped += len(self.pending) - MAX_PENDING
+            self.pending = self.pending[-MAX_PENDING:]
+        if not self.pending or self.bucket.delay() > 0:
+            return 0
+        self.bucket.take()
+        batch, self.pending = self.pending, []
+        try:
+            await self.alert(self.format_alert(batch))
+            self.alerts += 1
+        except Exception as e:
+            logger.error(f"Log alert failed: {e}")
+        return len(batch)
+
+    def format_alert(self, batch: List[LogMatch]) -> str:
+        counts: Dict[str, int] = {}
+        for match in batch:
+            counts[match.pattern] = counts.get(match.pattern, 0) + 1
+        header = ", ".join(f"{name.upper()} ×{n}" for name, n in counts.items())
+        lines = [f"📈 Log: {header}"]
+        lines += [f"• {match.line[:300]}" for match in batch[-MAX_ALERT_LINES:]]
+        if len(batch) > MAX_ALERT_LINES:
+            lines.append(f"… ve {len(batch) - MAX_ALERT_LINES} satır daha")
+        if self.dropped:
+            lines.append(f"(hız sınırı nedeniyle {self.dropped} eşleşme atlandı)")
+            self.dropped = 0
+        return "\n".join(lines)
+
+    def schedule(self, scheduler, interval: float = 2.0, jobstore: str = "memory"):
+        scheduler.add_job(self.check, "interval", seconds=interval, id="log-watch", jobstore=jobstore,
+                          replace_existing=True, max_instances=1, coalesce=True)
+
+    def close(self):
+        with self._lock:
+            for follower in self.followers:
+                follower.close()
+            self.conn.close()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "files": len(self.followers),
+            "lines": self.lines,
+            "matches": self.matches,
+            "duplicates": self.duplicates,
+            "pending": len(self.pending),
+            "alerts": self.alerts,
+            "rotations": sum(f.rotations for f in self.followers),
+        }
@@ -0,0 +1,210 @@
+"""
+memory_index.py - Full-text index over the workspace's long-term notes.
+
+MEMORY.md and the dated notes under memory/ are split into heading-sized
+chunks and indexed with SQLite FTS5 (memory_index.sqlite). Only files whose
+mtime or size changed since the last refresh are re-read, and the disk is
+checked at most every check_interval seconds, so keeping the index fresh
+costs a few stat() calls per message.
+
+The AI chat asks for the chunks that best match the user's message (BM25)
+and attaches the top few, within a token budget, instead of inlining every
+note into the prompt.
+"""
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from llm import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SEARCH_SECONDS = metrics.histogram("clawnbot_memory_search_seconds", "Memory index refresh + search")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory_files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS memory_chunks USING fts5(
+    path UNINDEXED,
+    heading UNINDEXED,
+    body,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Too common to say anything about relevance
+STOPWORDS = {
+    "bir", "bu", "şu", "ve", "ile", "için", "ama", "gibi", "daha", "çok", "mi", "mı", "mu", "mü",
+    "ne", "neden", "nasıl", "var", "yok", "olarak", "olan", "sen", "ben", "bana", "sana", "de", "da",
+    "the", "and", "for", "with", "that", "this", "what", "how", "why", "are", "was", "you",
+}
+# Turkish is agglutinative ("sinyalleri", "screener'ı"): long words match on their first
+# PREFIX_CHARS characters, so inflected forms still find the note
+PREFIX_CHARS = 5
+HEADING = re.compile(r"^#{1,6}\s+(.*)$")
+
+
+@dataclass
+class Snippet:
+    path: str
+    heading: str
+    text: str
+    score: float  # bm25, lower is better
+
+
+def chunk_markdown(text: str, max_tokens: int = 120) -> List[Tuple[str, str]]:
+    """(heading, body) chunks: one per section, long sections split on paragraphs."""
+    chunks, heading, paragraphs = [], "", []
+
+    def flush():
+        body, size = [], 0
+        for paragraph in paragraphs:
+            tokens = estimate_tokens(paragraph)
+            if body and size + tokens > max_tokens:
+                chunks.append((heading, "\n\n".join(body)))
+                body, size = [], 0
+            body.append(paragraph)
+            size += tokens
+        if body:
+            chunks.append((heading, "\n\n".join(body)))
+
+    for block in re.split(r"\n\s*\n", text):
+        lines = block.strip().splitlines()
+        while lines and HEADING.match(lines[0]):
+            flush()
+            heading, paragraphs = HEADING.match(lines[0]).group(1).strip(), []
+            lines = lines[1:]
+        if lines:
+            paragraphs.append("\n".join(lines))
+    flush()
+    return chunks
+
+
+def match_query(text: str) -> Optional[str]:
+    """FTS5 MATCH expression for free text: significant words OR'ed, quoted, long ones as prefixes."""
+    terms = []
+    for word in re.findall(r"\w{3,}", text.replace("İ", "i").lower()):
+        if word in STOPWORDS or word.isdigit():
+            continue
+        term = f'"{word[:PREFIX_CHARS]}"*' if len(word) > PREFIX_CHARS else f'"{word}"'
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms[:16]) or None
+
+
+class MemoryIndex:
+    """Incremental FTS5 index over MEMORY.md and memory/*.md under `root`."""
+
+    def __init__(self, root: str = ".", path: str = "memory_index.sqlite",
+                 check_interval: float = 10.0, chunk_tokens: int = 120):
+        self.root = root
+        self.check_interval = check_interval
+        self.chunk_tokens = chunk_tokens
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def sources(self) -> Dict[str, Tuple[int, int]]:
+        """Indexable files with their (mtime_ns, size), keyed by path relative to root."""
+        found = {}
+        candidates = [("MEMORY.md", os.path.join(self.root, "MEMORY.md"))]
+        notes = os.path.join(self.root, "memory")
+        if os.path.isdir(notes):
+            candidates += [(f"memory/{entry.name}", entry.path) for entry in os.scandir(notes)
+                           if entry.name.endswith(".md") and entry.is_file()]
+        for name, full in candidates:
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            found[name] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def refresh(self, force: bool = False) -> Tuple[int, int]:
+        """Re-indexes changed files and drops deleted ones; returns (updated, removed)."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked_at < self.check_interval:
+                return 0, 0
+            self._checked_at = now
+            on_disk = self.sources()
+            known = {path: (mtime, size) for path, mtime, size in
+                     self.conn.execute("SELECT path, mtime_ns, size FROM memory_files")}
+            changed = [path for path, stat in on_disk.items() if known.get(path) != stat]
+            removed = [path for path in known if path not in on_disk]
+            if not changed and not removed:
+                return 0, 0
+
+            with self.conn:
+                self.conn.execute("BEGIN")
+                for path in removed + changed:
+                    self.conn.execute("DELETE FROM memory_chunks WHERE path = ?", (path,))
+                    self.conn.execute("DELETE FROM memory_files WHERE path = ?", (path,))
+                for path in changed:
+                    try:
+                        with open(os.path.join(self.root, path), encoding="utf-8", errors="replace") as f:
+                            text = f.read()
+                    except OSError as e:
+                        logger.warning(f"{path} not readable: {e}")
+                        continue
+                    self.conn.executemany(
+                        "INSERT INTO memory_chunks (path, heading, body) VALUES (?, ?, ?)",
+                        ((path, heading, body) for heading, body in chunk_markdown(text, self.chunk_tokens)),
+                    )
+                    mtime, size = on_disk[path]
+                    self.conn.execute("INSERT INTO memory_files (path, mtime_ns, size) VALUES (?, ?, ?)",
+                                      (path, mtime, size))
+            return len(changed), len(removed)
+
+    def search(self, query: str, k: int = 3, max_tokens: int = 400) -> List[Snippet]:
+        """Best-matching chunks for `query`, at most k and within max_tokens together."""
+        expression = match_query(query)
+        if expression is None:
+            return []
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT path, heading, body, bm25(memory_chunks) AS score FROM memory_chunks "
+                "WHERE memory_chunks MATCH ? ORDER BY score LIMIT ?",
+                (expression, k * 3),
+            ).fetchall()
+        snippets, used = [], 0
+        for path, heading, body, score in rows:
+            tokens = estimate_tokens(body)
+            if used + tokens > max_tokens:
+                if snippets:
+                    continue
+                body = body[:max_tokens * 4]  # the best match alone is over budget: trim it
+                tokens = max_tokens
+            snippets.append(Snippet(path, heading, body, score))
+            used += tokens
+            if len(snippets) == k:
+                break
+        return snippets
+
+    def context_for(self, query: str, k: int = 3, max_tokens: int = 400) -> str:
+        """Prompt block with the notes relevant to `query` ("" if none)."""
+        started = time.perf_counter()
+        try:
+            self.refresh()
+            snippets = self.search(query, k, max_tokens)
+        finally:
+            SEARCH_SECONDS.observe(time.perf_counter() - started)
+        if not snippets:
+            return ""
+        parts = [f"[{s.path}{' › ' + s.heading if s.heading else ''}]\n{s.text}" for s in snippets]
+        return "RELEVANT NOTES (from memory):\n" + "\n\n".join(parts)
+
+    def stats(self) -> Dict[str, float]:
+        files = self.conn.execute("SELECT COUNT(*) FROM memory_files").fetchone()[0]
+        chunks = self.conn.execute("SELECT COUNT(*) FROM memory_chunks").fetchone()[0]
+        return {"files": files, "chunks": chunks}
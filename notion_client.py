@@ -0,0 +1,194 @@
+"""
+notion_client.py - Async Notion API client for clawnbot.
+
+One pooled httpx.AsyncClient (keep-alive, so one TLS handshake for many
+calls) behind a token bucket tuned to Notion's ~3 requests/s average:
+
+- append_paragraphs()/append_blocks(): any number of blocks, sent as
+  children appends of up to 100 blocks each (the API limit), in order,
+- search()/iter_children(): async iterators following start_cursor
+  pagination,
+- 429s wait for Retry-After, 5xx and network errors back off and retry;
+  other 4xx raise NotionError. Appends (PATCH) aren't idempotent, so they
+  are only retried when the request can't have reached Notion (connect
+  errors) or was refused (429, 503).
+
+base_url points it at a mock server for tests and benchmarks.
+"""
+import os
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import httpx
+
+from delivery import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+API_URL = "https://api.notion.com/v1"
+NOTION_VERSION = "2022-06-28"
+MAX_CHILDREN = 100  # blocks per children append
+MAX_TEXT = 2000  # characters per rich_text item
+MAX_PAGE_SIZE = 100
+
+
+class NotionError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(f"{status} {code}: {message}")
+        self.status = status
+        self.code = code
+
+
+def load_token() -> Optional[str]:
+    """NOTION_KEY / NOTION_API_KEY, else ~/.config/notion/api_key."""
+    token = os.environ.get("NOTION_KEY") or os.environ.get("NOTION_API_KEY")
+    if token:
+        return token
+    try:
+        with open(os.path.expanduser("~/.config/notion/api_key")) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def paragraph(text: str) -> Dict[str, Any]:
+    """Paragraph block; text longer than a rich_text item allows is split across items."""
+    pieces = [text[i:i + MAX_TEXT] for i in range(0, len(text), MAX_TEXT)] or [""]
+    return {
+        "object": "block",
+        "type": "paragraph",
+        "paragraph": {"rich_text": [{"type": "text", "text": {"content": piece}} for piece in pieces]},
+    }
+
+
+class NotionClient:
+    """Pooled, rate-limited Notion client. Use as `async with NotionClient(token) as notion:`."""
+
+    def __init__(self, token: str, base_url: str = API_URL, version: str = NOTION_VERSION,
+                 rate: float = 3.0, burst: float = 3.0, max_connections: int = 4,
+                 timeout: float = 30.0, max_retries: int = 5):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Notion-Version": version,
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+        # metrics
+        self.requests = 0
+        self.rate_limited = 0
+        self.retried = 0
+
+    async def __aenter__(self) -> "NotionClient":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _throttle(self):
+        while True:
+            wait = self.bucket.delay()
+            if wait <= 0:
+                self.bucket.take()
+                return
+            await asyncio.sleep(wait)
+
+    async def request(self, method: str, path: str, json: Optional[dict] = None,
+                      params: Optional[dict] = None) -> Dict[str, Any]:
+        for attempt in range(self.max_retries + 1):
+            await self._throttle()
+            self.requests += 1
+            try:
+                response = await self.client.request(method, path, json=json, params=params)
+            except httpx.TransportError as e:
+                # A timeout or dropped connection after sending may still have applied the append
+                sent = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+                if attempt == self.max_retries or (sent and method == "PATCH"):
+                    raise
+                self.retried += 1
+                logger.warning(f"Notion {method} {path} failed ({e}), retrying")
+                await asyncio.sleep(min(30.0, 2 ** attempt))
+                continue
+
+            if response.status_code == 429:
+                self.rate_limited += 1
+                retry_after = float(response.headers.get("Retry-After", "1"))
+                self.bucket.block(retry_after)
+                if attempt < self.max_retries:
+                    continue
+            elif (response.status_code >= 500 and attempt < self.max_retries
+                  and (method != "PATCH" or response.status_code == 503)):  # 503: not processed
+                self.retried += 1
+                await asyncio.sleep(min(30.0, 2 ** attempt))
+                continue
+
+            try:
+                data = response.json() if response.content else {}
+            except ValueError:  # e.g. a gateway's HTML error page
+                data = {"message": response.text[:200]}
+            if response.status_code >= 400:
+                raise NotionError(response.status_code, data.get("code", ""), data.get("message", response.text))
+            return data
+
+    async def append_blocks(self, block_id: str, blocks: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Appends blocks in order, MAX_CHILDREN per request; returns the created blocks."""
+        blocks = list(blocks)
+        created = []
+        for i in range(0, len(blocks), MAX_CHILDREN):
+            data = await self.request("PATCH", f"/blocks/{block_id}/children",
+                                      json={"children": blocks[i:i + MAX_CHILDREN]})
+            created += data.get("results", [])
+        return created
+
+    async def append_paragraphs(self, block_id: str, texts: Iterable[str]) -> List[Dict[str, Any]]:
+        return await self.append_blocks(block_id, (paragraph(text) for text in texts))
+
+    async def _paginate(self, method: str, path: str, body: Optional[dict] = None,
+                        page_size: int = MAX_PAGE_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        cursor = None
+        while True:
+            if method == "GET":
+                params = {"page_size": page_size, **({"start_cursor": cursor} if cursor else {})}
+                data = await self.request(method, path, params=params)
+            else:
+                payload = dict(body or {}, page_size=page_size, **({"start_cursor": cursor} if cursor else {}))
+                data = await self.request(method, path, json=payload)
+            for item in data.get("results", []):
+                yield item
+            cursor = data.get("next_cursor")
+            if not data.get("has_more") or not cursor:
+                return
+
+    def search(self, query: Optional[str] = None, filter: Optional[dict] = None,
+               page_size: int = MAX_PAGE_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        """Every page/database shared with the integration matching `query`, across all result pages."""
+        body = {}
+        if query:
+            body["query"] = query
+        if filter:
+            body["filter"] = filter
+        return self._paginate("POST", "/search", body, page_size)
+
+    def iter_children(self, block_id: str, page_size: int = MAX_PAGE_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        return self._paginate("GET", f"/blocks/{block_id}/children", page_size=page_size)
+
+    def stats(self) -> Dict[str, float]:
+        return {"requests": self.requests, "rate_limited": self.rate_limited, "retried": self.retried}
+
+
+def title_of(item: Dict[str, Any]) -> str:
+    """Plain-text title of a search result (page or database)."""
+    if item.get("object") == "database":
+        parts = item.get("title", [])
+    else:
+        parts = next((p.get("title", []) for p in item.get("properties", {}).values() if p.get("id") == "title"), [])
+    return "".join(part.get("plain_text", "") for part in parts) or "Untitled"
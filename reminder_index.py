@@ -0,0 +1,149 @@
+"""
+reminder_index.py - Per-chat reminder lookup table next to the APScheduler jobstore.
+
+APScheduler keeps each job as a pickled blob in `apscheduler_jobs`; listing a
+chat's reminders through scheduler.get_jobs() unpickles every job of every
+user. This table mirrors the fields /liste and /iptal need, indexed on
+(chat_id, next_run_time), so those commands cost O(reminders in the chat).
+
+It is kept in sync by clawnbot on add, and by scheduler events on fire/cancel.
+Recurring reminders keep their row; next_run_time is copied from apscheduler_jobs
+after every run.
+"""
+import sqlite3
+from datetime import datetime, timezone
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminders (
+    job_id VARCHAR(191) PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    next_run_time FLOAT,
+    message TEXT NOT NULL,
+    recurrence TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_reminders_chat_next_run_time ON reminders (chat_id, next_run_time);
+"""
+
+
+class Reminder(NamedTuple):
+    job_id: str
+    chat_id: int
+    next_run_time: Optional[float]  # UTC timestamp, same as apscheduler_jobs.next_run_time
+    message: str
+    recurrence: Optional[str] = None  # "her gün 09:00" for recurring reminders
+
+    @property
+    def run_time(self) -> Optional[datetime]:
+        if self.next_run_time is None:
+            return None
+        return datetime.fromtimestamp(self.next_run_time, timezone.utc)
+
+
+def to_timestamp(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() if value is not None else None
+
+
+class ReminderIndex:
+    """Small sqlite3 wrapper around the `reminders` table."""
+
+    def __init__(self, path: str = "jobs.sqlite"):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(reminders)")}
+        if "recurrence" not in columns:  # tables created before recurring reminders
+            self.conn.execute("ALTER TABLE reminders ADD COLUMN recurrence TEXT")
+
+    def add(self, job_id: str, chat_id: int, run_time: Optional[datetime], message: str,
+            recurrence: Optional[str] = None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO reminders (job_id, chat_id, next_run_time, message, recurrence) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (job_id, chat_id, to_timestamp(run_time), message, recurrence),
+        )
+
+    def add_many(self, rows: Iterable[tuple]):
+        """Rows are (job_id, chat_id, run_time, message[, recurrence]), written in one transaction."""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO reminders (job_id, chat_id, next_run_time, message, recurrence) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((row[0], row[1], to_timestamp(row[2]), row[3], row[4] if len(row) > 4 else None) for row in rows),
+            )
+
+    def sync_next_run_time(self, job_id: str, jobs_table: str = "apscheduler_jobs"):
+        """Copies a job's next_run_time from the jobstore table (same database file), no unpickling."""
+        self.conn.execute(
+            f"UPDATE reminders SET next_run_time = (SELECT next_run_time FROM {jobs_table} WHERE id = ?) "
+            "WHERE job_id = ?",
+            (job_id, job_id),
+        )
+
+    def update_many(self, rows: Iterable[Tuple[str, Optional[datetime]]]):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "UPDATE reminders SET next_run_time = ? WHERE job_id = ?",
+                ((to_timestamp(run_time), job_id) for job_id, run_time in rows),
+            )
+
+    def remove_many(self, job_ids: Iterable[str]):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM reminders WHERE job_id = ?", ((i,) for i in job_ids))
+
+    def remove(self, job_id: str):
+        self.conn.execute("DELETE FROM reminders WHERE job_id = ?", (job_id,))
+
+    def clear(self):
+        self.conn.execute("DELETE FROM reminders")
+
+    def get(self, job_id: str) -> Optional[Reminder]:
+        row = self.conn.execute(
+            "SELECT job_id, chat_id, next_run_time, message, recurrence FROM reminders WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return Reminder(*row) if row else None
+
+    def count(self, chat_id: int) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM reminders WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+
+    def page(self, chat_id: int, page: int = 1, per_page: int = 20) -> Tuple[List[Reminder], int]:
+        """Reminders of one chat ordered by run time, plus the chat's total count."""
+        rows = self.conn.execute(
+            "SELECT job_id, chat_id, next_run_time, message, recurrence FROM reminders "
+            "WHERE chat_id = ? ORDER BY next_run_time LIMIT ? OFFSET ?",
+            (chat_id, per_page, (max(page, 1) - 1) * per_page),
+        ).fetchall()
+        return [Reminder(*r) for r in rows], self.count(chat_id)
+
+    def reconcile(self, store) -> Tuple[int, int]:
+        """Brings the index in line with the jobstore after a restart.
+
+        `store` is the started SQLAlchemyJobStore. Drops rows whose job is gone
+        and backfills jobs that predate the index; only the missing jobs are
+        unpickled. Returns (added, removed).
+        """
+        from apscheduler.triggers.date import DateTrigger
+        from sqlalchemy import select
+
+        job_ids = {row[0] for row in self.conn.execute("SELECT job_id FROM reminders")}
+        with store.engine.connect() as connection:
+            stored_ids = {row[0] for row in connection.execute(select(store.jobs_t.c.id))}
+
+        stale = job_ids - stored_ids
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM reminders WHERE job_id = ?", ((i,) for i in stale))
+
+        missing = []
+        for job_id in stored_ids - job_ids:
+            job = store.lookup_job(job_id)
+            if job is None or len(job.args) < 2 or not str(job.name).lstrip("-").isdigit():
+                continue
+            recurrence = None if isinstance(job.trigger, DateTrigger) else str(job.trigger)
+            missing.append((job.id, int(job.name), job.next_run_time, str(job.args[1]), recurrence))
+        if missing:
+            self.add_many(missing)
+        return len(missing), len(stale)
@@ -0,0 +1,409 @@
+"""
+time_parser.py - Time expression parsing for /hatirlat.
+
+The text is tokenized once. Common Turkish/English forms ("10 dakika sonra",
+"yarın 14:00", "pazartesi 09:30", "in 2 hours") are handled by a rule-based
+fast path; anything else falls back to a single dateparser search that reuses
+one preconfigured searcher and settings object.
+
+    >>> parse_reminder("10 dakika sonra Fırını kapat")
+    ParsedReminder(when=..., message='Fırını kapat', matched='10 dakika sonra', source='rule', recurrence=None)
+
+Recurring phrases ("her gün 09:00", "her pazartesi", "her 30 dakika") become a
+single cron/interval trigger instead of one job per occurrence.
+"""
+import re
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+logger = logging.getLogger(__name__)
+
+TIMEZONE = ZoneInfo("Europe/Istanbul")
+LANGUAGES = ["tr", "en"]
+DATEPARSER_SETTINGS = {
+    "PREFER_DATES_FROM": "future",
+    "TIMEZONE": "Europe/Istanbul",
+    "RETURN_AS_TIMEZONE_AWARE": True,
+}
+
+
+class InvalidTime(ValueError):
+    """A clock time was given but doesn't exist ('25:00', 'saat 24')."""
+
+
+@dataclass
+class ParsedReminder:
+    when: datetime  # first (or only) run
+    message: str
+    matched: str
+    source: str  # "rule" or "dateparser"
+    recurrence: Optional[Tuple[str, Dict[str, Any]]] = None  # ("cron" | "interval", trigger fields)
+
+    def trigger(self):
+        """The APScheduler trigger: DateTrigger for one-shots, cron/interval for 'her ...'."""
+        return build_trigger(self.recurrence) if self.recurrence else DateTrigger(run_date=self.when)
+
+
+# --- Vocabulary -------------------------------------------------------------
+
+UNITS = {
+    "saniye": "seconds", "sn": "seconds", "s": "seconds", "sec": "seconds", "second": "seconds", "seconds": "seconds",
+    "dakika": "minutes", "dk": "minutes", "dak": "minutes", "min": "minutes", "mins": "minutes",
+    "minute": "minutes", "minutes": "minutes",
+    "saat": "hours", "sa": "hours", "h": "hours", "hour": "hours", "hours": "hours",
+    "gün": "days", "gun": "days", "day": "days", "days": "days",
+    "hafta": "weeks", "week": "weeks", "weeks": "weeks",
+}
+RELATIVE_AFTER = {"sonra", "later", "icinde", "içinde"}
+RELATIVE_BEFORE = {"in"}
+NUMBER_WORDS = {
+    "bir": 1, "iki": 2, "üç": 3, "uc": 3, "dört": 4, "dort": 4, "beş": 5, "bes": 5,
+    "on": 10, "yirmi": 20, "otuz": 30, "kırk": 40, "elli": 50,
+    "yarım": 0.5, "yarim": 0.5, "a": 1, "an": 1, "one": 1, "half": 0.5,
+}
+DAY_OFFSETS = {
+    "bugün": 0, "bugun": 0, "today": 0,
+    "yarın": 1, "yarin": 1, "tomorrow": 1,
+    "öbürgün": 2, "obürgün": 2,
+}
+WEEKDAYS = {
+    "pazartesi": 0, "salı": 1, "sali": 1, "çarşamba": 2, "carsamba": 2,
+    "perşembe": 3, "persembe": 3, "cuma": 4, "cumartesi": 5, "pazar": 6,
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+}
+PERIODS = {  # hour offset applied to 1-11 o'clock
+    "sabah": 0, "morning": 0, "am": 0,
+    "öğlen": 12, "oglen": 12, "öğleden": 12, "akşam": 12, "aksam": 12, "gece": 12,
+    "evening": 12, "tonight": 12, "night": 12, "pm": 12,
+}
+NIGHT = {"gece", "night"}  # 'gece 11' is 23:00 but 'gece 2' is 02:00 and 'gece 12' midnight
+FILLERS = {"saat", "at", "sonra", "günü", "gunu"}  # "öğleden sonra", "saat 14", "cuma günü"
+RECURRING = {"her", "every"}
+DAILY = {"gün", "gun", "day", "sabah", "akşam", "aksam", "gece", "morning", "evening", "night"}
+WEEKDAYS_ONLY = {"hafta içi", "weekday", "weekdays"}  # "her hafta içi 09:00"
+DEFAULT_HOUR = {  # "her sabah", "yarın akşam"
+    "sabah": 9, "morning": 9, "akşam": 20, "aksam": 20, "evening": 20, "gece": 23, "night": 23,
+}
+CRON_DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+NUMBER_UNIT_RE = re.compile(r"^(\d+(?:[.,]\d+)?)([a-zçğıöşü]+)$")
+CLOCK_RE = re.compile(r"^(\d{1,2})(?:[:.](\d{2}))?(am|pm)?$")
+# Turkish case suffixes after a time or day: 14:00'te, 9'da, yarın'a, "14:00te"
+SUFFIX_RE = re.compile(r"['’]?(?:te|ta|de|da|e|a|ye|ya|den|dan|ten|tan)$")
+
+
+def _norm(token: str) -> str:
+    return token.replace("I", "ı").replace("İ", "i").lower().strip(",;")
+
+
+def _strip_suffix(token: str) -> str:
+    if "'" in token or "’" in token:
+        return re.split(r"['’]", token, 1)[0]
+    return SUFFIX_RE.sub("", token) if token[:1].isdigit() else token
+
+
+def _number(token: str) -> Optional[float]:
+    if token in NUMBER_WORDS:
+        return NUMBER_WORDS[token]
+    try:
+        return float(token.replace(",", "."))
+    except ValueError:
+        return None
+
+
+# --- Rule-based fast path ---------------------------------------------------
+
+def _match_relative(tokens: List[str], now: datetime) -> Optional[Tuple[datetime, int]]:
+    """'10 dakika sonra', '1 saat 30 dk sonra', '10dk sonra', 'in 2 hours', '5 minutes later'."""
+    i = 0
+    leading = tokens and tokens[0] in RELATIVE_BEFORE
+    if leading:
+        i = 1
+    delta = timedelta()
+    pairs = 0
+    while i < len(tokens):
+        attached = NUMBER_UNIT_RE.match(tokens[i])
+        if attached and attached.group(2) in UNITS:
+            value, unit = _number(attached.group(1)), UNITS[attached.group(2)]
+            step = 1
+        elif i + 1 < len(tokens) and _number(tokens[i]) is not None and _strip_suffix(tokens[i + 1]) in UNITS:
+            value, unit = _number(tokens[i]), UNITS[_strip_suffix(tokens[i + 1])]
+            step = 2
+        else:
+            break
+        delta += timedelta(**{unit: value})
+        pairs += 1
+        i += step
+        if i < len(tokens) and tokens[i] in ("ve", "and"):
+            i += 1
+
+    if not pairs:
+        return None
+    if i < len(tokens) and tokens[i] in RELATIVE_AFTER:
+        i += 1
+    elif not leading:
+        return None
+    when = now + delta
+    if delta.days and not delta.seconds and not delta.microseconds:
+        # '2 gün sonra saat 10', 'in 3 days at 9am': the day from the offset, the time from the clock
+        clock, i = _match_time_of_day(tokens, i)
+        if clock is not None:
+            when = when.replace(hour=clock[0], minute=clock[1], second=0, microsecond=0)
+    return when, i
+
+
+def _apply_period(hour: int, period: str) -> int:
+    """24-hour value of `hour` said with a period word: 'akşam 8' 20, 'gece 2' 2, '12am' 0."""
+    if period in NIGHT:
+        return 0 if hour == 12 else hour + 12 if 6 <= hour < 12 else hour
+    if period == "am" and hour == 12:
+        return 0
+    return hour + PERIODS[period] if hour < 12 else hour
+
+
+def _match_clock(tokens: List[str], i: int, bare_hour: bool = False) -> Tuple[Optional[Tuple[int, int]], int]:
+    """Optional period word, 'saat', and HH[:MM] (or 10am, 10 pm) starting at tokens[i].
+
+    A lone number needs 'saat' or a period word before it, unless bare_hour
+    (right after 'her hafta içi' / 'her pazartesi', where it can only be the hour).
+    Raises InvalidTime for an out-of-range time that can only be a clock time
+    ('25:00', 'saat 25', '13am'); '25.12' is left to dateparser, it may be a date.
+    """
+    period = None
+    start = i
+    while i < len(tokens) and (tokens[i] in PERIODS or tokens[i] in FILLERS):
+        if tokens[i] in PERIODS:
+            period = tokens[i]
+        i += 1
+    if i < len(tokens):
+        m = CLOCK_RE.match(_strip_suffix(tokens[i]))
+        if m:
+            hour, minute, suffix = int(m.group(1)), int(m.group(2) or 0), m.group(3)
+            if suffix is None and i + 1 < len(tokens) and tokens[i + 1] in ("am", "pm"):
+                suffix = tokens[i + 1]
+                i += 1
+            # A bare number only counts as a time after 'saat'/a period word, "3 elma" isn't 03:00
+            if m.group(2) is None and suffix is None and i == start and not bare_hour:
+                return None, start
+            explicit = ":" in tokens[i] or suffix is not None or i > start
+            i += 1
+            period = suffix or period
+            if hour < 24 and minute < 60 and (suffix is None or 1 <= hour <= 12):
+                return (_apply_period(hour, period) if period else hour, minute), i
+            if explicit:
+                raise InvalidTime(" ".join(tokens[start:i]))
+    return None, start
+
+
+def _match_time_of_day(tokens: List[str], i: int) -> Tuple[Optional[Tuple[int, int]], int]:
+    """A clock time, or a period word alone after a day ('yarın sabah' 09:00, 'cuma akşam' 20:00)."""
+    clock, i = _match_clock(tokens, i)
+    if clock is None and i < len(tokens) and tokens[i] in DEFAULT_HOUR:
+        return (DEFAULT_HOUR[tokens[i]], 0), i + 1
+    return clock, i
+
+
+def _match_absolute(tokens: List[str], now: datetime) -> Optional[Tuple[datetime, int]]:
+    """'yarın 14:00', 'bugün saat 18', 'pazartesi 09:30', 'akşam 8', '14:00'."""
+    i = 0
+    day_offset = None
+    weekday = None
+    if tokens:
+        first = _strip_suffix(tokens[0]) if "'" in tokens[0] else tokens[0]
+        if first in DAY_OFFSETS:
+            day_offset = DAY_OFFSETS[first]
+            i = 1
+        elif first in WEEKDAYS:
+            weekday = WEEKDAYS[first]
+            i = 1
+        elif first in ("next", "gelecek", "önümüzdeki") and len(tokens) > 1 and tokens[1] in WEEKDAYS:
+            weekday = WEEKDAYS[tokens[1]]
+            i = 2
+
+    if day_offset is None and weekday is None:
+        clock, i = _match_clock(tokens, i)
+        if clock is None:
+            return None
+    else:
+        clock, i = _match_time_of_day(tokens, i)
+
+    base = now
+    if weekday is not None:
+        days = (weekday - now.weekday()) % 7 or 7
+        base = now + timedelta(days=days)
+    elif day_offset is not None:
+        base = now + timedelta(days=day_offset)
+
+    if clock is None:
+        # "yarın" / "pazartesi" alone: same time of day, like dateparser
+        return base, i
+
+    when = base.replace(hour=clock[0], minute=clock[1], second=0, microsecond=0)
+    if day_offset is None and weekday is None and when <= now:
+        when += timedelta(days=1)  # "14:00" after 14:00 means tomorrow
+    return when, i
+
+
+def _match_interval(tokens: List[str], i: int) -> Optional[Tuple[Dict[str, float], int]]:
+    """'30 dakika', '2 saatte bir', 'saat' (= 1 hour), '15 minutes' after 'her'/'every'."""
+    value = 1.0
+    if i < len(tokens) and _number(tokens[i]) is not None and tokens[i] not in ("a", "an"):
+        value = _number(tokens[i])
+        i += 1
+    if i >= len(tokens):
+        return None
+    unit = tokens[i]
+    if unit not in UNITS:
+        unit = re.sub(r"(?:da|de|ta|te)$", "", unit)  # "dakikada", "saatte"
+    if unit not in UNITS or UNITS[unit] == "seconds" or value <= 0:
+        return None
+    i += 1
+    if i < len(tokens) and tokens[i] == "bir":  # "2 saatte bir"
+        i += 1
+    return {UNITS[unit]: value}, i
+
+
+def parse_recurring(tokens: List[str], now: datetime) -> Optional[Tuple[Tuple[str, Dict[str, Any]], int]]:
+    """'her gün 09:00', 'her pazartesi ve perşembe 18:30', 'her hafta içi 8', 'her 2 saatte bir'.
+
+    Returns ((trigger type, trigger fields), tokens consumed). Day forms without a
+    time default to 09:00 ("her sabah"), 20:00 ("her akşam") or 23:00 ("her gece").
+    """
+    if not tokens:
+        return None
+    if tokens[0] in ("hergün", "hergun"):
+        tokens = ["her", "gün"] + tokens[1:]
+        shift = -1
+    elif tokens[0] in RECURRING:
+        shift = 0
+    else:
+        return None
+
+    i = 1
+    days = None
+    default_hour = 9
+    if i < len(tokens) and " ".join(tokens[i:i + 2]) in WEEKDAYS_ONLY:
+        days, i = "mon-fri", i + 2
+    elif i < len(tokens) and tokens[i] in WEEKDAYS_ONLY:
+        days, i = "mon-fri", i + 1
+    elif i < len(tokens) and (tokens[i] in WEEKDAYS or tokens[i] in ("hafta", "week")):
+        if tokens[i] in ("hafta", "week"):
+            i += 1  # "her hafta pazartesi"; "her hafta" alone repeats today's weekday
+        picked = []
+        while i < len(tokens) and tokens[i] in WEEKDAYS:
+            picked.append(WEEKDAYS[tokens[i]])
+            i += 1
+            if i + 1 < len(tokens) and tokens[i] in ("ve", "and") and tokens[i + 1] in WEEKDAYS:
+                i += 1
+        days = ",".join(CRON_DAYS[d] for d in sorted(set(picked or [now.weekday()])))
+    elif i < len(tokens) and tokens[i] in DAILY:
+        default_hour = DEFAULT_HOUR.get(tokens[i], 9)
+        if tokens[i] in ("gün", "gun", "day"):
+            i += 1  # keep "sabah"/"akşam" for _match_clock, it sets the period
+    else:
+        interval = _match_interval(tokens, i)
+        if interval is None:
+            return None
+        fields, i = interval
+        return ("interval", fields), i + shift
+
+    clock, i = _match_clock(tokens, i, bare_hour=days is not None)
+    if clock is None:
+        # "her sabah", "her pazartesi": no time given
+        while i < len(tokens) and tokens[i] in DAILY | FILLERS:
+            i += 1
+        clock = (default_hour, 0)
+    fields = {"hour": clock[0], "minute": clock[1]}
+    if days:
+        fields["day_of_week"] = days
+    return ("cron", fields), i + shift
+
+
+def build_trigger(recurrence: Tuple[str, Dict[str, Any]]):
+    kind, fields = recurrence
+    if kind == "interval":
+        return IntervalTrigger(timezone=TIMEZONE, **fields)
+    return CronTrigger(timezone=TIMEZONE, **fields)
+
+
+def parse_rules(tokens: List[str], now: datetime) -> Optional[Tuple[datetime, int]]:
+    """Fast path over already-normalized tokens. Returns (when, tokens consumed)."""
+    return _match_relative(tokens, now) or _match_absolute(tokens, now)
+
+
+# --- dateparser fallback ----------------------------------------------------
+
+_searcher = None
+_settings = None
+
+
+def get_searcher():
+    """The shared dateparser searcher and its settings, built on first use."""
+    global _searcher, _settings
+    if _searcher is None:
+        from dateparser.conf import settings as default_settings
+        from dateparser.search.search import DateSearchWithDetection
+        # A Settings object (not a dict) skips dateparser's per-call settings rebuild
+        _settings = default_settings.replace(mod_settings=DATEPARSER_SETTINGS, **DATEPARSER_SETTINGS)
+        _searcher = DateSearchWithDetection()
+    return _searcher, _settings
+
+
+def parse_dateparser(text: str) -> Optional[Tuple[datetime, str]]:
+    searcher, settings = get_searcher()
+    matches = searcher.search_dates(text, languages=LANGUAGES, settings=settings).get("Dates")
+    if not matches:
+        return None
+    found_text, found_date = matches[0][0], matches[0][1]
+    if found_date.tzinfo is None:
+        found_date = found_date.replace(tzinfo=TIMEZONE)
+    return found_date.astimezone(TIMEZONE), found_text
+
+
+# --- Entry point --------------------------------------------------------------
+
+def _clean_message(message: str) -> str:
+    message = message.strip()
+    if message.startswith("-") or message.startswith(":"):
+        message = message[1:].strip()
+    return message or "Hatırlatma"  # Default message
+
+
+def parse_reminder(text: str, now: Optional[datetime] = None) -> Optional[ParsedReminder]:
+    """Splits '/hatirlat' text into a future datetime and the reminder message."""
+    now = now or datetime.now(TIMEZONE)
+    raw = text.split()
+    if not raw:
+        return None
+    tokens = [_norm(t) for t in raw]
+
+    try:
+        recurring = parse_recurring(tokens, now)
+        ruled = None if recurring else parse_rules(tokens, now)
+    except InvalidTime as e:
+        logger.info(f"Invalid time in reminder: {e}")
+        return None  # a time was given but doesn't exist: don't guess another one
+    if recurring:
+        recurrence, used = recurring
+        when = build_trigger(recurrence).get_next_fire_time(None, now)
+        return ParsedReminder(when, _clean_message(" ".join(raw[used:])), " ".join(raw[:used]), "rule", recurrence)
+
+    if ruled:
+        when, used = ruled
+        if when > now:
+            return ParsedReminder(when, _clean_message(" ".join(raw[used:])), " ".join(raw[:used]), "rule")
+
+    found = parse_dateparser(text)
+    if not found:
+        return None
+    when, found_text = found
+    if when < now:
+        when += timedelta(days=1)  # "10:00" said at 11:00 means tomorrow
+    return ParsedReminder(when, _clean_message(text.replace(found_text, "", 1)), found_text, "dateparser")
@@ -0,0 +1,78 @@
+"""
+update_processor.py - Concurrent update processing with per-chat ordering.
+
+PTB's SimpleUpdateProcessor runs updates concurrently but in no particular
+order, so two messages from the same chat can be handled out of order (e.g. a
+/hatirlat racing the AI turn before it). ChatOrderedProcessor runs updates of
+different chats in parallel while each chat's updates run strictly one after
+another, in arrival order.
+
+The global limit is applied *after* an update has its chat's turn: updates
+queued behind their own chat don't hold one of the `max_concurrent_updates`
+handler slots, so one busy chat can't stall everyone else.
+"""
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def chat_key(update: object) -> Optional[int]:
+    """Ordering key of an update: its chat, or its user for chat-less updates (inline queries)."""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+    return None
+
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    """Parallel across chats, sequential within a chat, at most max_concurrent_updates handlers."""
+
+    def __init__(self, max_concurrent_updates: int = 32, max_pending_updates: int = 1024):
+        # The base semaphore bounds updates in the processor, including ones waiting for their chat
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.max_running = max_concurrent_updates
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_pending: Dict[int, int] = {}
+
+    @property
+    def running(self) -> int:
+        return self.max_running - self._running._value
+
+    @property
+    def waiting_chats(self) -> int:
+        return sum(1 for count in self._chat_pending.values() if count > 1)
+
+    def stats(self) -> Dict[str, float]:
+        return {"running": self.running, "chats": len(self._chat_locks), "waiting_chats": self.waiting_chats}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = chat_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        # asyncio.Lock wakes waiters FIFO, and updates reach this point in arrival order
+        lock = self._chat_locks.setdefault(key, asyncio.Lock())
+        self._chat_pending[key] = self._chat_pending.get(key, 0) + 1
+        try:
+            async with lock:
+                async with self._running:
+                    await coroutine
+        finally:
+            self._chat_pending[key] -= 1
+            if not self._chat_pending[key]:
+                # Last update of this chat for now: drop its lock so idle chats cost nothing
+                del self._chat_pending[key]
+                del self._chat_locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass